@@ -1,20 +1,10 @@
 #!/usr/bin/env python3
 from aws_cdk import core
-from bootcamp_data_platform.data_lake import DataLake
-from bootcamp_data_platform.ingestion import RawIngestion
-from bootcamp_data_platform.warehouse import DataWarehouse
-from common import Common, Environment
-from transform import EMRTransform
-from catalog import GlueCatalog
+from stacks import DataPlatform, requested_stacks
 import os
 
-environment = Environment[os.environ['ENVIRONMENT']]
+environment = os.environ['ENVIRONMENT'].lower()
 
 app = core.App()
-common = Common(app, environment=environment)
-data_lake = DataLake(app, environment=environment)
-raw_ingestion = RawIngestion(app, data_lake=data_lake, common=common)
-glue_catalog = GlueCatalog(app, data_lake=data_lake)
-emr_transform = EMRTransform(app, data_lake=data_lake, common=common)
-data_warehouse = DataWarehouse(app, data_lake=data_lake, common=common)
+DataPlatform(app, environment).build(requested_stacks(app, environment))
 app.synth()
@@ -1,48 +1,204 @@
+import json
+
 from aws_cdk import core
-from data_lake import DataLake
+from data_lake import DataLake, DataLakeBucket
+from ingestion_settings import FIREHOSE_SETTINGS, FirehoseSettings
+from schemas import ATOMIC_EVENTS, CURATED_SCHEMAS, ORDERS, ORDERS_CDC, PROCESSED_ATOMIC_EVENTS, Field, Schema
 from aws_cdk import (
-    aws_glue as glue
+    aws_glue as glue,
+    aws_iam as iam,
+    aws_lambda as lambda_,
+    custom_resources as cr
 )
 
 
+def glue_columns(fields):
+    return [glue.Column(name=field.name, type=glue.Type(input_string=field.type, is_primitive=True)) for field in fields]
+
+
+class DataLakeTable(glue.Table):
+
+    def __init__(self, scope: core.Construct, schema: Schema, database: glue.Database, bucket: DataLakeBucket,
+                 s3_prefix: str, description: str, **kwargs) -> None:
+        super().__init__(
+            scope,
+            f'{bucket.environment.value}-{bucket.layer.value}-{schema.name}-table',
+            table_name=schema.name,
+            description=f'{description}, schema v{schema.version}',
+            database=database,
+            data_format=glue.DataFormat.PARQUET,
+            s3_prefix=s3_prefix,
+            bucket=bucket,
+            columns=glue_columns(schema.fields),
+            partition_keys=glue_columns(schema.partition_keys),
+            **kwargs
+        )
+
+        # Partition projection lets Athena compute partitions from the table properties instead of listing them.
+        # Spark on EMR and Redshift Spectrum ignore it and read the partitions the jobs register as they write.
+        # Parameter names contain dots, so they are merged as one object rather than overridden one by one.
+        if schema.projection:
+            self.node.default_child.add_property_override('TableInput.Parameters', schema.projection_parameters())
+
+
 class GlueCatalog(core.Stack):
 
-    def __init__(self, scope: core.Construct, data_lake: DataLake, **kwargs) -> None:
+    def __init__(self, scope: core.Construct, data_lake: DataLake, firehose_settings: FirehoseSettings = None,
+                 **kwargs) -> None:
         self.env = data_lake.env.value
         super().__init__(scope, id=f'{self.env}-glue-catalog', **kwargs)
+        firehose_settings = firehose_settings or FIREHOSE_SETTINGS[data_lake.env]
 
-        self.atomic_events_crawler = glue.CfnCrawler(
-            self,
-            f'{self.env}-atomic-events-crawler',
-            name=f'{self.env}-atomic-events-crawler',
-            description='Crawler to detect schema of data sored in data lake raw, atomic events',
-            schedule=glue.CfnCrawler.ScheduleProperty(schedule_expression='cron(0/15 * * * ? *)'),
-            role=data_lake.data_lake_role.role_arn,
-            targets=glue.CfnCrawler.TargetsProperty(
-                s3_targets=[
-                    glue.CfnCrawler.S3TargetProperty(
-                        path=f's3://{data_lake.data_lake_raw_bucket.bucket_name}/atomic_events')
-                ]
-            ),
-            database_name=data_lake.data_lake_raw_database.database_name
+        self.atomic_events_table = glue.Table(
+            self,
+            f'{self.env}-atomic-events-table',
+            table_name=ATOMIC_EVENTS.name,
+            description=f'atomic events delivered by Firehose, schema v{ATOMIC_EVENTS.version}',
+            database=data_lake.data_lake_raw_database,
+            compressed=not firehose_settings.parquet_conversion,
+            data_format=glue.DataFormat.PARQUET if firehose_settings.parquet_conversion else glue.DataFormat.JSON,
+            s3_prefix='atomic_events',
+            bucket=data_lake.data_lake_raw_bucket,
+            columns=glue_columns(ATOMIC_EVENTS.fields),
+            partition_keys=glue_columns(
+                ATOMIC_EVENTS.partition_keys + [Field(key, 'string') for key in firehose_settings.partition_keys or {}]
+            )
         )
 
         self.orders_table = glue.Table(
             self,
             f'{self.env}-orders-table',
-            table_name='orders',
+            table_name=ORDERS_CDC.name,
             description='orders captured from Postgres using DMS CDC',
             database=data_lake.data_lake_raw_database,
             compressed=True,
             data_format=glue.DataFormat.PARQUET,
             s3_prefix='orders/public/orders',
             bucket=data_lake.data_lake_raw_bucket,
-            columns=[
-                glue.Column(name='op', type=glue.Type(input_string='string', is_primitive=True)),
-                glue.Column(name='extracted_at', type=glue.Type(input_string='string', is_primitive=True)),
-                glue.Column(name='created_at', type=glue.Type(input_string='timestamp', is_primitive=True)),
-                glue.Column(name='order_id', type=glue.Type(input_string='int', is_primitive=True)),
-                glue.Column(name='product_name', type=glue.Type(input_string='string', is_primitive=True)),
-                glue.Column(name='value', type=glue.Type(input_string='double', is_primitive=True))
-            ]
+            columns=glue_columns(ORDERS_CDC.fields)
+        )
+
+        self.processed_atomic_events_table = DataLakeTable(
+            self,
+            schema=PROCESSED_ATOMIC_EVENTS,
+            database=data_lake.data_lake_processed_database,
+            bucket=data_lake.data_lake_processed_bucket,
+            s3_prefix='atomic_events',
+            description='atomic events converted to parquet by convert_to_parquet.py'
+        )
+
+        self.processed_orders_table = DataLakeTable(
+            self,
+            schema=ORDERS,
+            database=data_lake.data_lake_processed_database,
+            bucket=data_lake.data_lake_processed_bucket,
+            s3_prefix='orders',
+            description='current state of orders merged from DMS changes by merge_orders_cdc.py'
+        )
+
+        self.curated_tables = {
+            schema.name: DataLakeTable(
+                self,
+                schema=schema,
+                database=data_lake.data_lake_curated_database,
+                bucket=data_lake.data_lake_curated_bucket,
+                s3_prefix=schema.name,
+                description=f'{schema.name.replace("_", " ")} rollup'
+            ) for schema in CURATED_SCHEMAS
+        }
+
+        self.partition_registrar = PartitionRegistrar(
+            self,
+            data_lake=data_lake,
+            tables={'atomic_events': self.atomic_events_table}
+        )
+
+
+class PartitionRegistrar(core.Construct):
+
+    def __init__(self, scope: core.Construct, data_lake: DataLake, tables: dict, **kwargs) -> None:
+        self.env = data_lake.env.value
+        super().__init__(scope, f'{self.env}-partition-registrar', **kwargs)
+        bucket = data_lake.data_lake_raw_bucket
+        stack = core.Stack.of(self)
+
+        self.function = lambda_.Function(
+            self,
+            f'{self.env}-partition-registrar-function',
+            function_name=f'{self.env}-raw-partition-registrar',
+            description='Registers new partitions of data lake raw tables as objects are created',
+            runtime=lambda_.Runtime.PYTHON_3_8,
+            code=lambda_.Code.from_asset('lambdas/partition_registrar'),
+            handler='partition_registrar.handler',
+            timeout=core.Duration.seconds(60),
+            memory_size=256,
+            environment={
+                'TABLES': json.dumps({
+                    prefix: [table.database.database_name, table.table_name] for prefix, table in tables.items()
+                })
+            }
+        )
+
+        self.function.add_to_role_policy(
+            iam.PolicyStatement(
+                actions=[
+                    'glue:GetTable',
+                    'glue:BatchGetPartition',
+                    'glue:BatchCreatePartition'
+                ],
+                resources=[
+                    f'arn:aws:glue:{stack.region}:{stack.account}:catalog',
+                    data_lake.data_lake_raw_database.database_arn
+                ] + [table.table_arn for table in tables.values()]
+            )
+        )
+
+        self.permission = lambda_.CfnPermission(
+            self,
+            f'{self.env}-partition-registrar-s3-permission',
+            action='lambda:InvokeFunction',
+            function_name=self.function.function_arn,
+            principal='s3.amazonaws.com',
+            source_account=stack.account,
+            source_arn=bucket.bucket_arn
+        )
+
+        # The notification is set from this stack, an event notification on the bucket itself would make the
+        # data lake stack depend on this one. The bucket may hold other notifications, so they are merged rather
+        # than put, which would replace them.
+        self.notifications_function = lambda_.Function(
+            self,
+            f'{self.env}-raw-bucket-notifications-function',
+            description='Merges the partition registrar notifications into the raw bucket notifications',
+            runtime=lambda_.Runtime.PYTHON_3_8,
+            code=lambda_.Code.from_asset('lambdas/bucket_notifications'),
+            handler='bucket_notifications.handler',
+            timeout=core.Duration.seconds(60)
+        )
+        self.notifications_function.add_to_role_policy(
+            iam.PolicyStatement(
+                actions=['s3:GetBucketNotification', 's3:PutBucketNotification'],
+                resources=[bucket.bucket_arn]
+            )
+        )
+        provider = cr.Provider(
+            self,
+            f'{self.env}-raw-bucket-notifications-provider',
+            on_event_handler=self.notifications_function
+        )
+        self.bucket_notifications = core.CustomResource(
+            self,
+            f'{self.env}-raw-bucket-notifications',
+            service_token=provider.service_token,
+            properties={
+                'Bucket': bucket.bucket_name,
+                'Configurations': [
+                    {
+                        'Events': ['s3:ObjectCreated:*'],
+                        'LambdaFunctionArn': self.function.function_arn,
+                        'Filter': {'Key': {'FilterRules': [{'Name': 'prefix', 'Value': f'{prefix}/'}]}}
+                    } for prefix in tables
+                ]
+            }
         )
+        self.bucket_notifications.node.add_dependency(self.permission)
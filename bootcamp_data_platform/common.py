@@ -1,4 +1,5 @@
 from enum import Enum
+from typing import TYPE_CHECKING
 
 from aws_cdk import core
 from aws_cdk import (
@@ -6,6 +7,9 @@ from aws_cdk import (
     aws_ec2 as ec2
 )
 
+if TYPE_CHECKING:
+    from sizing import SizingProfile
+
 
 class Environment(Enum):
     PRODUCTION = 'production'
@@ -14,8 +18,9 @@ class Environment(Enum):
 
 
 class Common(core.Stack):
-    def __init__(self, scope: core.Construct, environment: Environment, **kwargs) -> None:
+    def __init__(self, scope: core.Construct, environment: Environment, sizing: 'SizingProfile', **kwargs) -> None:
         self.env = environment.value
+        self.sizing = sizing
         super().__init__(scope, id=f'{self.env}-common', **kwargs)
 
         self.custom_vpc = ec2.Vpc(
@@ -58,7 +63,9 @@ class Common(core.Stack):
             f'orders-{self.env}-rds',
             engine=rds.DatabaseInstanceEngine.postgres(version=rds.PostgresEngineVersion.VER_12_4),
             database_name='orders',
-            instance_type=ec2.InstanceType('t3.micro'),
+            instance_type=ec2.InstanceType(self.sizing.rds.instance_type),
+            allocated_storage=self.sizing.rds.allocated_storage_gb,
+            multi_az=self.sizing.rds.multi_az,
             vpc=self.custom_vpc,
             instance_identifier=f'rds-{self.env}-orders-db',
             port=5432,
@@ -6,13 +6,14 @@ from aws_cdk import (
     aws_athena as athena
 )
 from data_lake_core import Layer, S3Defaults
+import naming
 from common import Environment
 
 
 class DataLakeBucket(s3.Bucket):
 
     def __init__(self, scope: core.Construct, environment: Environment, layer: Layer, **kwargs) -> None:
-        name = f's3-belisco-{environment.value}-data-lake-{layer.value}'
+        name = naming.data_lake_bucket(environment.value, layer.value)
         self.environment = environment
         self.layer = layer
 
@@ -38,7 +39,7 @@ class DataLakeDatabase(glue.Database):
         super().__init__(
             scope,
             name,
-            database_name=name.replace("-", "_"),
+            database_name=naming.glue_database(bucket.environment.value, bucket.layer.value),
             location_uri=f's3://{bucket.bucket_name}'
         )
 
@@ -116,7 +117,7 @@ class GlueDataLakeRole(iam.Role):
 class AthenaBucket(s3.Bucket):
 
     def __init__(self, scope: core.Construct, environment: Environment, **kwargs) -> None:
-        name = f's3-belisco-{environment.value}-data-lake-athena-results'
+        name = naming.athena_results_bucket(environment.value)
         self.environment = environment
 
         super().__init__(
@@ -138,7 +139,7 @@ class AthenaBucket(s3.Bucket):
 class AthenaWorkgroup(athena.CfnWorkGroup):
 
     def __init__(self, scope: core.Construct, environment: Environment, bucket: AthenaBucket, **kwargs) -> None:
-        name = f's3-belisco-{environment.value}-data-lake-athena-workgroup'
+        name = naming.athena_workgroup(environment.value)
         self.environment = environment
         self.bucket = bucket
 
@@ -1,5 +1,6 @@
 from aws_cdk import core
 from aws_cdk import (
+    aws_kinesis as kinesis,
     aws_kinesisfirehose as firehose,
     aws_iam as iam,
     aws_dms as dms,
@@ -7,13 +8,19 @@ from aws_cdk import (
 )
 from common import Environment, Common
 from data_lake import DataLake, DataLakeBucket
+from ingestion_settings import FIREHOSE_SETTINGS, STREAM_SETTINGS, FirehoseSettings, StreamSettings
+from schemas import ATOMIC_EVENTS
 import json
+import naming
 
 
 class RawKinesisRole(iam.Role):
 
-    def __init__(self, scope: core.Construct, environment: str, raw_bucket: DataLakeBucket, **kwargs) -> None:
+    def __init__(self, scope: core.Construct, environment: str, raw_bucket: DataLakeBucket, raw_database: str = None,
+                 source_stream: kinesis.Stream = None, **kwargs) -> None:
         self.environment = environment
+        self.raw_database = raw_database
+        self.source_stream = source_stream
         super().__init__(
             scope,
             id=f'iam-{self.environment}-data-lake-raw-firehose-role',
@@ -45,6 +52,35 @@ class RawKinesisRole(iam.Role):
                 )
             ]
         )
+        if self.raw_database:
+            stack = core.Stack.of(self)
+            policy.add_statements(
+                iam.PolicyStatement(
+                    actions=[
+                        'glue:GetTable',
+                        'glue:GetTableVersion',
+                        'glue:GetTableVersions'
+                    ],
+                    resources=[
+                        f'arn:aws:glue:{stack.region}:{stack.account}:catalog',
+                        f'arn:aws:glue:{stack.region}:{stack.account}:database/{self.raw_database}',
+                        f'arn:aws:glue:{stack.region}:{stack.account}:table/{self.raw_database}/*'
+                    ]
+                )
+            )
+        if self.source_stream:
+            policy.add_statements(
+                iam.PolicyStatement(
+                    actions=[
+                        'kinesis:DescribeStream',
+                        'kinesis:DescribeStreamSummary',
+                        'kinesis:GetShardIterator',
+                        'kinesis:GetRecords',
+                        'kinesis:ListShards'
+                    ],
+                    resources=[self.source_stream.stream_arn]
+                )
+            )
         self.attach_inline_policy(policy)
 
         return policy
@@ -145,10 +181,11 @@ class OrdersDMS(dms.CfnReplicationTask):
         self.instance = dms.CfnReplicationInstance(
             scope,
             f'dms-replication-instance-{common.env}',
-            allocated_storage=100,
+            allocated_storage=common.sizing.dms.allocated_storage_gb,
+            multi_az=common.sizing.dms.multi_az,
             publicly_accessible=False,
             engine_version='3.3.3',
-            replication_instance_class='dms.t2.small',
+            replication_instance_class=common.sizing.dms.instance_class,
             replication_instance_identifier=f'dms-{common.env}-replication-instance',
             vpc_security_group_ids=[
                 self.dms_sg.security_group_id
@@ -187,24 +224,37 @@ class OrdersDMS(dms.CfnReplicationTask):
 
 class RawIngestion(core.Stack):
 
-    def __init__(self, scope: core.Construct, common: Common, data_lake: DataLake, **kwargs) -> None:
+    def __init__(self, scope: core.Construct, common: Common, data_lake: DataLake, settings: FirehoseSettings = None,
+                 stream_settings: StreamSettings = None, **kwargs) -> None:
         self.env = common.env
         super().__init__(scope, id=f'{self.env}-data-lake-raw-ingestion', **kwargs)
-        name = f'firehose-{self.env}-raw-delivery-stream'
+        name = naming.firehose_delivery_stream(self.env)
         raw_bucket = data_lake.data_lake_raw_bucket
+        raw_database = data_lake.data_lake_raw_database.database_name
+        self.settings = (settings or FIREHOSE_SETTINGS[data_lake.env]).validate()
+        self.stream_settings = stream_settings or STREAM_SETTINGS[data_lake.env]
+        self.stream = self.kinesis_stream() if self.stream_settings else None
 
-        kinesis_role = RawKinesisRole(self, environment=common.env, raw_bucket=raw_bucket)
+        kinesis_role = RawKinesisRole(
+            self,
+            environment=common.env,
+            raw_bucket=raw_bucket,
+            raw_database=raw_database if self.settings.parquet_conversion else None,
+            source_stream=self.stream
+        )
 
         s3_config = firehose.CfnDeliveryStream.ExtendedS3DestinationConfigurationProperty(
             bucket_arn=raw_bucket.bucket_arn,
-            compression_format='GZIP',
-            error_output_prefix='bad_records',
-            prefix='atomic_events/year=!{timestamp:yyyy}/'
-                   'month=!{timestamp:MM}/day=!{timestamp:dd}/hour=!{timestamp:HH}/',
+            compression_format='UNCOMPRESSED' if self.settings.parquet_conversion else 'GZIP',
+            error_output_prefix=self.error_output_prefix(),
+            prefix=self.prefix(),
             buffering_hints=firehose.CfnDeliveryStream.BufferingHintsProperty(
-                interval_in_seconds=60,
-                size_in_m_bs=1
+                interval_in_seconds=self.settings.buffering_interval_seconds,
+                size_in_m_bs=self.settings.buffering_size_mb
             ),
+            data_format_conversion_configuration=self.data_format_conversion(
+                raw_database, kinesis_role) if self.settings.parquet_conversion else None,
+            processing_configuration=self.processing_configuration() if self.settings.dynamic_partitioning else None,
             role_arn=kinesis_role.role_arn
         )
 
@@ -212,8 +262,93 @@ class RawIngestion(core.Stack):
             self,
             id=name,
             delivery_stream_name=name,
-            delivery_stream_type='DirectPut',
+            delivery_stream_type='KinesisStreamAsSource' if self.stream else 'DirectPut',
+            kinesis_stream_source_configuration=firehose.CfnDeliveryStream.KinesisStreamSourceConfigurationProperty(
+                kinesis_stream_arn=self.stream.stream_arn,
+                role_arn=kinesis_role.role_arn
+            ) if self.stream else None,
             extended_s3_destination_configuration=s3_config
         )
+        if self.stream:
+            # Firehose checks that it can read the stream when it is created, so the role policy has to exist first.
+            self.atomic_events.node.add_dependency(kinesis_role)
+
+        if self.settings.dynamic_partitioning:
+            self.atomic_events.add_property_override(
+                'ExtendedS3DestinationConfiguration.DynamicPartitioningConfiguration',
+                {'Enabled': True, 'RetryOptions': {'DurationInSeconds': 300}}
+            )
 
         self.dms_replication_task = OrdersDMS(self, common, data_lake)
+
+    def kinesis_stream(self):
+        settings = self.stream_settings.validate()
+        stream = kinesis.Stream(
+            self,
+            id=naming.kinesis_stream(self.env),
+            stream_name=naming.kinesis_stream(self.env),
+            shard_count=settings.shard_count,
+            retention_period=core.Duration.hours(settings.retention_hours),
+            encryption=kinesis.StreamEncryption.MANAGED
+        )
+        if settings.on_demand:
+            # CDK 1.71 has no stream mode, on demand streams scale their shards and reject a shard count.
+            stream.node.default_child.add_property_override('StreamModeDetails', {'StreamMode': 'ON_DEMAND'})
+            stream.node.default_child.add_property_deletion_override('ShardCount')
+        return stream
+
+    def prefix(self):
+        prefix = 'atomic_events/year=!{timestamp:yyyy}/month=!{timestamp:MM}/day=!{timestamp:dd}/hour=!{timestamp:HH}/'
+        for key in self.settings.partition_keys or {}:
+            prefix += f'{key}=!{{partitionKeyFromQuery:{key}}}/'
+        return prefix
+
+    def error_output_prefix(self):
+        if not (self.settings.dynamic_partitioning or self.settings.parquet_conversion):
+            return 'bad_records'
+        return 'bad_records/!{firehose:error-output-type}/' \
+               'year=!{timestamp:yyyy}/month=!{timestamp:MM}/day=!{timestamp:dd}/hour=!{timestamp:HH}/'
+
+    def data_format_conversion(self, raw_database, kinesis_role):
+        return firehose.CfnDeliveryStream.DataFormatConversionConfigurationProperty(
+            enabled=True,
+            input_format_configuration=firehose.CfnDeliveryStream.InputFormatConfigurationProperty(
+                deserializer=firehose.CfnDeliveryStream.DeserializerProperty(
+                    open_x_json_ser_de=firehose.CfnDeliveryStream.OpenXJsonSerDeProperty()
+                )
+            ),
+            output_format_configuration=firehose.CfnDeliveryStream.OutputFormatConfigurationProperty(
+                serializer=firehose.CfnDeliveryStream.SerializerProperty(
+                    parquet_ser_de=firehose.CfnDeliveryStream.ParquetSerDeProperty(compression='SNAPPY')
+                )
+            ),
+            schema_configuration=firehose.CfnDeliveryStream.SchemaConfigurationProperty(
+                catalog_id=self.account,
+                database_name=raw_database,
+                table_name=ATOMIC_EVENTS.name,
+                region=self.region,
+                role_arn=kinesis_role.role_arn,
+                version_id='LATEST'
+            )
+        )
+
+    def processing_configuration(self):
+        query = ','.join(f'{key}:{expression}' for key, expression in self.settings.partition_keys.items())
+        return firehose.CfnDeliveryStream.ProcessingConfigurationProperty(
+            enabled=True,
+            processors=[
+                firehose.CfnDeliveryStream.ProcessorProperty(
+                    type='MetadataExtraction',
+                    parameters=[
+                        firehose.CfnDeliveryStream.ProcessorParameterProperty(
+                            parameter_name='MetadataExtractionQuery',
+                            parameter_value=f'{{{query}}}'
+                        ),
+                        firehose.CfnDeliveryStream.ProcessorParameterProperty(
+                            parameter_name='JsonParsingEngine',
+                            parameter_value='JQ-1.6'
+                        )
+                    ]
+                )
+            ]
+        )
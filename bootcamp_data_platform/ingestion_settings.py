@@ -0,0 +1,57 @@
+from typing import NamedTuple, Optional
+
+from common import Environment
+from schemas import ATOMIC_EVENTS
+
+
+class FirehoseSettings(NamedTuple):
+    buffering_interval_seconds: int = 60
+    buffering_size_mb: int = 1
+    parquet_conversion: bool = False
+    partition_keys: Optional[dict] = None
+
+    @property
+    def dynamic_partitioning(self):
+        return bool(self.partition_keys)
+
+    def validate(self):
+        if not 60 <= self.buffering_interval_seconds <= 900:
+            raise ValueError('buffering_interval_seconds must be between 60 and 900')
+        if not 1 <= self.buffering_size_mb <= 128:
+            raise ValueError('buffering_size_mb must be between 1 and 128')
+        if self.dynamic_partitioning and self.buffering_size_mb < 64:
+            raise ValueError('dynamic partitioning requires buffering_size_mb of at least 64')
+        if self.parquet_conversion and self.buffering_size_mb < 64:
+            raise ValueError('parquet conversion requires buffering_size_mb of at least 64')
+        clashes = set(self.partition_keys or {}) & set(ATOMIC_EVENTS.field_names + ['year', 'month', 'day', 'hour'])
+        if clashes:
+            raise ValueError(f'partition keys {sorted(clashes)} clash with atomic events columns')
+        return self
+
+
+FIREHOSE_SETTINGS = {
+    Environment.DEV: FirehoseSettings(buffering_interval_seconds=60, buffering_size_mb=1),
+    Environment.STAGING: FirehoseSettings(buffering_interval_seconds=300, buffering_size_mb=64),
+    Environment.PRODUCTION: FirehoseSettings(buffering_interval_seconds=900, buffering_size_mb=128),
+}
+
+
+class StreamSettings(NamedTuple):
+    shard_count: int = 1
+    on_demand: bool = False
+    retention_hours: int = 24
+
+    def validate(self):
+        if not self.on_demand and self.shard_count < 1:
+            raise ValueError('shard_count must be at least 1 unless the stream is on demand')
+        if not 24 <= self.retention_hours <= 8760:
+            raise ValueError('retention_hours must be between 24 and 8760')
+        return self
+
+
+# None keeps the Firehose on DirectPut. With a stream, producers must put to the stream instead of the Firehose.
+STREAM_SETTINGS = {
+    Environment.DEV: None,
+    Environment.STAGING: None,
+    Environment.PRODUCTION: None,
+}
@@ -0,0 +1,116 @@
+import json
+import os
+import sys
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+NAMESPACE = 'Belisco/DataPlatform'
+SINKS = ['cloudwatch', 'local', 'none']
+MAX_DATUMS_PER_REQUEST = 20
+
+ROWS = 'Rows'
+BYTES = 'Bytes'
+DURATION = 'DurationSeconds'
+THROUGHPUT = 'RowsPerSecond'
+WATERMARK_LAG = 'WatermarkLagSeconds'
+QUALITY_CHECKS_FAILED = 'QualityChecksFailed'
+DUPLICATE_RATE = 'DuplicateRate'
+
+
+class CloudWatchSink:
+
+    def __init__(self, namespace=NAMESPACE, client=None):
+        import boto3
+        self.namespace = namespace
+        self.client = client or boto3.client('cloudwatch')
+
+    def emit(self, datums):
+        # Partitions only go to the local sink, a dimension per partition would create a metric per hour.
+        metric_data = [{
+            'MetricName': datum['metric'],
+            'Dimensions': [{'Name': name, 'Value': value} for name, value in datum['dimensions'].items()],
+            'Timestamp': datetime.fromisoformat(datum['timestamp']),
+            'Value': datum['value'],
+            'Unit': datum['unit'],
+        } for datum in datums]
+        for start in range(0, len(metric_data), MAX_DATUMS_PER_REQUEST):
+            self.client.put_metric_data(Namespace=self.namespace,
+                                        MetricData=metric_data[start:start + MAX_DATUMS_PER_REQUEST])
+
+
+class LocalSink:
+
+    def __init__(self, path=None):
+        self.path = path
+
+    def emit(self, datums):
+        lines = ''.join(json.dumps(datum, sort_keys=True) + '\n' for datum in datums)
+        if self.path is None:
+            sys.stdout.write(lines)
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with open(self.path, 'a') as file:
+            file.write(lines)
+
+
+class Stage:
+
+    def __init__(self):
+        self.rows = None
+        self.bytes = None
+
+
+class Instrumentation:
+
+    def __init__(self, sink, environment, job):
+        self.sink = sink
+        self.environment = environment
+        self.job = job
+        self.datums = []
+
+    @classmethod
+    def create(cls, sink, environment, job, path=None):
+        if sink == 'cloudwatch':
+            return cls(CloudWatchSink(), environment, job)
+        return cls(LocalSink(path) if sink == 'local' else None, environment, job)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.flush()
+
+    def record(self, metric, value, unit='Count', stage=None, partition=None):
+        dimensions = {'Environment': self.environment, 'Job': self.job}
+        if stage:
+            dimensions['Stage'] = stage
+        datum = {'metric': metric, 'value': float(value), 'unit': unit, 'dimensions': dimensions,
+                 'timestamp': datetime.now(timezone.utc).isoformat()}
+        if partition:
+            datum['partition'] = partition
+        self.datums.append(datum)
+
+    def lag(self, watermark, stage=None, partition=None):
+        if watermark.tzinfo is None:
+            watermark = watermark.replace(tzinfo=timezone.utc)
+        self.record(WATERMARK_LAG, (datetime.now(timezone.utc) - watermark).total_seconds(), 'Seconds', stage,
+                    partition)
+
+    @contextmanager
+    def stage(self, name, partition=None):
+        stage = Stage()
+        started_at = time.monotonic()
+        yield stage
+        seconds = time.monotonic() - started_at
+        self.record(DURATION, seconds, 'Seconds', name, partition)
+        if stage.rows is not None:
+            self.record(ROWS, stage.rows, 'Count', name, partition)
+            self.record(THROUGHPUT, stage.rows / seconds if seconds else 0, 'Count/Second', name, partition)
+        if stage.bytes is not None:
+            self.record(BYTES, stage.bytes, 'Bytes', name, partition)
+
+    def flush(self):
+        if self.sink and self.datums:
+            self.sink.emit(self.datums)
+        self.datums = []
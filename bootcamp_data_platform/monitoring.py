@@ -0,0 +1,165 @@
+from aws_cdk import core
+from aws_cdk import (
+    aws_cloudwatch as cloudwatch,
+    aws_sns as sns
+)
+from common import Common, Environment
+from ingestion import RawIngestion
+from transform import EMRTransform
+from instrumentation import (BYTES, DUPLICATE_RATE, DURATION, NAMESPACE, QUALITY_CHECKS_FAILED, ROWS, THROUGHPUT,
+                             WATERMARK_LAG)
+from typing import NamedTuple
+import naming
+
+
+class MonitoringSettings(NamedTuple):
+    events_lag_minutes: int = 180
+    orders_lag_minutes: int = 180
+    dms_latency_seconds: int = 600
+    stream_iterator_age_seconds: int = 300
+    alarm_on_missing_data: bool = False
+
+
+MONITORING_SETTINGS = {
+    Environment.DEV: MonitoringSettings(events_lag_minutes=720, orders_lag_minutes=720),
+    Environment.STAGING: MonitoringSettings(),
+    Environment.PRODUCTION: MonitoringSettings(events_lag_minutes=120, orders_lag_minutes=120,
+                                               alarm_on_missing_data=True),
+}
+
+JOBS = {
+    'convert_to_parquet': 'convert',
+    'merge_orders_cdc': 'merge',
+    'build_event_rollups': 'rollups',
+    'build_revenue_rollups': 'rollups',
+}
+
+
+class Monitoring(core.Stack):
+
+    def __init__(self, scope: core.Construct, common: Common, raw_ingestion: RawIngestion, emr_transform: EMRTransform,
+                 settings: MonitoringSettings = None, **kwargs) -> None:
+        self.env = common.env
+        super().__init__(scope, id=f'{self.env}-monitoring', **kwargs)
+        self.settings = settings or MONITORING_SETTINGS[Environment(self.env)]
+        delivery_stream = naming.firehose_delivery_stream(self.env)
+        dms_dimensions = {
+            'ReplicationInstanceIdentifier': f'dms-{self.env}-replication-instance',
+            # DMS publishes task metrics under the resource id at the end of the task arn, not under its name.
+            'ReplicationTaskIdentifier': core.Fn.select(6, core.Fn.split(':', raw_ingestion.dms_replication_task.ref))
+        }
+
+        self.alarm_topic = sns.Topic(
+            self,
+            f'{self.env}-data-platform-alarms',
+            topic_name=f'{self.env}-data-platform-alarms'
+        )
+
+        firehose_freshness = self.metric('AWS/Firehose', 'DeliveryToS3.DataFreshness',
+                                         {'DeliveryStreamName': delivery_stream})
+        dms_latency = self.metric('AWS/DMS', 'CDCLatencyTarget', dms_dimensions)
+        events_lag = self.pipeline_metric(WATERMARK_LAG, 'convert_to_parquet', 'convert')
+        orders_lag = self.pipeline_metric(WATERMARK_LAG, 'merge_orders_cdc', 'merge')
+        quality_failures = self.pipeline_metric(QUALITY_CHECKS_FAILED, 'convert_to_parquet', 'convert', 'Sum')
+
+        self.alarms = [
+            self.alarm('firehose-freshness', firehose_freshness,
+                       threshold=2 * raw_ingestion.settings.buffering_interval_seconds + 300,
+                       description='raw events wait too long in Firehose before reaching S3'),
+            self.alarm('dms-latency', dms_latency, threshold=self.settings.dms_latency_seconds,
+                       description='order changes take too long to reach S3 through DMS'),
+            self.alarm('events-lag', events_lag, threshold=self.settings.events_lag_minutes * 60,
+                       description='newest processed atomic event is too old, or convert_to_parquet stopped',
+                       missing_data=True),
+            self.alarm('orders-lag', orders_lag, threshold=self.settings.orders_lag_minutes * 60,
+                       description='newest merged order change is too old, or merge_orders_cdc stopped',
+                       missing_data=True),
+            self.alarm('quality-checks', quality_failures, threshold=0,
+                       description='atomic events failed quality thresholds, see the atomic_events_quality table'),
+        ]
+        if raw_ingestion.stream:
+            # The Firehose and every real-time consumer read the stream, the oldest unread record covers them all.
+            iterator_age = self.stream_metric('GetRecords.IteratorAgeMilliseconds', 'Maximum')
+            self.alarms.append(
+                self.alarm('stream-iterator-age', iterator_age,
+                           threshold=self.settings.stream_iterator_age_seconds * 1000,
+                           description='consumers of the raw atomic events stream fall behind')
+            )
+
+        self.dashboard = cloudwatch.Dashboard(
+            self,
+            f'{self.env}-data-platform-dashboard',
+            dashboard_name=f'{self.env}-data-platform'
+        )
+        self.dashboard.add_widgets(
+            cloudwatch.AlarmStatusWidget(title='Alarms', alarms=self.alarms, width=24, height=3)
+        )
+        self.dashboard.add_widgets(
+            self.graph('Watermark lag (s)', [self.pipeline_metric(WATERMARK_LAG, job, stage)
+                                             for job, stage in JOBS.items()]),
+            self.graph('Ingestion latency (s)', [firehose_freshness, dms_latency,
+                                                 self.metric('AWS/DMS', 'CDCLatencySource', dms_dimensions)]),
+        )
+        self.dashboard.add_widgets(
+            self.graph('Rows per second', [self.pipeline_metric(THROUGHPUT, 'convert_to_parquet', 'convert'),
+                                           self.pipeline_metric(THROUGHPUT, 'merge_orders_cdc', 'merge'),
+                                           self.pipeline_metric(THROUGHPUT, 'put_to_firehose', 'firehose_put')]),
+            self.graph('Stage duration (s)', [self.pipeline_metric(DURATION, 'convert_to_parquet', 'convert'),
+                                              self.pipeline_metric(DURATION, 'merge_orders_cdc', 'merge')]),
+        )
+        self.dashboard.add_widgets(
+            self.graph('Rows and bytes', [self.pipeline_metric(ROWS, 'convert_to_parquet', 'convert', 'Sum'),
+                                          self.pipeline_metric(ROWS, 'merge_orders_cdc', 'merge', 'Sum')],
+                       right=[self.pipeline_metric(BYTES, 'convert_to_parquet', 'convert', 'Sum'),
+                              self.pipeline_metric(BYTES, 'merge_orders_cdc', 'merge', 'Sum')]),
+            self.graph('Data quality', [quality_failures,
+                                        self.pipeline_metric(DUPLICATE_RATE, 'convert_to_parquet', 'convert')]),
+        )
+        self.dashboard.add_widgets(
+            self.graph('EMR', [self.metric('AWS/ElasticMapReduce', name, {'JobFlowId': emr_transform.cluster.ref})
+                               for name in ('AppsPending', 'AppsRunning', 'ContainerPendingRatio')]),
+            self.graph('Firehose records', [self.metric('AWS/Firehose', name, {'DeliveryStreamName': delivery_stream},
+                                                        'Sum')
+                                            for name in ('IncomingRecords', 'DeliveryToS3.Records')]),
+        )
+        if raw_ingestion.stream:
+            self.dashboard.add_widgets(
+                self.graph('Stream records', [self.stream_metric(name) for name in ('IncomingRecords',
+                                                                                     'GetRecords.Records')],
+                           right=[self.stream_metric(name) for name in ('WriteProvisionedThroughputExceeded',
+                                                                        'ReadProvisionedThroughputExceeded')]),
+                self.graph('Stream iterator age (ms)', [iterator_age]),
+            )
+
+    def metric(self, namespace, name, dimensions, statistic='Maximum'):
+        return cloudwatch.Metric(namespace=namespace, metric_name=name, dimensions=dimensions, statistic=statistic,
+                                 period=core.Duration.minutes(5))
+
+    def stream_metric(self, name, statistic='Sum'):
+        return self.metric('AWS/Kinesis', name, {'StreamName': naming.kinesis_stream(self.env)}, statistic)
+
+    def pipeline_metric(self, name, job, stage, statistic='Maximum'):
+        return cloudwatch.Metric(namespace=NAMESPACE, metric_name=name, statistic=statistic,
+                                 dimensions={'Environment': self.env, 'Job': job, 'Stage': stage},
+                                 period=core.Duration.hours(1), label=f'{job} {name}')
+
+    def alarm(self, name, metric, threshold, description, missing_data=False):
+        # Pipeline jobs only publish when they run, so a missing lag datapoint means the job stopped.
+        treat_missing_data = cloudwatch.TreatMissingData.BREACHING \
+            if missing_data and self.settings.alarm_on_missing_data else cloudwatch.TreatMissingData.MISSING
+        alarm = metric.create_alarm(
+            self,
+            f'{self.env}-{name}-alarm',
+            alarm_name=f'{self.env}-data-platform-{name}',
+            alarm_description=description,
+            threshold=threshold,
+            evaluation_periods=1,
+            comparison_operator=cloudwatch.ComparisonOperator.GREATER_THAN_THRESHOLD,
+            treat_missing_data=treat_missing_data
+        )
+        alarm.node.default_child.add_property_override('AlarmActions', [self.alarm_topic.topic_arn])
+        alarm.node.default_child.add_property_override('OKActions', [self.alarm_topic.topic_arn])
+        return alarm
+
+    def graph(self, title, left, right=()):
+        return cloudwatch.GraphWidget(title=title, left=left, right=list(right), width=12, height=6)
@@ -0,0 +1,34 @@
+def data_lake_bucket(environment: str, layer: str) -> str:
+    return f's3-belisco-{environment}-data-lake-{layer}'
+
+
+def data_lake_uri(environment: str, layer: str, *path: str) -> str:
+    return '/'.join([f's3://{data_lake_bucket(environment, layer)}', *path])
+
+
+def glue_database(environment: str, layer: str) -> str:
+    return f'glue-belisco-{environment}-data-lake-{layer}'.replace('-', '_')
+
+
+def athena_results_bucket(environment: str) -> str:
+    return f's3-belisco-{environment}-data-lake-athena-results'
+
+
+def athena_workgroup(environment: str) -> str:
+    return f's3-belisco-{environment}-data-lake-athena-workgroup'
+
+
+def firehose_delivery_stream(environment: str) -> str:
+    return f'firehose-{environment}-raw-delivery-stream'
+
+
+def kinesis_stream(environment: str) -> str:
+    return f'kinesis-{environment}-raw-atomic-events'
+
+
+def emr_cluster(environment: str) -> str:
+    return f'{environment}-emr-cluster'
+
+
+def emr_logs_bucket(environment: str) -> str:
+    return f's3-belisco-{environment}-emr-logs-bucket'
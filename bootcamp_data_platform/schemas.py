@@ -0,0 +1,213 @@
+from collections import namedtuple
+from datetime import datetime
+
+
+class Field(namedtuple('Field', ['name', 'type', 'nullable'])):
+
+    def __new__(cls, name, type, nullable=True):
+        return super().__new__(cls, name, type, nullable)
+
+
+PYTHON_TYPES = {
+    'string': str,
+    'boolean': bool,
+    'int': int,
+    'bigint': int,
+    'double': (int, float),
+    'timestamp': str,
+}
+
+
+class Schema:
+
+    def __init__(self, name, version, fields, partition_keys=(), projection=None):
+        self.name = name
+        self.version = version
+        self.fields = list(fields)
+        self.partition_keys = list(partition_keys)
+        self.projection = projection or {}
+
+    @property
+    def field_names(self):
+        return [field.name for field in self.fields]
+
+    def ddl(self):
+        return ', '.join(f'`{field.name}` {field.type}' for field in self.fields)
+
+    def projection_parameters(self):
+        if not self.projection:
+            return {}
+        parameters = {'projection.enabled': 'true'}
+        for key in self.partition_keys:
+            for name, value in self.projection[key.name].items():
+                parameters[f'projection.{key.name}.{name}'] = value
+        return parameters
+
+    def validate(self, record):
+        errors = []
+        for field in self.fields:
+            value = record.get(field.name)
+            if value is None:
+                if not field.nullable:
+                    errors.append(f'{field.name}: missing required value')
+                continue
+            expected = PYTHON_TYPES[field.type]
+            if not isinstance(value, expected) or (field.type != 'boolean' and isinstance(value, bool)):
+                errors.append(f'{field.name}: expected {field.type}, got {type(value).__name__}')
+            elif field.type == 'timestamp':
+                try:
+                    datetime.fromisoformat(value)
+                except ValueError:
+                    errors.append(f'{field.name}: invalid timestamp {value!r}')
+
+        for name in sorted(set(record) - set(self.field_names)):
+            errors.append(f'{name}: not in {self.name} schema v{self.version}')
+
+        return errors
+
+
+RAW_PARTITION_KEYS = [Field(key, 'string', nullable=False) for key in ['year', 'month', 'day', 'hour']]
+
+ATOMIC_EVENTS = Schema(
+    name='atomic_events',
+    version=1,
+    fields=[
+        Field('event_id', 'string', nullable=False),
+        Field('event_timestamp', 'string', nullable=False),
+        Field('event_type', 'string', nullable=False),
+        Field('page_url', 'string'),
+        Field('page_url_path', 'string'),
+        Field('referer_url', 'string'),
+        Field('referer_url_scheme', 'string'),
+        Field('referer_url_port', 'string'),
+        Field('referer_medium', 'string'),
+        Field('utm_medium', 'string'),
+        Field('utm_source', 'string'),
+        Field('utm_content', 'string'),
+        Field('utm_campaign', 'string'),
+        Field('click_id', 'string'),
+        Field('geo_latitude', 'string'),
+        Field('geo_longitude', 'string'),
+        Field('geo_country', 'string'),
+        Field('geo_timezone', 'string'),
+        Field('geo_region_name', 'string'),
+        Field('ip_address', 'string'),
+        Field('browser_name', 'string'),
+        Field('browser_user_agent', 'string'),
+        Field('browser_language', 'string'),
+        Field('os', 'string'),
+        Field('os_name', 'string'),
+        Field('os_timezone', 'string'),
+        Field('device_type', 'string'),
+        Field('device_is_mobile', 'boolean'),
+        Field('user_custom_id', 'string'),
+        Field('user_domain_id', 'string'),
+    ],
+    partition_keys=RAW_PARTITION_KEYS
+)
+
+ORDERS_CDC = Schema(
+    name='orders',
+    version=1,
+    fields=[
+        Field('op', 'string'),
+        Field('extracted_at', 'string'),
+        Field('created_at', 'timestamp'),
+        Field('order_id', 'int', nullable=False),
+        Field('product_name', 'string'),
+        Field('value', 'double'),
+    ]
+)
+
+DATE_PROJECTION = {'type': 'date', 'range': '2020-01-01,NOW', 'format': 'yyyy-MM-dd', 'interval': '1', 'interval.unit': 'DAYS'}
+
+PROCESSED_ATOMIC_EVENTS = Schema(
+    name='atomic_events',
+    version=1,
+    fields=ATOMIC_EVENTS.fields,
+    partition_keys=[Field('event_date', 'string', nullable=False), Field('event_hour', 'int', nullable=False)],
+    projection={
+        'event_date': DATE_PROJECTION,
+        'event_hour': {'type': 'integer', 'range': '0,23'},
+    }
+)
+
+ORDERS = Schema(
+    name='orders',
+    version=1,
+    fields=ORDERS_CDC.fields,
+    partition_keys=[Field('order_range', 'int', nullable=False)],
+    projection={
+        'order_range': {'type': 'integer', 'range': '0,999'},
+    }
+)
+
+PAGE_VIEWS_HOURLY = Schema(
+    name='page_views_hourly',
+    version=1,
+    fields=[
+        Field('event_hour', 'int', nullable=False),
+        Field('page_url_path', 'string'),
+        Field('device_type', 'string'),
+        Field('page_views', 'bigint', nullable=False),
+        Field('users', 'bigint', nullable=False),
+    ],
+    partition_keys=[Field('event_date', 'string', nullable=False)],
+    projection={'event_date': DATE_PROJECTION}
+)
+
+SESSIONS_DAILY = Schema(
+    name='sessions_daily',
+    version=1,
+    fields=[
+        Field('device_type', 'string'),
+        Field('utm_source', 'string'),
+        Field('sessions', 'bigint', nullable=False),
+        Field('users', 'bigint', nullable=False),
+        Field('bounces', 'bigint', nullable=False),
+        Field('page_views', 'bigint', nullable=False),
+        Field('session_seconds', 'double', nullable=False),
+    ],
+    partition_keys=[Field('event_date', 'string', nullable=False)],
+    projection={'event_date': DATE_PROJECTION}
+)
+
+FUNNEL_DAILY = Schema(
+    name='funnel_daily',
+    version=1,
+    fields=[
+        Field('step_order', 'int', nullable=False),
+        Field('step', 'string', nullable=False),
+        Field('users', 'bigint', nullable=False),
+    ],
+    partition_keys=[Field('event_date', 'string', nullable=False)],
+    projection={'event_date': DATE_PROJECTION}
+)
+
+REVENUE_BY_PRODUCT_DAILY = Schema(
+    name='revenue_by_product_daily',
+    version=1,
+    fields=[
+        Field('product_name', 'string'),
+        Field('orders', 'bigint', nullable=False),
+        Field('revenue', 'double', nullable=False),
+    ],
+    partition_keys=[Field('order_date', 'string', nullable=False)],
+    projection={'order_date': DATE_PROJECTION}
+)
+
+ATOMIC_EVENTS_QUALITY = Schema(
+    name='atomic_events_quality',
+    version=1,
+    fields=[
+        Field('metric', 'string', nullable=False),
+        Field('value', 'double'),
+        Field('threshold', 'double'),
+        Field('passed', 'boolean', nullable=False),
+        Field('checked_at', 'timestamp', nullable=False),
+    ],
+    partition_keys=PROCESSED_ATOMIC_EVENTS.partition_keys,
+    projection=PROCESSED_ATOMIC_EVENTS.projection
+)
+
+CURATED_SCHEMAS = [PAGE_VIEWS_HOURLY, SESSIONS_DAILY, FUNNEL_DAILY, REVENUE_BY_PRODUCT_DAILY, ATOMIC_EVENTS_QUALITY]
@@ -0,0 +1,94 @@
+from typing import Dict, NamedTuple, Optional
+
+from common import Environment
+
+
+class RdsSizing(NamedTuple):
+    instance_type: str
+    allocated_storage_gb: int = 100
+    multi_az: bool = False
+
+
+class DmsSizing(NamedTuple):
+    instance_class: str
+    allocated_storage_gb: int = 50
+    multi_az: bool = False
+
+
+class EmrInstanceFleet(NamedTuple):
+    instance_types: Dict[str, int]
+    on_demand_capacity: int = 0
+    spot_capacity: int = 0
+
+
+class EmrManagedScaling(NamedTuple):
+    minimum_capacity_units: int
+    maximum_capacity_units: int
+    maximum_on_demand_capacity_units: int
+    maximum_core_capacity_units: int
+
+
+class EmrSizing(NamedTuple):
+    master: EmrInstanceFleet
+    core: EmrInstanceFleet
+    task: Optional[EmrInstanceFleet] = None
+    scaling: Optional[EmrManagedScaling] = None
+    step_concurrency_level: int = 1
+
+
+class RedshiftSizing(NamedTuple):
+    node_type: str
+    number_of_nodes: int
+
+
+class SizingProfile(NamedTuple):
+    rds: RdsSizing
+    dms: DmsSizing
+    emr: EmrSizing
+    redshift: RedshiftSizing
+
+    @classmethod
+    def for_environment(cls, environment: Environment) -> 'SizingProfile':
+        return SIZING_PROFILES[environment]
+
+
+SIZING_PROFILES = {
+    Environment.DEV: SizingProfile(
+        rds=RdsSizing(instance_type='t3.micro'),
+        dms=DmsSizing(instance_class='dms.t2.small', allocated_storage_gb=100),
+        emr=EmrSizing(
+            master=EmrInstanceFleet(instance_types={'m4.large': 1}, on_demand_capacity=1),
+            core=EmrInstanceFleet(instance_types={'m4.large': 1}, on_demand_capacity=2)
+        ),
+        redshift=RedshiftSizing(node_type='DC2_LARGE', number_of_nodes=2)
+    ),
+    Environment.STAGING: SizingProfile(
+        rds=RdsSizing(instance_type='t3.medium', allocated_storage_gb=50),
+        dms=DmsSizing(instance_class='dms.t3.medium', allocated_storage_gb=100),
+        emr=EmrSizing(
+            master=EmrInstanceFleet(instance_types={'m5.xlarge': 1, 'm5a.xlarge': 1}, on_demand_capacity=1),
+            core=EmrInstanceFleet(instance_types={'m5.xlarge': 4, 'm5a.xlarge': 4, 'm4.xlarge': 4}, on_demand_capacity=8),
+            task=EmrInstanceFleet(instance_types={'m5.xlarge': 4, 'm5a.xlarge': 4, 'm5.2xlarge': 8, 'm4.xlarge': 4},
+                                  spot_capacity=8),
+            scaling=EmrManagedScaling(minimum_capacity_units=8, maximum_capacity_units=40,
+                                      maximum_on_demand_capacity_units=8, maximum_core_capacity_units=8),
+            step_concurrency_level=3
+        ),
+        redshift=RedshiftSizing(node_type='DC2_LARGE', number_of_nodes=2)
+    ),
+    Environment.PRODUCTION: SizingProfile(
+        rds=RdsSizing(instance_type='r5.large', allocated_storage_gb=200, multi_az=True),
+        dms=DmsSizing(instance_class='dms.r5.xlarge', allocated_storage_gb=200, multi_az=True),
+        emr=EmrSizing(
+            master=EmrInstanceFleet(instance_types={'m5.xlarge': 1, 'm5a.xlarge': 1, 'm4.xlarge': 1}, on_demand_capacity=1),
+            core=EmrInstanceFleet(instance_types={'r5.2xlarge': 8, 'r5a.2xlarge': 8, 'r4.2xlarge': 8},
+                                  on_demand_capacity=24),
+            task=EmrInstanceFleet(instance_types={'r5.2xlarge': 8, 'r5a.2xlarge': 8, 'r5d.2xlarge': 8,
+                                                 'r5.4xlarge': 16, 'r4.2xlarge': 8}, spot_capacity=48),
+            scaling=EmrManagedScaling(minimum_capacity_units=24, maximum_capacity_units=192,
+                                      maximum_on_demand_capacity_units=24, maximum_core_capacity_units=24),
+            step_concurrency_level=5
+        ),
+        redshift=RedshiftSizing(node_type='DC2_8XLARGE', number_of_nodes=2)
+    ),
+}
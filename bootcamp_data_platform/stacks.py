@@ -0,0 +1,80 @@
+import os
+
+from aws_cdk import core
+
+STACKS = {
+    'common': [],
+    'data-lake': [],
+    'glue-catalog': ['data-lake'],
+    'data-lake-raw-ingestion': ['common', 'data-lake', 'glue-catalog'],
+    'emr-transform': ['common', 'data-lake'],
+    'data-warehouse': ['common', 'data-lake'],
+    'monitoring': ['common', 'data-lake-raw-ingestion', 'emr-transform'],
+}
+
+
+def requested_stacks(app: core.App, environment: str) -> list:
+    # cdk synth -c stacks=monitoring,emr-transform or STACKS=... , names with or without the environment prefix.
+    value = app.node.try_get_context('stacks') or os.environ.get('STACKS')
+    if not value or value == '*':
+        return list(STACKS)
+    names = [name.strip() for name in value.split(',') if name.strip()]
+    names = [name[len(environment) + 1:] if name.startswith(f'{environment}-') else name for name in names]
+    unknown = sorted(set(names) - set(STACKS))
+    if unknown:
+        raise ValueError(f'unknown stacks {unknown}, expected some of {list(STACKS)}')
+    return names
+
+
+class DataPlatform:
+    # Each stack imports its module when it is built, so synth of a few stacks never loads the aws_cdk modules of
+    # the others. Dependencies are built first because CDK needs the stacks a reference points to in the same app.
+
+    def __init__(self, app: core.App, environment: str) -> None:
+        self.app = app
+        self.environment = environment
+        self.stacks = {}
+
+    def build(self, names) -> dict:
+        for name in names:
+            self.stack(name)
+        return self.stacks
+
+    def stack(self, name: str) -> core.Stack:
+        if name not in self.stacks:
+            dependencies = [self.stack(dependency) for dependency in STACKS[name]]
+            self.stacks[name] = getattr(self, name.replace('-', '_'))(*dependencies)
+        return self.stacks[name]
+
+    def common(self):
+        from common import Common, Environment
+        from sizing import SizingProfile
+        environment = Environment(self.environment)
+        return Common(self.app, environment=environment, sizing=SizingProfile.for_environment(environment))
+
+    def data_lake(self):
+        from common import Environment
+        from data_lake import DataLake
+        return DataLake(self.app, environment=Environment(self.environment))
+
+    def glue_catalog(self, data_lake):
+        from catalog import GlueCatalog
+        return GlueCatalog(self.app, data_lake=data_lake)
+
+    def data_lake_raw_ingestion(self, common, data_lake, glue_catalog):
+        from ingestion import RawIngestion
+        raw_ingestion = RawIngestion(self.app, data_lake=data_lake, common=common)
+        raw_ingestion.add_dependency(glue_catalog)
+        return raw_ingestion
+
+    def emr_transform(self, common, data_lake):
+        from transform import EMRTransform
+        return EMRTransform(self.app, data_lake=data_lake, common=common)
+
+    def data_warehouse(self, common, data_lake):
+        from warehouse import DataWarehouse
+        return DataWarehouse(self.app, data_lake=data_lake, common=common)
+
+    def monitoring(self, common, raw_ingestion, emr_transform):
+        from monitoring import Monitoring
+        return Monitoring(self.app, common=common, raw_ingestion=raw_ingestion, emr_transform=emr_transform)
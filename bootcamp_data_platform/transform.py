@@ -1,6 +1,8 @@
 from aws_cdk import core
 from data_lake import DataLake
 from common import Common
+from instrumentation import NAMESPACE
+import naming
 from aws_cdk import (
     aws_emr as emr,
     aws_s3 as s3,
@@ -17,7 +19,7 @@ class EMRTransform(core.Stack):
         self.logs_bucket = s3.Bucket(
             self,
             f'{self.env}-emr-logs-bucket',
-            bucket_name=f's3-belisco-{self.env}-emr-logs-bucket',
+            bucket_name=naming.emr_logs_bucket(self.env),
             removal_policy=core.RemovalPolicy.DESTROY
         )
 
@@ -64,6 +66,15 @@ class EMRTransform(core.Stack):
         )
 
         self.emr_ec2_role.attach_inline_policy(self.datalake_emr_policy)
+        self.emr_ec2_role.add_to_policy(
+            iam.PolicyStatement(
+                actions=[
+                    'cloudwatch:PutMetricData'
+                ],
+                resources=['*'],
+                conditions={'StringEquals': {'cloudwatch:namespace': NAMESPACE}}
+            )
+        )
 
         self.emr_ec2_instance_profile = iam.CfnInstanceProfile(
             self,
@@ -74,25 +85,32 @@ class EMRTransform(core.Stack):
             ]
         )
 
+        sizing = common.sizing.emr
+
         self.cluster = emr.CfnCluster(
             self,
             f'{self.env}-emr-cluster',
-            name=f'{self.env}-emr-cluster',
+            name=naming.emr_cluster(self.env),
             instances=emr.CfnCluster.JobFlowInstancesConfigProperty(
-                master_instance_group=emr.CfnCluster.InstanceGroupConfigProperty(
-                    instance_count=1,
-                    instance_type='m4.large',
-                    market='ON_DEMAND',
-                    name='Master'
+                master_instance_fleet=emr.CfnCluster.InstanceFleetConfigProperty(
+                    name='Master',
+                    instance_type_configs=[
+                        emr.CfnCluster.InstanceTypeConfigProperty(instance_type=instance_type, weighted_capacity=weight)
+                        for instance_type, weight in sizing.master.instance_types.items()
+                    ],
+                    target_on_demand_capacity=sizing.master.on_demand_capacity
                 ),
-                core_instance_group=emr.CfnCluster.InstanceGroupConfigProperty(
-                    instance_count=2,
-                    instance_type='m4.large',
-                    market='ON_DEMAND',
-                    name='Core'
+                core_instance_fleet=emr.CfnCluster.InstanceFleetConfigProperty(
+                    name='Core',
+                    instance_type_configs=[
+                        emr.CfnCluster.InstanceTypeConfigProperty(instance_type=instance_type, weighted_capacity=weight)
+                        for instance_type, weight in sizing.core.instance_types.items()
+                    ],
+                    target_on_demand_capacity=sizing.core.on_demand_capacity,
+                    target_spot_capacity=sizing.core.spot_capacity
                 ),
                 termination_protected=False,
-                ec2_subnet_id=common.custom_vpc.private_subnets[0].subnet_id
+                ec2_subnet_ids=[subnet.subnet_id for subnet in common.custom_vpc.private_subnets]
             ),
             applications=[
                 emr.CfnCluster.ApplicationProperty(name='Spark')
@@ -100,7 +118,7 @@ class EMRTransform(core.Stack):
             log_uri=f's3://{self.logs_bucket.bucket_name}/logs',
             job_flow_role=self.emr_ec2_instance_profile.get_att('Arn').to_string(),
             service_role=self.emr_role.role_arn,
-            release_label='emr-5.30.1',
+            release_label='emr-6.2.0',
             visible_to_all_users=True,
             configurations=[
                 emr.CfnCluster.ConfigurationProperty(
@@ -108,6 +126,58 @@ class EMRTransform(core.Stack):
                     configuration_properties={
                         "hive.metastore.client.factory.class": "com.amazonaws.glue.catalog.metastore.AWSGlueDataCatalogHiveClientFactory"
                     }
+                ),
+                emr.CfnCluster.ConfigurationProperty(
+                    classification='spark-defaults',
+                    configuration_properties={
+                        "spark.dynamicAllocation.enabled": "true",
+                        "spark.shuffle.service.enabled": "true",
+                        "spark.sql.adaptive.enabled": "true",
+                        "spark.sql.adaptive.coalescePartitions.enabled": "true",
+                        "spark.sql.adaptive.skewJoin.enabled": "true",
+                        "spark.sql.parquet.fs.optimized.committer.optimization-enabled": "true"
+                    }
                 )
             ]
         )
+
+        if sizing.step_concurrency_level > 1:
+            self.cluster.add_property_override('StepConcurrencyLevel', sizing.step_concurrency_level)
+
+        if sizing.scaling:
+            self.cluster.add_property_override('ManagedScalingPolicy', {
+                'ComputeLimits': {
+                    'UnitType': 'InstanceFleetUnits',
+                    'MinimumCapacityUnits': sizing.scaling.minimum_capacity_units,
+                    'MaximumCapacityUnits': sizing.scaling.maximum_capacity_units,
+                    'MaximumOnDemandCapacityUnits': sizing.scaling.maximum_on_demand_capacity_units,
+                    'MaximumCoreCapacityUnits': sizing.scaling.maximum_core_capacity_units
+                }
+            })
+
+        if sizing.task:
+            self.task_instance_fleet = emr.CfnInstanceFleetConfig(
+                self,
+                f'{self.env}-emr-task-instance-fleet',
+                cluster_id=self.cluster.ref,
+                instance_fleet_type='TASK',
+                name='Task',
+                instance_type_configs=[
+                    emr.CfnInstanceFleetConfig.InstanceTypeConfigProperty(
+                        instance_type=instance_type,
+                        weighted_capacity=weight,
+                        bid_price_as_percentage_of_on_demand_price=100
+                    )
+                    for instance_type, weight in sizing.task.instance_types.items()
+                ],
+                target_on_demand_capacity=sizing.task.on_demand_capacity,
+                target_spot_capacity=sizing.task.spot_capacity,
+                launch_specifications=emr.CfnInstanceFleetConfig.InstanceFleetProvisioningSpecificationsProperty(
+                    spot_specification=emr.CfnInstanceFleetConfig.SpotProvisioningSpecificationProperty(
+                        timeout_action='SWITCH_TO_ON_DEMAND',
+                        timeout_duration_minutes=10
+                    )
+                )
+            )
+            self.task_instance_fleet.add_property_override(
+                'LaunchSpecifications.SpotSpecification.AllocationStrategy', 'capacity-optimized')
@@ -78,28 +78,39 @@ class DataWarehouse(core.Stack):
                 connection=ec2.Port.tcp(5439)
             )
 
+        sizing = common.sizing.redshift
+
+        self.spectrum_role = SpectrumRole(
+            self,
+            data_lake
+        )
+
         self.redshift_cluster = redshift.Cluster(
             self,
             f'belisco-{self.env}-redshift',
             cluster_name=f'belisco-{self.env}-redshift',
             vpc=common.custom_vpc,
-            cluster_type=redshift.ClusterType.MULTI_NODE,
-            node_type=redshift.NodeType.DC2_LARGE,
+            cluster_type=redshift.ClusterType.MULTI_NODE if sizing.number_of_nodes > 1 else redshift.ClusterType.SINGLE_NODE,
+            node_type=redshift.NodeType[sizing.node_type],
             default_database_name='dw',
-            number_of_nodes=2,
+            number_of_nodes=sizing.number_of_nodes if sizing.number_of_nodes > 1 else None,
             removal_policy=core.RemovalPolicy.DESTROY,
             master_user=redshift.Login(
                 master_username='admin'
             ),
             publicly_accessible=True,
             roles=[
-                SpectrumRole(
-                    self,
-                    data_lake
-                )
+                self.spectrum_role
             ],
             security_groups=[
                 self.redshift_sg
             ],
             vpc_subnets=ec2.SubnetSelection(subnet_type=ec2.SubnetType.PUBLIC)
         )
+
+        core.CfnOutput(
+            self,
+            f'{self.env}-redshift-spectrum-role-arn',
+            value=self.spectrum_role.role_arn,
+            description='IAM role for Spectrum external schemas and COPY, used by redshift_jobs'
+        )
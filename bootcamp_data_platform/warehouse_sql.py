@@ -0,0 +1,252 @@
+import hashlib
+
+import naming
+from schemas import (ATOMIC_EVENTS_QUALITY, FUNNEL_DAILY, ORDERS, PAGE_VIEWS_HOURLY, PROCESSED_ATOMIC_EVENTS,
+                     REVENUE_BY_PRODUCT_DAILY, SESSIONS_DAILY, Schema)
+
+DIALECTS = ['redshift', 'postgres']
+
+SQL_TYPES = {
+    'string': 'VARCHAR({length})',
+    'boolean': 'BOOLEAN',
+    'int': 'INTEGER',
+    'bigint': 'BIGINT',
+    'double': 'DOUBLE PRECISION',
+    'timestamp': 'TIMESTAMP',
+}
+
+
+def literal(value, type):
+    if value is None:
+        return 'NULL'
+    if type in ('int', 'bigint'):
+        return str(int(value))
+    if type == 'double':
+        return repr(float(value))
+    if type == 'boolean':
+        return 'TRUE' if str(value).lower() in ('true', '1') else 'FALSE'
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+class WarehouseTable:
+
+    def __init__(self, schema: Schema, layer: str, distkey=None, sortkey=(), varchar_lengths=None, varchar_length=256):
+        self.schema = schema
+        self.layer = layer
+        self.distkey = distkey
+        self.sortkey = list(sortkey)
+        self.varchar_lengths = varchar_lengths or {}
+        self.varchar_length = varchar_length
+
+    @property
+    def name(self):
+        return f'{self.layer}.{self.schema.name}'
+
+    @property
+    def staging_name(self):
+        return f'stage_{self.layer}_{self.schema.name}'
+
+    @property
+    def columns(self):
+        return self.schema.fields + self.schema.partition_keys
+
+    def column_type(self, field):
+        return SQL_TYPES[field.type].format(length=self.varchar_lengths.get(field.name, self.varchar_length))
+
+    def column_definitions(self, fields):
+        return ',\n'.join(f'    {field.name} {self.column_type(field)}{"" if field.nullable else " NOT NULL"}'
+                          for field in fields)
+
+    def create_sql(self, dialect='redshift'):
+        sql = f'CREATE TABLE IF NOT EXISTS {self.name} (\n{self.column_definitions(self.columns)}\n)'
+        if dialect == 'redshift':
+            sql += f'\nDISTSTYLE KEY DISTKEY ({self.distkey})' if self.distkey else '\nDISTSTYLE ALL'
+            if self.sortkey:
+                sql += f'\nCOMPOUND SORTKEY ({", ".join(self.sortkey)})'
+        return sql
+
+    def create_staging_sql(self):
+        # Parquet files do not hold the partition columns, so the staging table has the file columns only and the
+        # partition values are added when moving rows to the target.
+        return f'CREATE TEMP TABLE {self.staging_name} (\n{self.column_definitions(self.schema.fields)}\n)'
+
+    def copy_sql(self, manifest_uri, iam_role):
+        return f"COPY {self.staging_name}\nFROM '{manifest_uri}'\nIAM_ROLE '{iam_role}'\nFORMAT AS PARQUET\nMANIFEST"
+
+    def partition_condition(self, values):
+        return ' AND '.join(f'{key.name} = {literal(value, key.type)}'
+                            for key, value in zip(self.schema.partition_keys, values))
+
+    def replace_partition_sql(self, values):
+        columns = ', '.join(field.name for field in self.schema.fields)
+        partition_values = ', '.join(literal(value, key.type) for key, value in zip(self.schema.partition_keys, values))
+        partition_columns = ', '.join(key.name for key in self.schema.partition_keys)
+        return [
+            f'DELETE FROM {self.name} WHERE {self.partition_condition(values)}',
+            f'INSERT INTO {self.name} ({columns}, {partition_columns})\n'
+            f'SELECT {columns}, {partition_values}\nFROM {self.staging_name}',
+            f'DELETE FROM {self.staging_name}',
+        ]
+
+    def stats_off_sql(self):
+        return f"SELECT stats_off FROM svv_table_info WHERE \"schema\" = '{self.layer}' AND \"table\" = '{self.schema.name}'"
+
+    def analyze_sql(self, dialect='redshift'):
+        return f'ANALYZE {self.name} PREDICATE COLUMNS' if dialect == 'redshift' else f'ANALYZE {self.name}'
+
+
+def create_schema_sql(layer):
+    return f'CREATE SCHEMA IF NOT EXISTS {layer}'
+
+
+WAREHOUSE_TABLES = [
+    WarehouseTable(
+        PROCESSED_ATOMIC_EVENTS,
+        layer='processed',
+        distkey='user_domain_id',
+        sortkey=['event_date', 'event_hour', 'event_type'],
+        varchar_lengths={'page_url': 2048, 'referer_url': 2048, 'browser_user_agent': 1024, 'event_timestamp': 32}
+    ),
+    WarehouseTable(
+        ORDERS,
+        layer='processed',
+        distkey='order_id',
+        sortkey=['created_at']
+    ),
+    WarehouseTable(PAGE_VIEWS_HOURLY, layer='curated', sortkey=['event_date', 'event_hour']),
+    WarehouseTable(SESSIONS_DAILY, layer='curated', sortkey=['event_date']),
+    WarehouseTable(FUNNEL_DAILY, layer='curated', sortkey=['event_date', 'step_order']),
+    WarehouseTable(REVENUE_BY_PRODUCT_DAILY, layer='curated', sortkey=['order_date']),
+    WarehouseTable(ATOMIC_EVENTS_QUALITY, layer='curated', sortkey=['event_date', 'event_hour', 'metric']),
+]
+
+
+class ExternalSchema:
+
+    def __init__(self, name, layer):
+        self.name = name
+        self.layer = layer
+
+    def glue_database(self, environment):
+        return naming.glue_database(environment, self.layer)
+
+    def create_sql(self, environment, iam_role):
+        return f"CREATE EXTERNAL SCHEMA IF NOT EXISTS {self.name}\nFROM DATA CATALOG\n" \
+               f"DATABASE '{self.glue_database(environment)}'\nIAM_ROLE '{iam_role}'"
+
+
+class MaterializedView:
+
+    def __init__(self, name, query, auto_refresh=True, distkey=None, sortkey=()):
+        self.name = name
+        self.query = query.strip()
+        self.auto_refresh = auto_refresh
+        self.distkey = distkey
+        self.sortkey = list(sortkey)
+
+    def create_sql(self):
+        sql = f'CREATE MATERIALIZED VIEW {self.name}'
+        if self.distkey:
+            sql += f'\nDISTKEY ({self.distkey})'
+        if self.sortkey:
+            sql += f'\nSORTKEY ({", ".join(self.sortkey)})'
+        return sql + f'\nAUTO REFRESH {"YES" if self.auto_refresh else "NO"}\nAS\n{self.query}'
+
+    def drop_sql(self):
+        return f'DROP MATERIALIZED VIEW IF EXISTS {self.name}'
+
+    def refresh_sql(self):
+        return f'REFRESH MATERIALIZED VIEW {self.name}'
+
+    @property
+    def definition_hash(self):
+        return hashlib.sha256(self.create_sql().encode('utf-8')).hexdigest()
+
+
+OBJECTS_TABLE = 'admin.warehouse_objects'
+
+
+def objects_table_sql():
+    return [
+        create_schema_sql('admin'),
+        f'CREATE TABLE IF NOT EXISTS {OBJECTS_TABLE} (\n    name VARCHAR(256) NOT NULL,\n'
+        f'    definition_hash VARCHAR(64) NOT NULL\n)',
+    ]
+
+
+def existing_objects_sql():
+    return f'SELECT name, definition_hash FROM {OBJECTS_TABLE}'
+
+
+def sync_sql(environment, iam_role, existing, external_schemas=None, views=None, refresh=True):
+    # existing maps each materialized view to the hash of the definition it was created with, so only changed views
+    # are recreated.
+    external_schemas = EXTERNAL_SCHEMAS if external_schemas is None else external_schemas
+    views = MATERIALIZED_VIEWS if views is None else views
+    schemas = sorted({table.layer for table in WAREHOUSE_TABLES} | {view.name.split('.')[0] for view in views})
+
+    statements = objects_table_sql()
+    statements += [schema.create_sql(environment, iam_role) for schema in external_schemas]
+    statements += [create_schema_sql(schema) for schema in schemas]
+    statements += [table.create_sql() for table in WAREHOUSE_TABLES]
+
+    for view in views:
+        if existing.get(view.name) == view.definition_hash:
+            if refresh and not view.auto_refresh:
+                statements.append(view.refresh_sql())
+            continue
+        statements += [
+            view.drop_sql(),
+            view.create_sql(),
+            f"DELETE FROM {OBJECTS_TABLE} WHERE name = {literal(view.name, 'string')}",
+            f"INSERT INTO {OBJECTS_TABLE} VALUES ({literal(view.name, 'string')}, "
+            f"{literal(view.definition_hash, 'string')})",
+        ]
+
+    for name in sorted(set(existing) - {view.name for view in views}):
+        statements += [
+            f'DROP MATERIALIZED VIEW IF EXISTS {name}',
+            f"DELETE FROM {OBJECTS_TABLE} WHERE name = {literal(name, 'string')}",
+        ]
+
+    return statements
+
+
+EXTERNAL_SCHEMAS = [
+    ExternalSchema('spectrum_raw', layer='raw'),
+    ExternalSchema('spectrum_processed', layer='processed'),
+    ExternalSchema('spectrum_curated', layer='curated'),
+]
+
+# The views read the local tables load_to_redshift.py fills, so they refresh incrementally on their own. Views over
+# Spectrum tables cannot auto refresh and only see the partitions registered in Glue, declare any with
+# auto_refresh=False so every sync refreshes them.
+MATERIALIZED_VIEWS = [
+    MaterializedView(
+        'analytics.mv_page_views_hourly',
+        """
+SELECT event_date, event_hour, page_url_path, device_type, COUNT(*) AS page_views
+FROM processed.atomic_events
+GROUP BY event_date, event_hour, page_url_path, device_type
+""",
+        sortkey=['event_date', 'event_hour']
+    ),
+    MaterializedView(
+        'analytics.mv_revenue_by_product_daily',
+        """
+SELECT TRUNC(created_at) AS order_date, product_name, COUNT(*) AS orders, SUM(value) AS revenue
+FROM processed.orders
+GROUP BY TRUNC(created_at), product_name
+""",
+        sortkey=['order_date']
+    ),
+    MaterializedView(
+        'analytics.mv_events_by_country_daily',
+        """
+SELECT event_date, geo_country, device_type, COUNT(*) AS events
+FROM processed.atomic_events
+GROUP BY event_date, geo_country, device_type
+""",
+        sortkey=['event_date']
+    ),
+]
@@ -0,0 +1,35 @@
+import json
+
+import boto3
+
+CLIENT = None
+
+
+def merge(client, bucket, configurations, replaced_functions):
+    # Other stacks and services keep notifications on the same bucket, only those of our functions are replaced.
+    current = client.get_bucket_notification_configuration(Bucket=bucket)
+    current.pop('ResponseMetadata', None)
+    current['LambdaFunctionConfigurations'] = [
+        configuration for configuration in current.get('LambdaFunctionConfigurations', [])
+        if configuration['LambdaFunctionArn'] not in replaced_functions
+    ] + configurations
+    client.put_bucket_notification_configuration(Bucket=bucket, NotificationConfiguration=current)
+
+
+def functions(properties):
+    return {configuration['LambdaFunctionArn'] for configuration in properties.get('Configurations', [])}
+
+
+def handler(event, context):
+    global CLIENT
+    if CLIENT is None:
+        CLIENT = boto3.client('s3')
+
+    properties = event['ResourceProperties']
+    replaced = functions(properties) | functions(event.get('OldResourceProperties', {}))
+    configurations = [] if event['RequestType'] == 'Delete' else properties['Configurations']
+    merge(CLIENT, properties['Bucket'], configurations, replaced)
+
+    print(json.dumps({'request': event['RequestType'], 'bucket': properties['Bucket'],
+                      'configurations': len(configurations)}))
+    return {'PhysicalResourceId': f'{properties["Bucket"]}-notifications'}
@@ -0,0 +1,96 @@
+import copy
+import json
+import os
+from urllib.parse import unquote_plus
+
+import boto3
+
+BATCH_SIZE = 100
+
+
+class PartitionRegistrar:
+
+    def __init__(self, client, database, table):
+        self.client = client
+        self.database = database
+        self.table = table
+        self._table = None
+        self.known = set()
+
+    @property
+    def definition(self):
+        if self._table is None:
+            self._table = self.client.get_table(DatabaseName=self.database, Name=self.table)['Table']
+        return self._table
+
+    @property
+    def partition_keys(self):
+        return [key['Name'] for key in self.definition['PartitionKeys']]
+
+    @property
+    def location(self):
+        return self.definition['StorageDescriptor']['Location'].rstrip('/')
+
+    def values_from_key(self, key):
+        parts = dict(part.split('=', 1) for part in key.split('/')[:-1] if '=' in part)
+        if not all(name in parts for name in self.partition_keys):
+            return None
+        return tuple(parts[name] for name in self.partition_keys)
+
+    def partition_input(self, values):
+        storage = copy.deepcopy(self.definition['StorageDescriptor'])
+        storage['Location'] = self.location + '/' + '/'.join(
+            f'{name}={value}' for name, value in zip(self.partition_keys, values)) + '/'
+        return {'Values': list(values), 'StorageDescriptor': storage}
+
+    def register(self, partitions):
+        candidates = sorted(set(tuple(values) for values in partitions) - self.known)
+        created = []
+        for start in range(0, len(candidates), BATCH_SIZE):
+            batch = candidates[start:start + BATCH_SIZE]
+            existing = {tuple(partition['Values']) for partition in self.client.batch_get_partition(
+                DatabaseName=self.database,
+                TableName=self.table,
+                PartitionsToGet=[{'Values': list(values)} for values in batch]
+            )['Partitions']}
+            missing = [values for values in batch if values not in existing]
+            if missing:
+                response = self.client.batch_create_partition(
+                    DatabaseName=self.database,
+                    TableName=self.table,
+                    PartitionInputList=[self.partition_input(values) for values in missing]
+                )
+                failed = {tuple(error['PartitionValues']): error['ErrorDetail'] for error in response.get('Errors', [])
+                          if error['ErrorDetail']['ErrorCode'] != 'AlreadyExistsException'}
+                if failed:
+                    raise RuntimeError(f'failed to register partitions of {self.database}.{self.table}: {failed}')
+                created.extend(missing)
+            self.known.update(batch)
+        return created
+
+    def register_keys(self, keys):
+        return self.register(values for values in map(self.values_from_key, keys) if values)
+
+
+def registrars(client, tables):
+    return {prefix.strip('/') + '/': PartitionRegistrar(client, database, table)
+            for prefix, (database, table) in tables.items()}
+
+
+REGISTRARS = None
+
+
+def handler(event, context):
+    global REGISTRARS
+    if REGISTRARS is None:
+        REGISTRARS = registrars(boto3.client('glue'), json.loads(os.environ['TABLES']))
+
+    keys = [unquote_plus(record['s3']['object']['key']) for record in event.get('Records', [])]
+    created = {}
+    for prefix, registrar in REGISTRARS.items():
+        partitions = registrar.register_keys(key for key in keys if key.startswith(prefix))
+        if partitions:
+            created[f'{registrar.database}.{registrar.table}'] = ['/'.join(values) for values in partitions]
+
+    print(json.dumps({'objects': len(keys), 'created': created}))
+    return created
@@ -0,0 +1,179 @@
+# execute from the repository root: PYTHONPATH=bootcamp_data_platform python local_scripts/athena_client.py --sql '...'
+import argparse
+import hashlib
+import json
+import re
+import time
+from collections import namedtuple
+from datetime import datetime, timezone
+
+import boto3
+import naming
+
+QueryStats = namedtuple('QueryStats', ['query_execution_id', 'cached', 'bytes_scanned', 'engine_ms', 'latency_seconds'])
+
+# Literals are matched first, so comment markers inside them are kept, and comments separate words like whitespace.
+TOKENS = re.compile(r"('(?:[^']|'')*'|\"(?:[^\"]|\"\")*\")|--[^\n]*|/\*.*?\*/|\s+|((?:[^'\"\s/-]|-(?!-)|/(?!\*))+)",
+                    re.DOTALL)
+
+
+class AthenaQueryError(Exception):
+    pass
+
+
+def normalize_sql(sql):
+    parts = []
+    for match in TOKENS.finditer(sql):
+        quoted, word = match.groups()
+        if quoted:
+            parts.append(quoted)
+        elif word:
+            parts.append(word.lower())
+    return ' '.join(parts).rstrip(';').strip()
+
+
+def cache_key(sql, partitions=(), database=None, workgroup=None):
+    # Unqualified table names resolve in the database of the query, so the same text may read other tables.
+    payload = json.dumps({'sql': normalize_sql(sql), 'partitions': sorted(partitions), 'database': database,
+                          'workgroup': workgroup})
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class AthenaClient:
+
+    def __init__(self, workgroup, results_bucket, database=None, client=None, s3_client=None, ttl_seconds=3600,
+                 budget_bytes=None, poll_seconds=0.2, max_poll_seconds=5.0, cache_prefix='query_cache'):
+        self.workgroup = workgroup
+        self.results_bucket = results_bucket
+        self.database = database
+        self.client = client or boto3.client('athena')
+        self.s3_client = s3_client or boto3.client('s3')
+        self.ttl_seconds = ttl_seconds
+        self.budget_bytes = budget_bytes
+        self.poll_seconds = poll_seconds
+        self.max_poll_seconds = max_poll_seconds
+        self.cache_prefix = cache_prefix.strip('/')
+        self.stats = []
+
+    @classmethod
+    def for_environment(cls, environment, **kwargs):
+        return cls(
+            workgroup=naming.athena_workgroup(environment),
+            results_bucket=naming.athena_results_bucket(environment),
+            **kwargs
+        )
+
+    @property
+    def bytes_scanned(self):
+        return sum(stats.bytes_scanned for stats in self.stats)
+
+    def query(self, sql, partitions=(), use_cache=True):
+        started_at = time.monotonic()
+        key = cache_key(sql, partitions, self.database, self.workgroup)
+
+        execution = self.cached_execution(key) if use_cache else None
+        if execution is not None:
+            self.stats.append(QueryStats(execution['QueryExecutionId'], True, 0, 0, time.monotonic() - started_at))
+            return self.rows(execution['QueryExecutionId'])
+
+        if self.budget_bytes is not None and self.bytes_scanned >= self.budget_bytes:
+            raise AthenaQueryError(f'scan budget of {self.budget_bytes} bytes exhausted, {self.bytes_scanned} scanned')
+
+        execution = self.execute(sql)
+        statistics = execution.get('Statistics', {})
+        self.stats.append(QueryStats(
+            execution['QueryExecutionId'],
+            False,
+            statistics.get('DataScannedInBytes', 0),
+            statistics.get('EngineExecutionTimeInMillis', 0),
+            time.monotonic() - started_at
+        ))
+        self.s3_client.put_object(
+            Bucket=self.results_bucket,
+            Key=self.cache_object_key(key),
+            Body=json.dumps({
+                'query_execution_id': execution['QueryExecutionId'],
+                'sql': normalize_sql(sql),
+                'database': self.database,
+                'partitions': sorted(partitions),
+                'completed_at': execution['Status']['CompletionDateTime'].isoformat()
+            }).encode('utf-8')
+        )
+        return self.rows(execution['QueryExecutionId'])
+
+    def execute(self, sql):
+        parameters = {'QueryString': sql, 'WorkGroup': self.workgroup}
+        if self.database:
+            parameters['QueryExecutionContext'] = {'Database': self.database}
+        query_execution_id = self.client.start_query_execution(**parameters)['QueryExecutionId']
+
+        delay = self.poll_seconds
+        while True:
+            execution = self.client.get_query_execution(QueryExecutionId=query_execution_id)['QueryExecution']
+            state = execution['Status']['State']
+            if state == 'SUCCEEDED':
+                return execution
+            if state in ('FAILED', 'CANCELLED'):
+                reason = execution['Status'].get('StateChangeReason', 'no reason given')
+                raise AthenaQueryError(f'query {query_execution_id} {state.lower()}: {reason}')
+            time.sleep(delay)
+            delay = min(delay * 2, self.max_poll_seconds)
+
+    def cache_object_key(self, key):
+        return f'{self.cache_prefix}/{self.workgroup}/{key}.json'
+
+    def cached_execution(self, key):
+        try:
+            entry = json.loads(self.s3_client.get_object(
+                Bucket=self.results_bucket, Key=self.cache_object_key(key))['Body'].read())
+        except self.s3_client.exceptions.NoSuchKey:
+            return None
+
+        age = datetime.now(timezone.utc) - datetime.fromisoformat(entry['completed_at'])
+        if age.total_seconds() > self.ttl_seconds:
+            return None
+
+        execution = self.client.get_query_execution(QueryExecutionId=entry['query_execution_id'])['QueryExecution']
+        return execution if execution['Status']['State'] == 'SUCCEEDED' else None
+
+    def pages(self, query_execution_id, page_size=1000):
+        paginator = self.client.get_paginator('get_query_results')
+        first = True
+        for page in paginator.paginate(QueryExecutionId=query_execution_id,
+                                       PaginationConfig={'PageSize': page_size}):
+            columns = [column['Name'] for column in page['ResultSet']['ResultSetMetadata']['ColumnInfo']]
+            rows = page['ResultSet']['Rows'][1:] if first else page['ResultSet']['Rows']
+            first = False
+            yield [dict(zip(columns, (datum.get('VarCharValue') for datum in row['Data']))) for row in rows]
+
+    def rows(self, query_execution_id, page_size=1000):
+        for page in self.pages(query_execution_id, page_size=page_size):
+            yield from page
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run a query on the data lake Athena workgroup, reusing recent results.')
+    parser.add_argument('--environment', default='production')
+    parser.add_argument('--database', help='defaults to the processed database of the environment')
+    parser.add_argument('--sql', required=True)
+    parser.add_argument('--partitions', nargs='*', default=[],
+                        help='partitions the query reads, e.g. event_date=2020-10-01, part of the cache key')
+    parser.add_argument('--ttl-seconds', type=int, default=3600)
+    parser.add_argument('--no-cache', action='store_true')
+    parser.add_argument('--limit', type=int, default=20, help='rows to print')
+    args = parser.parse_args()
+
+    database = args.database or naming.glue_database(args.environment, 'processed')
+    athena = AthenaClient.for_environment(args.environment, database=database, ttl_seconds=args.ttl_seconds)
+    for index, row in enumerate(athena.query(args.sql, partitions=args.partitions, use_cache=not args.no_cache)):
+        if index >= args.limit:
+            break
+        print(json.dumps(row))
+
+    for stats in athena.stats:
+        print(f'query {stats.query_execution_id}: cached={stats.cached} scanned={stats.bytes_scanned / 2 ** 20:.2f} MB '
+              f'engine={stats.engine_ms} ms latency={stats.latency_seconds:.2f} s')
+
+
+if __name__ == '__main__':
+    main()
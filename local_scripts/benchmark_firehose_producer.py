@@ -0,0 +1,144 @@
+import argparse
+import base64
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import boto3
+from botocore.config import Config
+from fake_web_events import Simulation
+from firehose_producer import FirehoseProducer, percentile
+
+
+class StubFirehoseHandler(BaseHTTPRequestHandler):
+    latency_seconds = 0.0
+    failure_rate = 0.0
+    received_bytes = 0
+    received_records = 0
+    lock = threading.Lock()
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        operation = self.headers['X-Amz-Target'].split('.')[-1]
+        time.sleep(self.latency_seconds)
+
+        if operation == 'PutRecord':
+            records = [body['Record']]
+        else:
+            records = body['Records']
+
+        responses = []
+        for record in records:
+            if random.random() < self.failure_rate:
+                responses.append({'ErrorCode': 'ServiceUnavailableException', 'ErrorMessage': 'Slow down.'})
+            else:
+                with self.lock:
+                    StubFirehoseHandler.received_records += 1
+                    StubFirehoseHandler.received_bytes += len(base64.b64decode(record['Data']))
+                responses.append({'RecordId': uuid.uuid4().hex})
+
+        if operation == 'PutRecord':
+            payload = {'RecordId': responses[0].get('RecordId', ''), 'Encrypted': False}
+        else:
+            payload = {
+                'FailedPutCount': sum(1 for response in responses if 'ErrorCode' in response),
+                'Encrypted': False,
+                'RequestResponses': responses
+            }
+
+        data = json.dumps(payload).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-amz-json-1.1')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stub(latency_seconds, failure_rate):
+    StubFirehoseHandler.latency_seconds = latency_seconds
+    StubFirehoseHandler.failure_rate = failure_rate
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubFirehoseHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def stub_client(server, max_pool_connections):
+    return boto3.client(
+        'firehose',
+        endpoint_url=f'http://127.0.0.1:{server.server_address[1]}',
+        region_name='eu-west-1',
+        aws_access_key_id='stub',
+        aws_secret_access_key='stub',
+        config=Config(max_pool_connections=max_pool_connections)
+    )
+
+
+def run_per_event(client, events):
+    latencies = []
+    started_at = time.monotonic()
+    for event in events:
+        put_started_at = time.monotonic()
+        client.put_record(
+            DeliveryStreamName='stub-delivery-stream',
+            Record={'Data': json.dumps(event) + '\n'}
+        )
+        latencies.append(time.monotonic() - put_started_at)
+    elapsed = time.monotonic() - started_at
+    latencies.sort()
+    return {
+        'events_per_second': len(events) / elapsed,
+        'p99_flush_latency_ms': percentile(latencies, 99) * 1000,
+    }
+
+
+def run_producer(client, events, workers, aggregate):
+    started_at = time.monotonic()
+    with FirehoseProducer('stub-delivery-stream', client=client, max_workers=workers,
+                          aggregate_records=aggregate, backoff_seconds=0.01) as producer:
+        for event in events:
+            producer.put(event)
+    elapsed = time.monotonic() - started_at
+    result = producer.stats()
+    result['events_per_second'] = len(events) / elapsed
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the Firehose producer against a local stub endpoint.')
+    parser.add_argument('--events', type=int, default=20000)
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--latency-ms', type=float, default=20.0)
+    parser.add_argument('--failure-rate', type=float, default=0.01)
+    parser.add_argument('--baseline-events', type=int, default=500)
+    args = parser.parse_args()
+
+    simulation = Simulation(user_pool_size=100, sessions_per_day=100000)
+    events = []
+    for event in simulation.run(duration_seconds=3600):
+        events.append(event)
+        if len(events) >= args.events:
+            break
+
+    server = start_stub(args.latency_ms / 1000, args.failure_rate)
+    client = stub_client(server, max_pool_connections=args.workers)
+
+    results = {
+        'put_record': run_per_event(client, events[:args.baseline_events]),
+        'put_record_batch': run_producer(client, events, args.workers, aggregate=False),
+        'put_record_batch_aggregated': run_producer(client, events, args.workers, aggregate=True),
+    }
+    server.shutdown()
+
+    for name, result in results.items():
+        print(f"{name:<30} {result['events_per_second']:>12,.0f} events/s "
+              f"p99 flush latency {result['p99_flush_latency_ms']:>8.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
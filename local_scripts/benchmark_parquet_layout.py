@@ -0,0 +1,115 @@
+import argparse
+import os
+import shutil
+import time
+
+import duckdb
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+
+LAYOUTS = {
+    'flat_unsorted_snappy': {'partition_by': [], 'sort_by': [], 'compression': 'snappy'},
+    'partitioned_unsorted_snappy': {'partition_by': ['event_date', 'event_hour'], 'sort_by': [], 'compression': 'snappy'},
+    'partitioned_sorted_snappy': {'partition_by': ['event_date', 'event_hour'],
+                                  'sort_by': ['event_type', 'page_url_path', 'user_domain_id'], 'compression': 'snappy'},
+    'partitioned_sorted_zstd': {'partition_by': ['event_date', 'event_hour'],
+                                'sort_by': ['event_type', 'page_url_path', 'user_domain_id'], 'compression': 'zstd'},
+}
+
+
+def reference_queries(table):
+    event_date = table['event_date'][0].as_py()
+    event_hour = table['event_hour'][0].as_py()
+    user = table['user_domain_id'][0].as_py()
+    return {
+        'events_per_hour_one_day': (
+            f"select event_hour, count(*) from events where event_date = '{event_date}' group by 1",
+            ['event_date', 'event_hour'],
+            pc.field('event_date') == event_date),
+        'checkout_users_one_hour': (
+            f"select count(distinct user_domain_id) from events where event_date = '{event_date}' "
+            f"and event_hour = {event_hour} and page_url_path = '/confirmation'",
+            ['event_date', 'event_hour', 'user_domain_id', 'page_url_path'],
+            (pc.field('event_date') == event_date) & (pc.field('event_hour') == event_hour) &
+            (pc.field('page_url_path') == '/confirmation')),
+        'top_pages_one_day': (
+            f"select page_url_path, count(*) from events where event_date = '{event_date}' group by 1 order by 2 desc",
+            ['event_date', 'page_url_path'],
+            pc.field('event_date') == event_date),
+        'single_user_history': (
+            f"select * from events where user_domain_id = '{user}' order by event_timestamp",
+            table.column_names,
+            pc.field('user_domain_id') == user),
+    }
+
+
+def write_layout(table, path, partition_by, sort_by, compression, rows_per_file):
+    shutil.rmtree(path, ignore_errors=True)
+    if sort_by:
+        table = table.sort_by([(column, 'ascending') for column in partition_by + sort_by])
+    ds.write_dataset(
+        table,
+        path,
+        format='parquet',
+        partitioning=ds.partitioning(table.select(partition_by).schema, flavor='hive') if partition_by else None,
+        file_options=ds.ParquetFileFormat().make_write_options(compression=compression),
+        max_rows_per_file=rows_per_file,
+        max_rows_per_group=min(rows_per_file, 128 * 1024),
+        existing_data_behavior='delete_matching'
+    )
+
+
+def bytes_scanned(dataset, columns, predicate):
+    scanned = 0
+    for fragment in dataset.get_fragments(filter=predicate):
+        metadata = fragment.metadata
+        names = [metadata.schema.column(i).name for i in range(metadata.num_columns)]
+        wanted = [i for i, name in enumerate(names) if name in columns]
+        for row_group in fragment.split_by_row_group(filter=predicate, schema=dataset.schema):
+            for row_group_info in row_group.row_groups:
+                chunk = metadata.row_group(row_group_info.id)
+                scanned += sum(chunk.column(i).total_compressed_size for i in wanted)
+    return scanned
+
+
+def directory_stats(path):
+    files = [os.path.join(root, name) for root, _, names in os.walk(path) for name in names if name.endswith('.parquet')]
+    return len(files), sum(os.path.getsize(file) for file in files)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare parquet layouts of the processed atomic events.')
+    parser.add_argument('--input', required=True, help='processed atomic_events directory written by convert_to_parquet.py')
+    parser.add_argument('--workdir', default='/tmp/parquet_layout_benchmark')
+    parser.add_argument('--rows-per-file', type=int, default=1000000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    table = ds.dataset(args.input, format='parquet', partitioning='hive').to_table()
+    table = table.set_column(table.schema.get_field_index('event_date'), 'event_date',
+                             pc.cast(table['event_date'], 'string'))
+    queries = reference_queries(table)
+
+    print(f"{'layout':<30} {'query':<26} {'files':>6} {'MB on disk':>10} {'MB scanned':>10} {'ms':>8}")
+    for name, layout in LAYOUTS.items():
+        path = os.path.join(args.workdir, name)
+        write_layout(table, path, layout['partition_by'], layout['sort_by'], layout['compression'], args.rows_per_file)
+        files, size = directory_stats(path)
+        dataset = ds.dataset(path, format='parquet', partitioning='hive' if layout['partition_by'] else None)
+
+        connection = duckdb.connect()
+        connection.execute(f"create view events as select * from read_parquet('{path}/**/*.parquet', "
+                           f"hive_partitioning={'true' if layout['partition_by'] else 'false'}, hive_types_autocast=false)")
+
+        for query_name, (sql, columns, predicate) in queries.items():
+            timings = []
+            for _ in range(args.repeat):
+                started_at = time.perf_counter()
+                connection.execute(sql).fetchall()
+                timings.append(time.perf_counter() - started_at)
+            print(f'{name:<30} {query_name:<26} {files:>6} {size / 2 ** 20:>10.1f} '
+                  f'{bytes_scanned(dataset, columns, predicate) / 2 ** 20:>10.2f} {min(timings) * 1000:>8.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,284 @@
+# execute from the repository root: PYTHONPATH=bootcamp_data_platform:pyspark_jobs python local_scripts/benchmark_pipeline.py --scale 1gb
+import argparse
+import gzip
+import json
+import os
+import random
+import shutil
+import subprocess
+import tempfile
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+from fake_web_events import Simulation
+from run_jobs import ROOT, package, pipeline
+from schemas import CURATED_SCHEMAS, ORDERS, PROCESSED_ATOMIC_EVENTS
+
+SCALES = {'smoke': 0.01, '1gb': 1, '10gb': 10, '100gb': 100}
+START = datetime(2020, 10, 1)
+EVENTS_PER_FILE = 100000
+ORDERS_PER_GB = 1000000
+ORDERS_PER_FILE = 1000000
+PRODUCTS = ['product_a', 'product_b', 'product_c', 'product_d']
+METRICS = ['wall_seconds', 'peak_rss_mb', 'shuffle_write_bytes', 'shuffle_read_bytes', 'spill_bytes']
+
+
+def simulate_templates(path, count):
+    if not os.path.exists(path):
+        simulation = Simulation(user_pool_size=1000, sessions_per_day=100000)
+        with open(path, 'w') as file:
+            for index, event in enumerate(simulation.run(duration_seconds=24 * 3600)):
+                if index >= count:
+                    break
+                file.write(json.dumps(event) + '\n')
+    with open(path) as file:
+        events = [json.loads(line) for line in file]
+    # Each synthetic event is a template with a new id and timestamp, serialized by formatting instead of dumping.
+    return ['{"event_id": "%s", "event_timestamp": "%s", ' + json.dumps(
+        {key: value for key, value in event.items() if key not in ('event_id', 'event_timestamp')})[1:]
+            for event in events]
+
+
+def write_events_hour(root, templates, hour, events, duplicate_rate, seed):
+    rng = random.Random(seed)
+    directory = os.path.join(root, f'year={hour:%Y}/month={hour:%m}/day={hour:%d}/hour={hour:%H}')
+    os.makedirs(directory, exist_ok=True)
+    late = []
+    written = 0
+    for start in range(0, events, EVENTS_PER_FILE):
+        with gzip.open(os.path.join(directory, f'firehose-{start // EVENTS_PER_FILE:05d}.gz'), 'wt',
+                       compresslevel=1) as file:
+            for _ in range(min(EVENTS_PER_FILE, events - start)):
+                timestamp = hour + timedelta(seconds=rng.uniform(-120, 3600))
+                line = templates[rng.randrange(len(templates))] % (
+                    uuid.UUID(int=rng.getrandbits(128), version=4), f'{timestamp:%Y-%m-%d %H:%M:%S.%f}') + '\n'
+                file.write(line)
+                written += len(line)
+                if rng.random() < duplicate_rate:
+                    # Firehose retries land in the same file or, when the retry crosses a buffer, in the next hour.
+                    if rng.random() < 0.5:
+                        file.write(line)
+                    else:
+                        late.append(line)
+    return late, written
+
+
+def generate_events(root, templates, total_events, hours, duplicate_rate, workers):
+    per_hour = total_events // hours
+    arguments = [(root, templates, START + timedelta(hours=index), per_hour, duplicate_rate, index)
+                 for index in range(hours)]
+    written = 0
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        results = list(executor.map(write_events_hour, *zip(*arguments)))
+    for index, (late, size) in enumerate(results):
+        written += size
+        hour = START + timedelta(hours=index + 1)
+        directory = os.path.join(root, f'year={hour:%Y}/month={hour:%m}/day={hour:%d}/hour={hour:%H}')
+        os.makedirs(directory, exist_ok=True)
+        with gzip.open(os.path.join(directory, 'firehose-retries.gz'), 'wt', compresslevel=1) as file:
+            file.writelines(late)
+    return written
+
+
+def generate_orders(root, total_orders, seed):
+    rng = random.Random(seed)
+    os.makedirs(root, exist_ok=True)
+    schema = pa.schema([('op', pa.string()), ('extracted_at', pa.string()), ('created_at', pa.timestamp('us')),
+                        ('order_id', pa.int32()), ('product_name', pa.string()), ('value', pa.float64())])
+    extracted_at = START
+    changes = 0
+
+    def write(name, op, order_ids):
+        nonlocal extracted_at, changes
+        for start in range(0, len(order_ids), ORDERS_PER_FILE):
+            chunk = order_ids[start:start + ORDERS_PER_FILE]
+            extracted_at += timedelta(minutes=5)
+            pq.write_table(pa.table({
+                'op': [op] * len(chunk),
+                'extracted_at': [f'{extracted_at:%Y-%m-%d %H:%M:%S.%f}'] * len(chunk),
+                'created_at': [START + timedelta(seconds=order_id % 86400) for order_id in chunk],
+                'order_id': chunk,
+                'product_name': [PRODUCTS[order_id % len(PRODUCTS)] for order_id in chunk],
+                'value': [round(rng.uniform(1, 500), 2) for _ in chunk],
+            }, schema=schema), os.path.join(root, f'{name}-{start // ORDERS_PER_FILE:05d}.parquet'))
+            changes += len(chunk)
+
+    # DMS writes the full load first, then change files with inserts, updates and deletes.
+    loaded = int(total_orders * 0.8)
+    write('LOAD', 'I', list(range(loaded)))
+    write('20201001-inserts', 'I', list(range(loaded, total_orders)))
+    write('20201001-updates', 'U', sorted(rng.sample(range(total_orders), int(total_orders * 0.3))))
+    write('20201001-deletes', 'D', sorted(rng.sample(range(total_orders), int(total_orders * 0.02))))
+    return changes
+
+
+def prepare_dataset(directory, scale, hours, duplicate_rate, workers, template_count):
+    manifest_path = os.path.join(directory, 'dataset.json')
+    settings = {'scale': scale, 'hours': hours, 'duplicate_rate': duplicate_rate}
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as file:
+            manifest = json.load(file)
+        if manifest['settings'] == settings:
+            return manifest
+
+    shutil.rmtree(os.path.join(directory, 'raw'), ignore_errors=True)
+    os.makedirs(directory, exist_ok=True)
+    templates = simulate_templates(os.path.join(directory, 'templates.jsonl'), template_count)
+    average_bytes = sum(len(template) + 60 for template in templates) / len(templates)
+    events = int(SCALES[scale] * 2 ** 30 / average_bytes)
+
+    started_at = time.monotonic()
+    raw_bytes = generate_events(os.path.join(directory, 'raw', 'atomic_events'), templates, events, hours,
+                                duplicate_rate, workers)
+    changes = generate_orders(os.path.join(directory, 'raw', 'orders', 'public', 'orders'),
+                              max(1000, int(SCALES[scale] * ORDERS_PER_GB)), seed=len(templates))
+    manifest = {'settings': settings, 'events': events, 'raw_event_bytes': raw_bytes, 'order_changes': changes,
+                'generated_seconds': round(time.monotonic() - started_at, 2)}
+    with open(manifest_path, 'w') as file:
+        json.dump(manifest, file, indent=2)
+    return manifest
+
+
+def event_log_metrics(directory):
+    totals = {'shuffle_write_bytes': 0, 'shuffle_read_bytes': 0, 'spill_bytes': 0, 'input_bytes': 0,
+              'output_bytes': 0}
+    for name in os.listdir(directory):
+        with open(os.path.join(directory, name)) as file:
+            for line in file:
+                if '"SparkListenerTaskEnd"' not in line:
+                    continue
+                metrics = json.loads(line).get('Task Metrics') or {}
+                shuffle_read = metrics.get('Shuffle Read Metrics', {})
+                totals['shuffle_write_bytes'] += metrics.get('Shuffle Write Metrics', {}).get('Shuffle Bytes Written', 0)
+                totals['shuffle_read_bytes'] += shuffle_read.get('Remote Bytes Read', 0) + \
+                    shuffle_read.get('Local Bytes Read', 0)
+                totals['spill_bytes'] += metrics.get('Disk Bytes Spilled', 0)
+                totals['input_bytes'] += metrics.get('Input Metrics', {}).get('Bytes Read', 0)
+                totals['output_bytes'] += metrics.get('Output Metrics', {}).get('Bytes Written', 0)
+    return totals
+
+
+def run_job(job, py_files, workdir, master, driver_memory, spark_conf):
+    event_logs = os.path.join(workdir, 'event_logs', job.name)
+    shutil.rmtree(event_logs, ignore_errors=True)
+    os.makedirs(event_logs)
+    conf = {'spark.eventLog.enabled': 'true', 'spark.eventLog.dir': f'file://{event_logs}', **spark_conf}
+
+    with open(os.path.join(workdir, f'{job.name}.log'), 'w') as log:
+        started_at = time.monotonic()
+        process = subprocess.Popen(
+            ['spark-submit', '--master', master, '--driver-memory', driver_memory, '--py-files', py_files,
+             *[argument for key, value in conf.items() for argument in ('--conf', f'{key}={value}')],
+             os.path.join(ROOT, job.script), *job.args],
+            stdout=log, stderr=subprocess.STDOUT
+        )
+        # wait4 reports the peak resident memory of the driver JVM and the Python processes it waited for.
+        _, status, usage = os.wait4(process.pid, 0)
+        wall_seconds = time.monotonic() - started_at
+
+    return {'exit_code': os.waitstatus_to_exitcode(status), 'wall_seconds': round(wall_seconds, 2),
+            'peak_rss_mb': round(usage.ru_maxrss / 1024, 1), **event_log_metrics(event_logs)}
+
+
+def output_stats(root):
+    stats = {}
+    for layer, schemas in (('processed', [PROCESSED_ATOMIC_EVENTS, ORDERS]), ('curated', CURATED_SCHEMAS)):
+        for table in [schema.name for schema in schemas]:
+            sizes = [os.path.getsize(os.path.join(directory, name))
+                     for directory, _, names in os.walk(os.path.join(root, layer, table))
+                     for name in names if name.endswith('.parquet')]
+            stats[f'{layer}.{table}'] = {'files': len(sizes), 'bytes': sum(sizes),
+                                         'mean_file_mb': round(sum(sizes) / len(sizes) / 2 ** 20, 2) if sizes else 0}
+    return stats
+
+
+def git_commit():
+    result = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True, text=True)
+    return result.stdout.strip() or None
+
+
+def previous_result(results_path, scale):
+    if not os.path.exists(results_path):
+        return None
+    with open(results_path) as file:
+        results = [json.loads(line) for line in file if line.strip()]
+    return next((result for result in reversed(results) if result['scale'] == scale), None)
+
+
+def compare(previous, current, threshold_percent):
+    regressions = []
+    print(f"{'job':<24} {'metric':<20} {'previous':>14} {'current':>14} {'change':>8}")
+    for name, job in current['jobs'].items():
+        before = previous['jobs'].get(name)
+        if not before:
+            continue
+        for metric in METRICS:
+            change = (job[metric] - before[metric]) / before[metric] * 100 if before[metric] else 0.0
+            flag = ''
+            if change > threshold_percent:
+                regressions.append(f'{name} {metric}')
+                flag = ' regression'
+            print(f'{name:<24} {metric:<20} {before[metric]:>14,.1f} {job[metric]:>14,.1f} {change:>7.1f}%{flag}')
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the spark jobs on local synthetic data.')
+    parser.add_argument('--scale', choices=SCALES, default='smoke', help='approximate size of the raw events')
+    parser.add_argument('--workdir', default=os.path.join(tempfile.gettempdir(), 'pipeline_benchmark'))
+    parser.add_argument('--hours', type=int, default=24, help='hours the events are spread over')
+    parser.add_argument('--duplicate-rate', type=float, default=0.005, help='share of events delivered twice')
+    parser.add_argument('--templates', type=int, default=5000, help='simulated events the dataset is built from')
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--master', default='local[*]')
+    parser.add_argument('--driver-memory', default='4g')
+    parser.add_argument('--spark-conf', action='append', default=[], metavar='KEY=VALUE')
+    parser.add_argument('--results', help='json lines file the runs are appended to, defaults to the workdir')
+    parser.add_argument('--regression-threshold', type=float, default=10.0, help='percent')
+    parser.add_argument('--fail-on-regression', action='store_true')
+    args = parser.parse_args()
+
+    dataset = os.path.join(args.workdir, args.scale)
+    manifest = prepare_dataset(dataset, args.scale, args.hours, args.duplicate_rate, args.workers, args.templates)
+    print(f"{manifest['events']:,} events ({manifest['raw_event_bytes'] / 2 ** 30:.2f} GiB of json), "
+          f"{manifest['order_changes']:,} order changes")
+
+    # Every run starts from the raw layer only, so the incremental jobs process the whole dataset.
+    for layer in ('processed', 'curated', '_metrics'):
+        shutil.rmtree(os.path.join(dataset, layer), ignore_errors=True)
+    run_dir = os.path.join(dataset, 'runs', datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S'))
+    os.makedirs(run_dir)
+    py_files = package(run_dir)
+    spark_conf = dict(setting.split('=', 1) for setting in args.spark_conf)
+
+    result = {'run_at': datetime.now(timezone.utc).isoformat(), 'git_commit': git_commit(), 'scale': args.scale,
+              'dataset': manifest, 'master': args.master, 'driver_memory': args.driver_memory,
+              'spark_conf': spark_conf, 'jobs': {}}
+    for job in pipeline(['--local-root', dataset, '--metrics', 'none']):
+        result['jobs'][job.name] = run_job(job, py_files, run_dir, args.master, args.driver_memory, spark_conf)
+        print(f"{job.name}: {json.dumps(result['jobs'][job.name])}")
+        if result['jobs'][job.name]['exit_code'] != 0:
+            raise SystemExit(f'{job.name} failed, see {run_dir}/{job.name}.log')
+    result['outputs'] = output_stats(dataset)
+    for table, stats in result['outputs'].items():
+        print(f"{table:<36} {stats['files']:>6} files {stats['bytes'] / 2 ** 20:>10.1f} MB "
+              f"{stats['mean_file_mb']:>8.2f} MB/file")
+
+    results_path = args.results or os.path.join(args.workdir, 'results.jsonl')
+    previous = previous_result(results_path, args.scale)
+    with open(results_path, 'a') as file:
+        file.write(json.dumps(result) + '\n')
+
+    if previous:
+        print(f"\ncompared with the run of {previous['run_at']} at {previous['git_commit']}")
+        regressions = compare(previous, result, args.regression_threshold)
+        if regressions and args.fail_on_regression:
+            raise SystemExit(f'regressions in {", ".join(regressions)}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+# execute from the repository root: PYTHONPATH=bootcamp_data_platform python local_scripts/benchmark_synth.py
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from stacks import STACKS
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def import_seconds(stderr):
+    # -X importtime prints one line per module, top level imports are the ones without indentation.
+    total = 0
+    for line in stderr.splitlines():
+        if line.startswith('import time:') and not line.endswith('| imported package'):
+            _, cumulative, name = line[len('import time:'):].split('|')
+            if not name.startswith('  '):
+                total += int(cumulative)
+    return total / 1e6
+
+
+def synth(python, environment, stacks):
+    with tempfile.TemporaryDirectory() as outdir:
+        env = {**os.environ, 'ENVIRONMENT': environment, 'STACKS': stacks, 'CDK_OUTDIR': outdir,
+               'PYTHONPATH': os.pathsep.join([os.path.join(ROOT, 'bootcamp_data_platform'), ROOT]),
+               'JSII_SILENCE_WARNING_DEPRECATED_NODE_VERSION': '1'}
+        started_at = time.monotonic()
+        result = subprocess.run([python, '-X', 'importtime', os.path.join(ROOT, 'app.py')], env=env, cwd=ROOT,
+                                capture_output=True, text=True)
+        seconds = time.monotonic() - started_at
+        if result.returncode != 0:
+            raise RuntimeError(f'synth of {stacks} failed:\n{result.stderr[-2000:]}')
+        templates = [name for name in os.listdir(outdir) if name.endswith('.template.json')]
+    return seconds, import_seconds(result.stderr), len(templates)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure cdk synth time of the app per selected stack.')
+    parser.add_argument('--environment', default='production')
+    parser.add_argument('--stacks', nargs='*', default=['*', *STACKS], help='selections to time, * is every stack')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--python', default=sys.executable)
+    parser.add_argument('--results', help='json lines file the measurements are appended to')
+    args = parser.parse_args()
+
+    results = []
+    print(f"{'stacks':<26} {'templates':>9} {'median s':>9} {'min s':>7} {'imports s':>10}")
+    for stacks in args.stacks:
+        runs = [synth(args.python, args.environment, stacks) for _ in range(args.repeat)]
+        seconds = [run[0] for run in runs]
+        result = {'stacks': stacks, 'templates': runs[0][2], 'median_seconds': round(statistics.median(seconds), 3),
+                  'min_seconds': round(min(seconds), 3),
+                  'import_seconds': round(statistics.median(run[1] for run in runs), 3)}
+        results.append(result)
+        print(f"{stacks:<26} {result['templates']:>9} {result['median_seconds']:>9.2f} {result['min_seconds']:>7.2f} "
+              f"{result['import_seconds']:>10.2f}")
+
+    if args.results:
+        with open(args.results, 'a') as file:
+            file.write(json.dumps({'run_at': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+                                   'environment': args.environment, 'results': results}) + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,249 @@
+# execute from the repository root: PYTHONPATH=lambdas/partition_registrar python local_scripts/compact_small_files.py \
+#     --bucket BUCKET --prefix PREFIX --glue-table DATABASE.TABLE
+import argparse
+import hashlib
+import json
+import re
+import shutil
+import tempfile
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+
+import boto3
+import pyarrow as pa
+import pyarrow.parquet as pq
+from partition_registrar import PartitionRegistrar
+
+DMS_FILE_NAME = re.compile(r'^\d{8}-\d+\.parquet$')
+# Read by HadoopFileSystem.list_published_files in pyspark_jobs/partitions.py.
+COMPACTION_MARKER = '_compaction.json'
+FORMATS = {'.gz': 'gzip', '.parquet': 'parquet'}
+
+
+class Compactor:
+
+    def __init__(self, client, bucket, prefix, registrar, target_mb=256, small_file_mb=64, min_files=2,
+                 min_age_minutes=120, workspace='_compaction'):
+        self.client = client
+        self.bucket = bucket
+        self.prefix = prefix.strip('/')
+        self.registrar = registrar
+        self.target_bytes = target_mb * 1024 * 1024
+        self.small_file_bytes = small_file_mb * 1024 * 1024
+        self.min_files = min_files
+        self.min_age = timedelta(minutes=min_age_minutes)
+        self.workspace = f'{workspace.strip("/")}/{self.prefix}'
+
+    def run(self, dry_run=False):
+        report = {'recovered': self.recover(), 'partitions': []}
+
+        for group, objects in sorted(self.candidate_groups().items()):
+            if dry_run:
+                report['partitions'].append({'partition': group, 'files_in': len(objects),
+                                             'bytes_in': sum(obj['Size'] for obj in objects)})
+            else:
+                report['partitions'].append(self.compact(group, objects))
+
+        report['files_in'] = sum(partition['files_in'] for partition in report['partitions'])
+        report['files_out'] = sum(partition.get('files_out', 0) for partition in report['partitions'])
+        report['bytes_in'] = sum(partition['bytes_in'] for partition in report['partitions'])
+        report['bytes_out'] = sum(partition.get('bytes_out', 0) for partition in report['partitions'])
+        return report
+
+    def list_objects(self, prefix):
+        paginator = self.client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=prefix):
+            yield from page.get('Contents', [])
+
+    def candidate_groups(self):
+        cutoff = datetime.now(timezone.utc) - self.min_age
+        groups = defaultdict(list)
+
+        for obj in self.list_objects(f'{self.prefix}/'):
+            directory, name = obj['Key'].rsplit('/', 1)
+            extension = next((ext for ext in FORMATS if name.endswith(ext)), None)
+            # Hidden keys include the markers and the outputs of earlier runs, which are only merged again along
+            # with new small files of their partition.
+            if extension is None or name.startswith(('_', '.')) or '/_' in obj['Key']:
+                continue
+            # merge_orders_cdc.py tracks DMS change files by modification time, a merged file would be read as new
+            # changes and bring back orders whose tombstones have expired.
+            if DMS_FILE_NAME.match(name):
+                continue
+            if obj['Size'] >= self.small_file_bytes or obj['LastModified'] > cutoff:
+                continue
+            groups[f'{directory}{extension}'].append(obj)
+
+        return {group: sorted(objects, key=lambda obj: obj['Key'])
+                for group, objects in groups.items() if len(objects) >= self.min_files}
+
+    def compact(self, group, objects):
+        directory = objects[0]['Key'].rsplit('/', 1)[0]
+        file_format = next(fmt for ext, fmt in FORMATS.items() if group.endswith(ext))
+        extension = next(ext for ext, fmt in FORMATS.items() if fmt == file_format)
+        compaction_id = hashlib.sha1(
+            '\n'.join(f'{obj["Key"]}:{obj["ETag"]}' for obj in objects).encode('utf-8')).hexdigest()[:16]
+        location = f'_compacted-{compaction_id}'
+
+        # The files of an earlier compaction are merged again with the new ones, so a partition keeps one location.
+        previous = self.marker(directory)
+        replaced = [obj for obj in self.list_objects(f'{directory}/{previous["location"]}/')
+                    if obj['Key'].endswith(extension)] if previous else []
+        batches = list(self.batches(replaced + objects))
+
+        manifest = {
+            'id': compaction_id,
+            'created_at': datetime.now(timezone.utc).isoformat(),
+            'partition': group,
+            'directory': directory,
+            'location': location,
+            'inputs': [obj['Key'] for obj in objects],
+            'replaced': [obj['Key'] for obj in replaced],
+            'outputs': [f'{directory}/{location}/part-{index:05d}{extension}' for index in range(len(batches))],
+            'bytes_in': sum(obj['Size'] for obj in objects),
+            'committed': False,
+        }
+        # Recorded before the outputs are written, so the outputs of a run failing meanwhile are removed.
+        self.write_manifest(manifest)
+        for batch, key in zip(batches, manifest['outputs']):
+            if file_format == 'gzip':
+                self.concatenate_gzip(batch, key)
+            else:
+                self.merge_parquet(batch, key)
+        manifest['committed'] = True
+        self.write_manifest(manifest)
+        self.finish(manifest)
+
+        bytes_out = sum(self.client.head_object(Bucket=self.bucket, Key=key)['ContentLength']
+                        for key in manifest['outputs'])
+        return {'partition': group, 'files_in': len(objects), 'files_out': len(batches),
+                'bytes_in': manifest['bytes_in'], 'bytes_out': bytes_out}
+
+    def batches(self, objects):
+        batch, size = [], 0
+        for obj in objects:
+            if batch and size + obj['Size'] > self.target_bytes:
+                yield batch
+                batch, size = [], 0
+            batch.append(obj)
+            size += obj['Size']
+        if batch:
+            yield batch
+
+    def concatenate_gzip(self, objects, key):
+        with tempfile.SpooledTemporaryFile(max_size=self.target_bytes) as buffer:
+            for obj in objects:
+                shutil.copyfileobj(self.client.get_object(Bucket=self.bucket, Key=obj['Key'])['Body'], buffer)
+            buffer.seek(0)
+            self.client.upload_fileobj(buffer, self.bucket, key)
+
+    def merge_parquet(self, objects, key):
+        with tempfile.TemporaryDirectory() as directory, tempfile.TemporaryFile() as output:
+            sources = []
+            for index, obj in enumerate(objects):
+                sources.append(f'{directory}/{index:05d}.parquet')
+                self.client.download_file(self.bucket, obj['Key'], sources[-1])
+            # Producers add columns and widen types over time, the output takes every column of its inputs and
+            # older files get nulls for the columns they lack.
+            schema = pa.unify_schemas([pq.read_schema(source) for source in sources], promote_options='permissive')
+            with pq.ParquetWriter(output, schema, compression='snappy') as writer:
+                for source in sources:
+                    writer.write_table(conform(pq.read_table(source), schema))
+            output.seek(0)
+            self.client.upload_fileobj(output, self.bucket, key)
+
+    def manifest_key(self, compaction_id):
+        return f'{self.workspace}/manifests/{compaction_id}.json'
+
+    def write_manifest(self, manifest):
+        self.client.put_object(Bucket=self.bucket, Key=self.manifest_key(manifest['id']),
+                               Body=json.dumps(manifest, indent=2).encode('utf-8'))
+
+    def marker(self, directory):
+        try:
+            body = self.client.get_object(Bucket=self.bucket, Key=f'{directory}/{COMPACTION_MARKER}')['Body']
+        except self.client.exceptions.NoSuchKey:
+            return None
+        return json.loads(body.read())
+
+    def finish(self, manifest):
+        # S3 has no atomic swap, so the outputs sit under a hidden location that readers skip until they switch to
+        # it in one step: convert_to_parquet.py through the marker of the directory, Athena and Spectrum through the
+        # location of the Glue partition. The files they replace are deleted only once both have switched.
+        directory, location = manifest['directory'], manifest['location']
+        self.client.put_object(Bucket=self.bucket, Key=f'{directory}/{COMPACTION_MARKER}', Body=json.dumps({
+            'location': location,
+            'inputs': [key.rsplit('/', 1)[1] for key in manifest['inputs']],
+        }, indent=2).encode('utf-8'))
+        self.switch_location(directory, location)
+
+        for key in manifest['inputs'] + manifest['replaced']:
+            self.client.delete_object(Bucket=self.bucket, Key=key)
+        self.client.delete_object(Bucket=self.bucket, Key=self.manifest_key(manifest['id']))
+
+    def switch_location(self, directory, location):
+        values = self.registrar.values_from_key(f'{directory}/{location}/')
+        if values is None:
+            raise ValueError(f'{directory} is not a partition of {self.registrar.database}.{self.registrar.table}')
+        partition = self.registrar.partition_input(values)
+        partition['StorageDescriptor']['Location'] = f's3://{self.bucket}/{directory}/{location}/'
+        glue = self.registrar.client
+        try:
+            glue.update_partition(DatabaseName=self.registrar.database, TableName=self.registrar.table,
+                                  PartitionValueList=list(values), PartitionInput=partition)
+        except glue.exceptions.EntityNotFoundException:
+            glue.create_partition(DatabaseName=self.registrar.database, TableName=self.registrar.table,
+                                  PartitionInput=partition)
+
+    def recover(self):
+        recovered = []
+        for obj in self.list_objects(f'{self.workspace}/manifests/'):
+            manifest = json.loads(self.client.get_object(Bucket=self.bucket, Key=obj['Key'])['Body'].read())
+            if manifest['committed']:
+                self.finish(manifest)
+                recovered.append(manifest['id'])
+            else:
+                for key in manifest['outputs']:
+                    self.client.delete_object(Bucket=self.bucket, Key=key)
+                self.client.delete_object(Bucket=self.bucket, Key=obj['Key'])
+        return sorted(recovered)
+
+
+def conform(table, schema):
+    columns = [table.column(field.name).cast(field.type) if field.name in table.column_names
+               else pa.nulls(table.num_rows, field.type) for field in schema]
+    return pa.Table.from_arrays(columns, schema=schema)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Merge small files of each partition into large files.')
+    parser.add_argument('--bucket', required=True)
+    parser.add_argument('--prefix', required=True, help='dataset prefix, e.g. atomic_events')
+    parser.add_argument('--glue-table', required=True,
+                        help='database.table of the prefix, its partitions are switched to the compacted files')
+    parser.add_argument('--glue-region', help='region of the Glue catalog, defaults to the boto3 configuration')
+    parser.add_argument('--target-mb', type=int, default=256)
+    parser.add_argument('--small-file-mb', type=int, default=64, help='only files smaller than this are merged')
+    parser.add_argument('--min-files', type=int, default=2)
+    parser.add_argument('--min-age-minutes', type=int, default=120,
+                        help='leave files younger than this alone, so partitions still being written are skipped')
+    parser.add_argument('--endpoint-url', help='S3 compatible endpoint, e.g. a local MinIO')
+    parser.add_argument('--dry-run', action='store_true')
+    args = parser.parse_args()
+
+    compactor = Compactor(
+        boto3.client('s3', endpoint_url=args.endpoint_url),
+        bucket=args.bucket,
+        prefix=args.prefix,
+        registrar=PartitionRegistrar(boto3.client('glue', region_name=args.glue_region),
+                                     *args.glue_table.split('.', 1)),
+        target_mb=args.target_mb,
+        small_file_mb=args.small_file_mb,
+        min_files=args.min_files,
+        min_age_minutes=args.min_age_minutes
+    )
+    print(json.dumps(compactor.run(dry_run=args.dry_run), indent=2))
+
+
+if __name__ == '__main__':
+    main()
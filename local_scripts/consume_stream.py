@@ -0,0 +1,60 @@
+# execute from the repository root: PYTHONPATH=bootcamp_data_platform python local_scripts/consume_stream.py
+import argparse
+import json
+import threading
+from collections import Counter
+from datetime import datetime, timezone
+
+import boto3
+import naming
+from instrumentation import ROWS, SINKS, Instrumentation
+from kinesis_consumer import FileCheckpoint, KinesisConsumer, S3Checkpoint
+
+parser = argparse.ArgumentParser(description='Count atomic events by type as they arrive on the raw Kinesis stream.')
+parser.add_argument('--environment', default='production')
+parser.add_argument('--checkpoint', default='consume_stream_checkpoint',
+                    help='local directory or s3:// prefix, shared by the workers of the stream')
+parser.add_argument('--initial-position', choices=['TRIM_HORIZON', 'LATEST'], default='LATEST',
+                    help='where shards without a checkpoint start')
+parser.add_argument('--worker-index', type=int, default=0)
+parser.add_argument('--worker-count', type=int, default=1, help='processes sharing the shards of the stream')
+parser.add_argument('--duration-seconds', type=float, help='defaults to running until interrupted')
+parser.add_argument('--endpoint-url', help='local Kinesis stand-in, e.g. http://localhost:4567 for kinesalite')
+parser.add_argument('--metrics', choices=SINKS, default='cloudwatch')
+parser.add_argument('--metrics-path', help='json lines file of the local sink, defaults to stdout')
+args = parser.parse_args()
+
+if args.checkpoint.startswith('s3://'):
+    checkpoint = S3Checkpoint(args.checkpoint)
+else:
+    checkpoint = FileCheckpoint(args.checkpoint)
+instrumentation = Instrumentation.create(args.metrics, args.environment, 'consume_stream', args.metrics_path)
+lock = threading.Lock()
+
+
+def handle(shard_id, events):
+    counts = Counter(event.get('event_type') for event in events)
+    newest = max((event['event_timestamp'] for event in events if event.get('event_timestamp')), default=None)
+    print(json.dumps({'shard_id': shard_id, 'events': len(events), 'event_types': counts, 'newest': newest}))
+    # The handler runs on every shard's reader thread, the instrumentation buffer is shared.
+    with lock:
+        instrumentation.record(ROWS, len(events), stage='consume')
+        if newest:
+            instrumentation.lag(datetime.fromisoformat(newest).replace(tzinfo=timezone.utc), stage='consume')
+        instrumentation.flush()
+
+
+consumer = KinesisConsumer(
+    naming.kinesis_stream(args.environment),
+    handle,
+    checkpoint,
+    client=boto3.client('kinesis', endpoint_url=args.endpoint_url),
+    initial_position=args.initial_position,
+    worker_index=args.worker_index,
+    worker_count=args.worker_count
+)
+try:
+    consumer.run(duration_seconds=args.duration_seconds)
+except KeyboardInterrupt:
+    consumer.close()
+print(consumer.stats())
@@ -0,0 +1,207 @@
+import hashlib
+import json
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import boto3
+
+MAX_BATCH_RECORDS = 500
+MAX_BATCH_BYTES = 4 * 1024 * 1024
+MAX_RECORD_BYTES = 1000 * 1024
+
+
+class FirehoseProducer:
+
+    def __init__(self, delivery_stream_name, client=None, max_batch_records=MAX_BATCH_RECORDS,
+                 max_batch_bytes=MAX_BATCH_BYTES, linger_seconds=1.0, max_workers=8, max_retries=5,
+                 backoff_seconds=0.1, aggregate_records=False):
+        self.delivery_stream_name = delivery_stream_name
+        self.client = client or boto3.client('firehose')
+        self.max_batch_records = min(max_batch_records, MAX_BATCH_RECORDS)
+        self.max_batch_bytes = min(max_batch_bytes, MAX_BATCH_BYTES)
+        self.linger_seconds = linger_seconds
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self.aggregate_records = aggregate_records
+
+        self.records_sent = 0
+        self.bytes_sent = 0
+        self.records_failed = 0
+        self.batches_sent = 0
+        self.flush_latencies = []
+
+        self._records = []
+        self._batch_bytes = 0
+        self._batch_started_at = None
+        self._lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._in_flight = threading.BoundedSemaphore(max_workers * 2)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._futures = []
+        self._error = None
+        self._closed = threading.Event()
+        self._linger_thread = threading.Thread(target=self._linger_loop, daemon=True)
+        self._linger_thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def put(self, event):
+        # The id is serialized once and sent unchanged on every retry, so the pipeline can drop retried copies.
+        if not event.get('event_id'):
+            event = {**event, 'event_id': str(uuid.uuid4())}
+        data = (json.dumps(event) + '\n').encode('utf-8')
+        if len(data) > MAX_RECORD_BYTES:
+            raise ValueError(f'event of {len(data)} bytes exceeds the Firehose record limit of {MAX_RECORD_BYTES}')
+
+        with self._lock:
+            fits_batch = self._batch_bytes + len(data) <= self.max_batch_bytes
+            if self.aggregate_records and self._records and fits_batch and \
+                    len(self._records[-1]) + len(data) <= MAX_RECORD_BYTES:
+                self._records[-1] += data
+            else:
+                if len(self._records) >= self.max_batch_records or not fits_batch:
+                    self._submit_locked()
+                self._records.append(data)
+            self._batch_bytes += len(data)
+
+            if self._batch_started_at is None:
+                self._batch_started_at = time.monotonic()
+
+    def flush(self):
+        with self._lock:
+            self._submit_locked()
+            futures, self._futures = self._futures, []
+        wait(futures)
+        with self._lock:
+            for future in futures:
+                self._collect(future)
+            # A batch that failed before this flush is reported once, by the first flush or close that follows it.
+            error, self._error = self._error, None
+        if error:
+            raise error
+
+    def close(self):
+        if self._closed.is_set():
+            return
+        self._closed.set()
+        self._linger_thread.join()
+        try:
+            self.flush()
+        finally:
+            self._executor.shutdown(wait=True)
+
+    def stats(self):
+        latencies = sorted(self.flush_latencies)
+        return {
+            'records_sent': self.records_sent,
+            'bytes_sent': self.bytes_sent,
+            'records_failed': self.records_failed,
+            'batches_sent': self.batches_sent,
+            'p50_flush_latency_ms': percentile(latencies, 50) * 1000,
+            'p99_flush_latency_ms': percentile(latencies, 99) * 1000,
+        }
+
+    def _linger_loop(self):
+        while not self._closed.wait(self.linger_seconds / 4):
+            with self._lock:
+                if self._batch_started_at is not None and \
+                        time.monotonic() - self._batch_started_at >= self.linger_seconds:
+                    self._submit_locked()
+
+    def _submit_locked(self):
+        if not self._records:
+            return
+        records, self._records = self._records, []
+        self._batch_bytes = 0
+        self._batch_started_at = None
+
+        self._in_flight.acquire()
+        future = self._executor.submit(self._send, records)
+        future.add_done_callback(lambda _: self._in_flight.release())
+        for done in [f for f in self._futures if f.done()]:
+            self._collect(done)
+        self._futures = [f for f in self._futures if not f.done()] + [future]
+
+    def _collect(self, future):
+        # _send counted the records of a batch that raised as failed, only the first error is kept for flush.
+        error = future.exception()
+        if error and not self._error:
+            self._error = error
+
+    def _send(self, records):
+        started_at = time.monotonic()
+        pending = records
+        attempt = 0
+
+        while pending:
+            try:
+                failed = self._put_batch(pending)
+            except Exception:
+                with self._stats_lock:
+                    self.records_failed += len(pending)
+                    self.batches_sent += 1
+                    self.flush_latencies.append(time.monotonic() - started_at)
+                raise
+
+            with self._stats_lock:
+                self.records_sent += len(pending) - len(failed)
+                self.bytes_sent += sum(map(len, pending)) - sum(map(len, failed))
+            pending = failed
+
+            if pending:
+                attempt += 1
+                if attempt > self.max_retries:
+                    break
+                time.sleep(self.backoff_seconds * 2 ** (attempt - 1))
+
+        with self._stats_lock:
+            self.records_failed += len(pending)
+            self.batches_sent += 1
+            self.flush_latencies.append(time.monotonic() - started_at)
+
+    def _put_batch(self, records):
+        try:
+            response = self.client.put_record_batch(
+                DeliveryStreamName=self.delivery_stream_name,
+                Records=[{'Data': data} for data in records]
+            )
+        except self.client.exceptions.ServiceUnavailableException:
+            return records
+        if response['FailedPutCount'] == 0:
+            return []
+        return [data for data, result in zip(records, response['RequestResponses']) if 'ErrorCode' in result]
+
+
+class KinesisProducer(FirehoseProducer):
+    # Batching, lingering and retries are the Firehose producer's, only the request differs. PutRecords takes the
+    # same 500 records per request and fits the 4 MiB batches under its 5 MiB limit.
+
+    def __init__(self, stream_name, client=None, **kwargs):
+        super().__init__(stream_name, client=client or boto3.client('kinesis'), **kwargs)
+        self.stream_name = stream_name
+
+    def _put_batch(self, records):
+        try:
+            response = self.client.put_records(
+                StreamName=self.stream_name,
+                # A key derived from the data spreads records over the shards and stays the same on every retry.
+                Records=[{'Data': data, 'PartitionKey': hashlib.md5(data).hexdigest()} for data in records]
+            )
+        except self.client.exceptions.ProvisionedThroughputExceededException:
+            return records
+        if response['FailedRecordCount'] == 0:
+            return []
+        return [data for data, result in zip(records, response['Records']) if 'ErrorCode' in result]
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
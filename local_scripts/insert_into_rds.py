@@ -1,37 +1,257 @@
-import psycopg2
-from datetime import datetime
+import argparse
+import io
+import itertools
 import os
-from random import choice
+import random
+import threading
 import time
+from datetime import datetime
+
+import psycopg2
+from psycopg2.extras import execute_values
+from psycopg2.pool import ThreadedConnectionPool
+from firehose_producer import percentile
+
+products = {'casa': 500000.00, 'carro': 69900.00, 'moto': 7900.00, 'caminhao': 230000.00, 'laranja': 0.5, 'borracha': 0.3, 'iphone': 1000000.00}
 
 dsn = 'dbname={dbname} ' \
       'user={user} ' \
       'password={password} ' \
       'port={port} ' \
-      'host={host} '.format(dbname='orders',
+      'host={host} '.format(dbname=os.environ.get('dbname', 'orders'),
                             user=os.environ['user'],
                             password=os.environ['password'],
-                            port=5432,
+                            port=os.environ.get('port', 5432),
                             host=os.environ['host'])
 
-conn = psycopg2.connect(dsn)
-print('connected')
-conn.set_session(autocommit=True)
-cur = conn.cursor()
-cur.execute('drop table if exists orders;')
-cur.execute('create table if not exists orders('
-            'created_at timestamp,'
-            'order_id integer,'
-            'product_name varchar(100),'
-            'value float);')
 
-products = {'casa': 500000.00, 'carro': 69900.00, 'moto': 7900.00, 'caminhao': 230000.00, 'laranja': 0.5, 'borracha': 0.3, 'iphone': 1000000.00}
-idx = 0
-
-while True:
-    print(idx)
-    idx += 1
-    created_at = datetime.now().isoformat()
-    product_name, value = choice(list(products.items()))
-    cur.execute(f"insert into orders values ('{created_at}', {idx}, '{product_name}', {value})")
-    time.sleep(0.5)
+def reset_table(conn):
+    with conn.cursor() as cur:
+        cur.execute('drop table if exists orders;')
+        cur.execute('create table if not exists orders('
+                    'created_at timestamp,'
+                    'order_id integer primary key,'
+                    'product_name varchar(100),'
+                    'value float);')
+    conn.commit()
+
+
+def max_order_id(conn):
+    with conn.cursor() as cur:
+        cur.execute('select coalesce(max(order_id), 0) from orders')
+        return cur.fetchone()[0]
+
+
+def random_ids(max_id, count):
+    return {random.randint(1, max_id) for _ in range(count)}
+
+
+def new_order(order_id):
+    product_name, value = random.choice(list(products.items()))
+    return datetime.now(), order_id, product_name, value
+
+
+class OrderGenerator:
+
+    def __init__(self, pool, workers, batch_size, rate, update_ratio, delete_ratio, method):
+        self.pool = pool
+        self.workers = workers
+        self.batch_size = batch_size
+        self.rate = rate
+        self.update_ratio = update_ratio
+        self.delete_ratio = delete_ratio
+        self.method = method
+
+        self.order_ids = itertools.count(1)
+        self.max_order_id = 0
+        self.rows = {'insert': 0, 'update': 0, 'delete': 0}
+        self.commit_latencies = []
+        self.rolled_back = 0
+        self.errors = 0
+        self.first_error = None
+        self.lock = threading.Lock()
+        self.stop = threading.Event()
+
+    def run(self, duration_seconds, report_every_seconds=5):
+        threads = [threading.Thread(target=self.worker, daemon=True) for _ in range(self.workers)]
+        started_at = time.monotonic()
+        for thread in threads:
+            thread.start()
+
+        last_report_at, last_rows = started_at, 0
+        while not self.stop.wait(report_every_seconds):
+            now = time.monotonic()
+            rows = self.total_rows()
+            print(f'{rows:,} rows, {(rows - last_rows) / (now - last_report_at):,.0f} rows/s, '
+                  f'{self.errors} failed batches')
+            last_report_at, last_rows = now, rows
+            if duration_seconds and now - started_at >= duration_seconds:
+                self.stop.set()
+
+        for thread in threads:
+            thread.join()
+        return self.report(time.monotonic() - started_at)
+
+    def worker(self):
+        conn = self.pool.getconn()
+        worker_rate = self.rate / self.workers if self.rate else 0
+        started_at = time.monotonic()
+        sent = 0
+        try:
+            while not self.stop.is_set():
+                if worker_rate:
+                    wait = started_at + sent / worker_rate - time.monotonic()
+                    if wait > 0:
+                        time.sleep(wait)
+                # Paced on attempted batches, so a failing batch waits its turn instead of retrying in a tight loop.
+                self.write_batch(conn)
+                sent += self.batch_size
+        finally:
+            self.pool.putconn(conn)
+
+    def write_batch(self, conn):
+        updates = int(self.batch_size * self.update_ratio)
+        deletes = int(self.batch_size * self.delete_ratio)
+        with self.lock:
+            existing = self.max_order_id
+            if not existing:
+                updates = deletes = 0
+            inserts = self.batch_size - updates - deletes
+            orders = [new_order(next(self.order_ids)) for _ in range(inserts)]
+            self.max_order_id = max([existing] + [order[1] for order in orders])
+
+        try:
+            commit_latency, updated, deleted = self.execute_batch(conn, orders, existing, updates, deletes)
+        except psycopg2.extensions.TransactionRollbackError:
+            conn.rollback()
+            with self.lock:
+                self.rolled_back += 1
+            return 0
+        except Exception as error:
+            # Any other failure is counted and reported, a worker whose connection is gone stops the whole run
+            # rather than leaving the others to report a lower rate.
+            if not conn.closed:
+                conn.rollback()
+            with self.lock:
+                self.errors += 1
+                if self.first_error is None:
+                    self.first_error = repr(error)
+                    print(f'batch failed: {error!r}')
+            if conn.closed:
+                self.stop.set()
+            return 0
+
+        # Random ids repeat and may point at deleted orders, the counts are the rows the statements touched.
+        with self.lock:
+            self.rows['insert'] += inserts
+            self.rows['update'] += updated
+            self.rows['delete'] += deleted
+            self.commit_latencies.append(commit_latency)
+        return inserts + updated + deleted
+
+    def execute_batch(self, conn, orders, existing, updates, deletes):
+        updated = deleted = 0
+        with conn.cursor() as cur:
+            if self.method == 'copy':
+                self.copy_orders(cur, orders)
+            else:
+                execute_values(cur, 'insert into orders (created_at, order_id, product_name, value) values %s',
+                               orders, page_size=len(orders) or 1)
+            if updates:
+                execute_values(
+                    cur,
+                    'update orders set product_name = data.product_name, value = data.value '
+                    'from (values %s) as data(order_id, product_name, value) '
+                    'where orders.order_id = data.order_id',
+                    [new_order(order_id)[1:] for order_id in sorted(random_ids(existing, updates))],
+                    page_size=updates
+                )
+                updated = cur.rowcount
+            if deletes:
+                cur.execute('delete from orders where order_id = any(%s)', (sorted(random_ids(existing, deletes)),))
+                deleted = cur.rowcount
+
+            commit_started_at = time.monotonic()
+            conn.commit()
+            return time.monotonic() - commit_started_at, updated, deleted
+
+    @staticmethod
+    def copy_orders(cur, orders):
+        buffer = io.StringIO()
+        for created_at, order_id, product_name, value in orders:
+            buffer.write(f'{created_at.isoformat()}\t{order_id}\t{product_name}\t{value}\n')
+        buffer.seek(0)
+        cur.copy_expert('copy orders (created_at, order_id, product_name, value) from stdin', buffer)
+
+    def total_rows(self):
+        with self.lock:
+            return sum(self.rows.values())
+
+    def report(self, elapsed):
+        latencies = sorted(latency * 1000 for latency in self.commit_latencies)
+        result = dict(self.rows)
+        result['rows_per_second'] = self.total_rows() / elapsed
+        result['commits'] = len(latencies)
+        result['rolled_back'] = self.rolled_back
+        result['errors'] = self.errors
+        if self.first_error:
+            result['first_error'] = self.first_error
+        result['p50_commit_latency_ms'] = percentile(latencies, 50)
+        result['p99_commit_latency_ms'] = percentile(latencies, 99)
+        return result
+
+
+def trickle(conn):
+    conn.set_session(autocommit=True)
+    cur = conn.cursor()
+    for idx in itertools.count(max_order_id(conn) + 1):
+        print(idx)
+        cur.execute('insert into orders values (%s, %s, %s, %s)', new_order(idx))
+        time.sleep(0.5)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate orders on the RDS source used by DMS CDC.')
+    parser.add_argument('--mode', choices=['trickle', 'bulk'], default='trickle')
+    parser.add_argument('--rate', type=float, default=0, help='target rows/s across all connections, 0 for flat out')
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--connections', type=int, default=4)
+    parser.add_argument('--update-ratio', type=float, default=0.0)
+    parser.add_argument('--delete-ratio', type=float, default=0.0,
+                        help='exercises the source only, DMS replicates with cdcInsertsAndUpdates=true so deletes '
+                             'never reach the data lake')
+    parser.add_argument('--method', choices=['copy', 'values'], default='copy')
+    parser.add_argument('--duration', type=int, default=60, help='seconds to run in bulk mode, 0 to run forever')
+    parser.add_argument('--keep-table', action='store_true', help='do not drop and recreate the orders table')
+    args = parser.parse_args()
+
+    if args.update_ratio + args.delete_ratio >= 1:
+        parser.error('--update-ratio plus --delete-ratio must be lower than 1')
+
+    conn = psycopg2.connect(dsn)
+    print('connected')
+    if not args.keep_table:
+        reset_table(conn)
+
+    if args.mode == 'trickle':
+        trickle(conn)
+        return
+    conn.close()
+
+    pool = ThreadedConnectionPool(args.connections, args.connections, dsn)
+    try:
+        generator = OrderGenerator(pool, args.connections, args.batch_size, args.rate,
+                                   args.update_ratio, args.delete_ratio, args.method)
+        if args.keep_table:
+            conn = pool.getconn()
+            generator.max_order_id = max_order_id(conn)
+            generator.order_ids = itertools.count(generator.max_order_id + 1)
+            conn.rollback()
+            pool.putconn(conn)
+        print(generator.run(args.duration))
+    finally:
+        pool.closeall()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,236 @@
+import json
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from urllib.parse import urlparse
+
+import boto3
+
+MAX_RECORDS_PER_CALL = 10000
+MIN_POLL_SECONDS = 0.2
+
+
+class Checkpoint(ABC):
+    # Last processed sequence number per shard. Shards read to their end are marked closed, so their children start.
+    # Each shard has its own entry, written by the worker owning it and read again by the workers owning its
+    # children, so the workers of a stream share one checkpoint.
+
+    def get(self, shard_id):
+        return (self._load(shard_id) or {}).get('sequence_number')
+
+    def closed(self, shard_id):
+        return (self._load(shard_id) or {}).get('closed', False)
+
+    def put(self, shard_id, sequence_number, closed=False):
+        self._save(shard_id, json.dumps({'sequence_number': sequence_number, 'closed': closed}, indent=2,
+                                        sort_keys=True))
+
+    @abstractmethod
+    def _load(self, shard_id):
+        pass
+
+    @abstractmethod
+    def _save(self, shard_id, body):
+        pass
+
+
+class FileCheckpoint(Checkpoint):
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def path(self, shard_id):
+        return os.path.join(self.directory, f'{shard_id}.json')
+
+    def _load(self, shard_id):
+        if not os.path.exists(self.path(shard_id)):
+            return None
+        with open(self.path(shard_id)) as file:
+            return json.load(file)
+
+    def _save(self, shard_id, body):
+        os.makedirs(self.directory, exist_ok=True)
+        with open(f'{self.path(shard_id)}.tmp', 'w') as file:
+            file.write(body)
+        os.replace(f'{self.path(shard_id)}.tmp', self.path(shard_id))
+
+
+class S3Checkpoint(Checkpoint):
+
+    def __init__(self, uri, client=None):
+        parsed = urlparse(uri)
+        self.bucket = parsed.netloc
+        self.prefix = parsed.path.strip('/')
+        self.client = client or boto3.client('s3')
+
+    def key(self, shard_id):
+        return f'{self.prefix}/{shard_id}.json' if self.prefix else f'{shard_id}.json'
+
+    def _load(self, shard_id):
+        try:
+            return json.loads(self.client.get_object(Bucket=self.bucket, Key=self.key(shard_id))['Body'].read())
+        except self.client.exceptions.NoSuchKey:
+            return None
+
+    def _save(self, shard_id, body):
+        self.client.put_object(Bucket=self.bucket, Key=self.key(shard_id), Body=body.encode('utf-8'))
+
+
+class KinesisConsumer:
+
+    def __init__(self, stream_name, handler, checkpoint, client=None, initial_position='TRIM_HORIZON',
+                 max_records=1000, poll_seconds=1.0, shard_refresh_seconds=60, worker_index=0, worker_count=1,
+                 backoff_seconds=0.5, max_backoff_seconds=10.0):
+        self.stream_name = stream_name
+        self.handler = handler
+        self.checkpoint = checkpoint
+        self.client = client or boto3.client('kinesis')
+        self.initial_position = initial_position
+        self.max_records = min(max_records, MAX_RECORDS_PER_CALL)
+        self.poll_seconds = max(poll_seconds, MIN_POLL_SECONDS)
+        self.shard_refresh_seconds = shard_refresh_seconds
+        self.worker_index = worker_index
+        self.worker_count = worker_count
+        self.backoff_seconds = backoff_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+
+        self.records_received = 0
+        self.events_received = 0
+        self.batches_processed = 0
+        self.throttles = 0
+        self.millis_behind_latest = {}
+
+        self._stats_lock = threading.Lock()
+        self._threads = {}
+        self._errors = []
+        self._closed = threading.Event()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def run(self, duration_seconds=None):
+        # Every shard gets its own reader thread, so a slow shard never holds back the others. Shards are listed
+        # again periodically to pick up the children of a resharding once their parents are read to the end.
+        started_at = time.monotonic()
+        while not self._closed.is_set():
+            started = self._start_readers()
+            alive = self._alive()
+            if not started and not alive:
+                # Every shard of this worker is read to its end, the stream was deleted or resharded away.
+                break
+            deadline = time.monotonic() + self.shard_refresh_seconds
+            while time.monotonic() < deadline and self._alive() == alive and not self._errors:
+                if duration_seconds is not None and time.monotonic() - started_at >= duration_seconds:
+                    self._closed.set()
+                    break
+                self._closed.wait(min(self.poll_seconds, 1.0))
+            if self._errors:
+                self._closed.set()
+        for thread in self._threads.values():
+            thread.join()
+        if self._errors:
+            raise self._errors[0]
+
+    def close(self):
+        self._closed.set()
+
+    def stats(self):
+        return {
+            'records_received': self.records_received,
+            'events_received': self.events_received,
+            'batches_processed': self.batches_processed,
+            'throttles': self.throttles,
+            'shards': len(self._threads),
+            'max_millis_behind_latest': max(self.millis_behind_latest.values(), default=0),
+        }
+
+    def _list_shards(self):
+        shards = []
+        kwargs = {'StreamName': self.stream_name}
+        while True:
+            response = self.client.list_shards(**kwargs)
+            shards += response['Shards']
+            if not response.get('NextToken'):
+                return shards
+            kwargs = {'NextToken': response['NextToken']}
+
+    def _owns(self, shard_id):
+        return int(shard_id.split('-')[-1]) % self.worker_count == self.worker_index
+
+    def _alive(self):
+        return sum(thread.is_alive() for thread in self._threads.values())
+
+    def _start_readers(self):
+        shards = self._list_shards()
+        listed = {shard['ShardId'] for shard in shards}
+        started = 0
+        for shard in shards:
+            shard_id = shard['ShardId']
+            if shard_id in self._threads or not self._owns(shard_id) or self.checkpoint.closed(shard_id):
+                continue
+            # Records of a parent come first, parents past the retention period are no longer listed.
+            parents = [shard.get(key) for key in ('ParentShardId', 'AdjacentParentShardId') if shard.get(key)]
+            if any(parent in listed and not self.checkpoint.closed(parent) for parent in parents):
+                continue
+            thread = threading.Thread(target=self._read, args=(shard_id,), name=shard_id, daemon=True)
+            self._threads[shard_id] = thread
+            thread.start()
+            started += 1
+        return started
+
+    def _iterator(self, shard_id):
+        sequence_number = self.checkpoint.get(shard_id)
+        if sequence_number:
+            kwargs = {'ShardIteratorType': 'AFTER_SEQUENCE_NUMBER', 'StartingSequenceNumber': sequence_number}
+        else:
+            kwargs = {'ShardIteratorType': self.initial_position}
+        return self.client.get_shard_iterator(StreamName=self.stream_name, ShardId=shard_id,
+                                              **kwargs)['ShardIterator']
+
+    def _read(self, shard_id):
+        try:
+            iterator = self._iterator(shard_id)
+            backoff = self.backoff_seconds
+            while iterator and not self._closed.is_set():
+                try:
+                    response = self.client.get_records(ShardIterator=iterator, Limit=self.max_records)
+                except self.client.exceptions.ProvisionedThroughputExceededException:
+                    with self._stats_lock:
+                        self.throttles += 1
+                    self._closed.wait(backoff)
+                    backoff = min(backoff * 2, self.max_backoff_seconds)
+                    continue
+                except self.client.exceptions.ExpiredIteratorException:
+                    iterator = self._iterator(shard_id)
+                    continue
+                backoff = self.backoff_seconds
+
+                records = response['Records']
+                events = decode(records)
+                if records:
+                    # The checkpoint only moves after the handler returns, so a failed batch is read again.
+                    self.handler(shard_id, events)
+                    self.checkpoint.put(shard_id, records[-1]['SequenceNumber'])
+                with self._stats_lock:
+                    self.records_received += len(records)
+                    self.events_received += len(events)
+                    self.batches_processed += bool(records)
+                    self.millis_behind_latest[shard_id] = response.get('MillisBehindLatest', 0)
+
+                iterator = response.get('NextShardIterator')
+                if iterator and not response.get('MillisBehindLatest'):
+                    self._closed.wait(self.poll_seconds)
+
+            if iterator is None:
+                self.checkpoint.put(shard_id, self.checkpoint.get(shard_id), closed=True)
+        except Exception as error:
+            self._errors.append(error)
+
+
+def decode(records):
+    # Producers may aggregate several newline delimited events into one record.
+    return [json.loads(line) for record in records for line in record['Data'].splitlines() if line.strip()]
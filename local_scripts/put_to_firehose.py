@@ -1,24 +1,35 @@
-import boto3
-import json
-from fake_web_events import Simulation
-
-client = boto3.client('firehose')
-
+# execute from the repository root: PYTHONPATH=bootcamp_data_platform python local_scripts/put_to_firehose.py
+import argparse
 
-def put_record(event):
-    data = json.dumps(event) + '\n'
-    print(data)
-    response = client.put_record(
-        DeliveryStreamName='firehose-production-raw-delivery-stream',
-        Record={
-            'Data': data
-        }
-    )
-    return response
+import naming
+from fake_web_events import Simulation
+from firehose_producer import FirehoseProducer, KinesisProducer
+from instrumentation import SINKS, Instrumentation
 
+parser = argparse.ArgumentParser(description='Send simulated web events to the raw Firehose delivery stream.')
+parser.add_argument('--environment', default='production')
+parser.add_argument('--metrics', choices=SINKS, default='cloudwatch')
+parser.add_argument('--metrics-path', help='json lines file of the local sink, defaults to stdout')
+parser.add_argument('--stream', action='store_true',
+                    help='put to the Kinesis stream in front of the Firehose, required when the environment has one')
+args = parser.parse_args()
 
 simulation = Simulation(user_pool_size=100, sessions_per_day=10000)
 events = simulation.run(duration_seconds=600)
 
-for event in events:
-    put_record(event)
\ No newline at end of file
+with Instrumentation.create(args.metrics, args.environment, 'put_to_firehose', args.metrics_path) as instrumentation:
+    with instrumentation.stage('firehose_put') as stage:
+        if args.stream:
+            producer = KinesisProducer(naming.kinesis_stream(args.environment))
+        else:
+            producer = FirehoseProducer(naming.firehose_delivery_stream(args.environment))
+        with producer:
+            for event in events:
+                producer.put(event)
+        stats = producer.stats()
+        stage.rows = stats['records_sent']
+        stage.bytes = stats['bytes_sent']
+    instrumentation.record('RecordsFailed', stats['records_failed'], stage='firehose_put')
+    instrumentation.record('FlushLatencyP99', stats['p99_flush_latency_ms'], 'Milliseconds', 'firehose_put')
+
+print(stats)
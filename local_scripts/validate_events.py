@@ -0,0 +1,23 @@
+import argparse
+import sys
+
+from fake_web_events import Simulation
+from schemas import ATOMIC_EVENTS
+
+parser = argparse.ArgumentParser(description='Validate sample events against the atomic events schema.')
+parser.add_argument('--events', type=int, default=1000)
+args = parser.parse_args()
+
+simulation = Simulation(user_pool_size=100, sessions_per_day=10000)
+invalid = 0
+
+for idx, event in enumerate(simulation.run(duration_seconds=3600)):
+    if idx >= args.events:
+        break
+    errors = ATOMIC_EVENTS.validate(event)
+    if errors:
+        invalid += 1
+        print(event, errors)
+
+print(f'{invalid} of {args.events} events do not match {ATOMIC_EVENTS.name} schema v{ATOMIC_EVENTS.version}')
+sys.exit(1 if invalid else 0)
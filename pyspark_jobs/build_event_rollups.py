@@ -0,0 +1,135 @@
+import re
+from datetime import datetime, timezone
+
+import boto3
+from pyspark.sql import Window, functions as F
+from job_context import JobContext
+from layout import ParquetLayout
+from partition_registrar import PartitionRegistrar
+from partitions import FileCheckpoint, HadoopFileSystem
+from schemas import FUNNEL_DAILY, PAGE_VIEWS_HOURLY, SESSIONS_DAILY
+
+EVENT_DATE = re.compile(r'/event_date=(\d{4}-\d{2}-\d{2})/')
+FUNNEL_STEPS = ['/home', '/product_a|/product_b', '/cart', '/payment', '/confirmation']
+
+parser = JobContext.parser('Build curated rollups of the processed atomic events.')
+parser.add_argument('--source', help='defaults to atomic_events on the processed layer of the environment')
+parser.add_argument('--target', help='defaults to the curated layer of the environment')
+parser.add_argument('--checkpoint', help='defaults to _checkpoints/event_rollups.json on the curated layer')
+parser.add_argument('--session-timeout-minutes', type=int, default=30)
+parser.add_argument('--full-refresh', action='store_true', help='rebuild the rollups of every processed date')
+parser.add_argument('--glue-database', help='database of the curated tables to register the written partitions in')
+parser.add_argument('--glue-region', help='region of the Glue catalog, defaults to the boto3 configuration')
+args = parser.parse_args()
+context = JobContext.from_arguments(args)
+
+spark = context.spark('event_rollups', {'spark.sql.sources.partitionColumnTypeInference.enabled': 'false'})
+instrumentation = context.instrumentation('build_event_rollups')
+
+source = args.source or context.uri('processed', 'atomic_events')
+target = (args.target or context.uri('curated')).rstrip('/')
+glue = boto3.client('glue', region_name=args.glue_region) if args.glue_database else None
+
+
+def page_views_hourly(events):
+    return events\
+        .groupBy('event_date', 'event_hour', 'page_url_path', 'device_type')\
+        .agg(F.count('*').alias('page_views'), F.countDistinct('user_domain_id').alias('users'))
+
+
+def sessions_daily(events):
+    # Sessions are cut at midnight, so each day is rebuilt from its own partitions only.
+    by_user = Window.partitionBy('event_date', 'user_domain_id').orderBy('timestamp')
+    sessions = events\
+        .withColumn('timestamp', F.to_timestamp('event_timestamp'))\
+        .withColumn('gap', F.col('timestamp').cast('long') - F.lag(F.col('timestamp').cast('long')).over(by_user))\
+        .withColumn('new_session', F.when(F.col('gap').isNull() | (F.col('gap') > args.session_timeout_minutes * 60), 1)
+                    .otherwise(0))\
+        .withColumn('session_index', F.sum('new_session').over(by_user))\
+        .groupBy('event_date', 'user_domain_id', 'session_index')\
+        .agg(
+            F.first('device_type').alias('device_type'),
+            F.first('utm_source').alias('utm_source'),
+            F.count('*').alias('page_views'),
+            (F.max('timestamp').cast('double') - F.min('timestamp').cast('double')).alias('session_seconds')
+        )
+
+    return sessions\
+        .groupBy('event_date', 'device_type', 'utm_source')\
+        .agg(
+            F.count('*').alias('sessions'),
+            F.countDistinct('user_domain_id').alias('users'),
+            F.sum(F.when(F.col('page_views') == 1, 1).otherwise(0)).cast('bigint').alias('bounces'),
+            F.sum('page_views').cast('bigint').alias('page_views'),
+            F.sum('session_seconds').alias('session_seconds')
+        )
+
+
+def funnel_daily(events):
+    steps = F.create_map(*[value for order, step in enumerate(FUNNEL_STEPS, start=1)
+                           for path in step.split('|') for value in (F.lit(path), F.lit(order))])
+    reached = events\
+        .withColumn('step_order', steps[F.col('page_url_path')])\
+        .where(F.col('step_order').isNotNull())\
+        .groupBy('event_date', 'user_domain_id')\
+        .agg(F.max('step_order').alias('reached'))
+
+    step_names = spark.createDataFrame(
+        [(order, step.replace('|', ' or ')) for order, step in enumerate(FUNNEL_STEPS, start=1)], 'step_order int, step string')
+    return reached\
+        .crossJoin(F.broadcast(step_names))\
+        .where(F.col('reached') >= F.col('step_order'))\
+        .groupBy('event_date', 'step_order', 'step')\
+        .agg(F.count('*').alias('users'))
+
+
+ROLLUPS = [
+    (PAGE_VIEWS_HOURLY, page_views_hourly, ['event_hour', 'page_url_path']),
+    (SESSIONS_DAILY, sessions_daily, ['device_type', 'utm_source']),
+    (FUNNEL_DAILY, funnel_daily, ['step_order']),
+]
+
+checkpoint = FileCheckpoint(spark, args.checkpoint or context.uri('curated', '_checkpoints', 'event_rollups.json'))
+if args.full_refresh:
+    checkpoint.watermark, checkpoint.files_at_watermark = 0, []
+
+if context.range:
+    # Rollups are daily, so a backfill slice rebuilds every date it touches and leaves the checkpoint alone.
+    pending = {}
+    dates = context.range.dates()
+else:
+    pending = checkpoint.pending(source, recursive=True)
+    dates = sorted({match.group(1) for match in map(EVENT_DATE.search, pending) if match})
+print(f'{len(pending)} new processed files, {len(dates)} dates to rebuild')
+
+if dates:
+    events = spark.read.parquet(source)\
+        .where(F.col('event_date').isin(dates))\
+        .withColumn('event_hour', F.col('event_hour').cast('int'))\
+        .select('event_date', 'event_hour', 'event_timestamp', 'page_url_path', 'device_type', 'utm_source',
+                'user_domain_id')\
+        .cache()
+
+    target_fs = HadoopFileSystem(spark, target)
+    for schema, build, sort_by in ROLLUPS:
+        layout = ParquetLayout(partition_by=[key.name for key in schema.partition_keys], sort_by=sort_by,
+                               target_file_mb=64)
+        rollup = build(events).select(*[F.col(field.name).cast(field.type) for field in schema.fields], *layout.partition_by)
+        with instrumentation.stage(schema.name):
+            layout.write(rollup, f'{target}/{schema.name}')
+        with_rows = {tuple(map(str, row)) for row in rollup.select(*layout.partition_by).distinct().collect()}
+        target_fs.delete_stale_partitions(f'{target}/{schema.name}', layout.partition_by,
+                                          [(date,) for date in dates], with_rows)
+        print(f'{schema.name} rebuilt for {len(dates)} dates')
+
+        if glue:
+            written = [(date,) for date in dates if target_fs.exists(f'{target}/{schema.name}/event_date={date}')]
+            registrar = PartitionRegistrar(glue, args.glue_database, schema.name)
+            print(f'{len(registrar.register(written))} partitions registered in {args.glue_database}.{schema.name}')
+
+    if pending:
+        # Modification time of the newest processed file rolled up, so the lag covers the wait for this job.
+        instrumentation.lag(datetime.fromtimestamp(max(pending.values()) / 1000, timezone.utc), 'rollups')
+    if not context.range:
+        checkpoint.commit(pending)
+    instrumentation.flush()
@@ -0,0 +1,95 @@
+import re
+from datetime import datetime, timezone
+
+import boto3
+from pyspark.sql import functions as F
+from job_context import JobContext
+from layout import ParquetLayout
+from partition_registrar import PartitionRegistrar
+from partitions import FileCheckpoint, HadoopFileSystem
+from schemas import REVENUE_BY_PRODUCT_DAILY
+
+ORDER_RANGE = re.compile(r'/order_range=(\d+)/')
+
+parser = JobContext.parser('Build the curated revenue rollup of the current state of orders.')
+parser.add_argument('--source', help='defaults to orders on the processed layer of the environment')
+parser.add_argument('--tombstones', help='defaults to _tombstones/orders on the processed layer')
+parser.add_argument('--target', help='defaults to the curated layer of the environment')
+parser.add_argument('--checkpoint', help='defaults to _checkpoints/revenue_rollups.json on the curated layer')
+parser.add_argument('--full-refresh', action='store_true', help='rebuild the rollup of every order date')
+parser.add_argument('--glue-database', help='database of the curated tables to register the written partitions in')
+parser.add_argument('--glue-region', help='region of the Glue catalog, defaults to the boto3 configuration')
+args = parser.parse_args()
+context = JobContext.from_arguments(args)
+
+spark = context.spark('revenue_rollups')
+instrumentation = context.instrumentation('build_revenue_rollups')
+
+source = args.source or context.uri('processed', 'orders')
+tombstones = args.tombstones or context.uri('processed', '_tombstones', 'orders')
+tombstones_fs = HadoopFileSystem(spark, tombstones)
+target = (args.target or context.uri('curated')).rstrip('/')
+
+checkpoint = FileCheckpoint(spark, args.checkpoint or context.uri('curated', '_checkpoints', 'revenue_rollups.json'))
+if args.full_refresh:
+    checkpoint.watermark, checkpoint.files_at_watermark = 0, []
+
+if context.range:
+    pending = {}
+    ranges = []
+    print(f'rebuilding the order dates from {context.range.start:%Y-%m-%d} to {context.range.end:%Y-%m-%d}')
+else:
+    pending = checkpoint.pending(source, recursive=True)
+    # Deleting the orders of a range writes its tombstones, whether or not orders remain in the range.
+    if tombstones_fs.exists(tombstones):
+        pending.update(checkpoint.pending(tombstones, recursive=True))
+    ranges = sorted({int(match.group(1)) for match in map(ORDER_RANGE.search, pending) if match})
+    print(f'{len(pending)} new order files, {len(ranges)} order ranges changed')
+
+if context.range or ranges:
+    orders = spark.read.parquet(source)\
+        .withColumn('order_date', F.date_format('created_at', 'yyyy-MM-dd'))
+
+    if context.range:
+        dates = context.range.dates()
+    else:
+        # A changed order range can hold orders of any date, and a date can hold orders of any range, so the dates
+        # touched by the changed ranges are rebuilt from the whole table.
+        touched = orders.where(F.col('order_range').isin(ranges)).select('order_date')
+        if tombstones_fs.exists(tombstones) and tombstones_fs.list_files(tombstones, recursive=True):
+            touched = touched.union(spark.read.parquet(tombstones).where(F.col('order_range').isin(ranges))
+                                    .select(F.date_format('created_at', 'yyyy-MM-dd').alias('order_date')))
+        dates = [row.order_date for row in touched.distinct().collect() if row.order_date]
+    print(f'{len(dates)} order dates to rebuild')
+
+    rollup = orders\
+        .where(F.col('order_date').isin(dates))\
+        .groupBy('order_date', 'product_name')\
+        .agg(F.count('*').alias('orders'), F.sum('value').alias('revenue'))
+
+    layout = ParquetLayout(partition_by=[key.name for key in REVENUE_BY_PRODUCT_DAILY.partition_keys],
+                           sort_by=['product_name'], target_file_mb=64)
+    with instrumentation.stage(REVENUE_BY_PRODUCT_DAILY.name):
+        layout.write(
+            rollup.select(*[F.col(field.name).cast(field.type) for field in REVENUE_BY_PRODUCT_DAILY.fields],
+                          *layout.partition_by),
+            f'{target}/{REVENUE_BY_PRODUCT_DAILY.name}'
+        )
+    target_fs = HadoopFileSystem(spark, target)
+    with_rows = {(row.order_date,) for row in rollup.select('order_date').distinct().collect()}
+    target_fs.delete_stale_partitions(f'{target}/{REVENUE_BY_PRODUCT_DAILY.name}', layout.partition_by,
+                                      [(date,) for date in dates], with_rows)
+
+    if args.glue_database:
+        written = [(date,) for date in sorted(dates)
+                   if target_fs.exists(f'{target}/{REVENUE_BY_PRODUCT_DAILY.name}/order_date={date}')]
+        registrar = PartitionRegistrar(boto3.client('glue', region_name=args.glue_region), args.glue_database,
+                                       REVENUE_BY_PRODUCT_DAILY.name)
+        print(f'{len(registrar.register(written))} partitions registered in '
+              f'{args.glue_database}.{REVENUE_BY_PRODUCT_DAILY.name}')
+
+    if pending:
+        instrumentation.lag(datetime.fromtimestamp(max(pending.values()) / 1000, timezone.utc), 'rollups')
+    if not context.range:
+        checkpoint.commit(pending)
+    instrumentation.flush()
@@ -1,11 +1,217 @@
-from pyspark.sql import SparkSession
+# execute with run_jobs.py, which submits it to EMR or runs it locally
+from datetime import datetime, timedelta, timezone
 
-spark = SparkSession.builder\
-    .appName('raw_to_processed')\
-    .config("hive.metastore.connect.retries", 5)\
-    .config("hive.metastore.client.factory.class", "com.amazonaws.glue.catalog.metastore.AWSGlueDataCatalogHiveClientFactory")\
-    .enableHiveSupport()\
-    .getOrCreate()
+import boto3
+from pyspark import StorageLevel
+from pyspark.sql import functions as F
+from instrumentation import BYTES, DUPLICATE_RATE, QUALITY_CHECKS_FAILED, ROWS
+from job_context import JobContext
+from layout import ATOMIC_EVENTS_LAYOUT, ParquetLayout
+from partition_registrar import PartitionRegistrar
+from partitions import HadoopFileSystem, KeyIndex, Partition, PartitionCheckpoint
+from quality import CORRUPT_RECORD, QualityCheck
+from schemas import ATOMIC_EVENTS, ATOMIC_EVENTS_QUALITY
 
-df = spark.read.format('json').load('s3://s3-belisco-production-data-lake-raw/atomic_events')
-df.write.format('parquet').save('s3://s3-belisco-production-data-lake-processed/atomic_events')
+MAX_NULL_RATES = {'user_domain_id': 0.01, 'page_url_path': 0.01, 'device_type': 0.05}
+
+parser = JobContext.parser('Convert raw atomic events to parquet on the processed layer.')
+parser.add_argument('--source', help='defaults to atomic_events on the raw layer of the environment')
+parser.add_argument('--target', help='defaults to atomic_events on the processed layer of the environment')
+parser.add_argument('--checkpoint', help='defaults to _checkpoints/atomic_events.json on the processed layer')
+parser.add_argument('--source-format', choices=['json', 'parquet'], default='json',
+                    help='parquet when Firehose record format conversion is enabled')
+parser.add_argument('--full-refresh', action='store_true', help='reprocess every raw partition, ignoring the checkpoint')
+parser.add_argument('--max-lateness-hours', type=int, default=1,
+                    help='events arriving later than this are written to the partition of arrival hour minus lateness')
+parser.add_argument('--quarantine', help='defaults to _quarantine/atomic_events on the processed layer')
+parser.add_argument('--quality-target', help='defaults to atomic_events_quality on the curated layer')
+parser.add_argument('--max-quarantine-rate', type=float, default=0.01)
+parser.add_argument('--max-duplicate-rate', type=float, help='fail the quality check above this share of duplicates')
+parser.add_argument('--event-id-index', help='defaults to _indexes/atomic_events_event_id on the processed layer')
+parser.add_argument('--dedupe-lookback-hours', type=int, default=24,
+                    help='drop events whose id was already written to a partition this many hours back, 0 to disable')
+parser.add_argument('--max-delay-hours', type=int,
+                    help='longest accepted delay between an event and its arrival, defaults to lateness plus one hour')
+parser.add_argument('--fail-on-quality', action='store_true',
+                    help='exit with an error when a partition fails a quality threshold, after writing it')
+parser.add_argument('--glue-table', help='database.table to register the written partitions in')
+parser.add_argument('--glue-curated-database', help=f'database of the curated {ATOMIC_EVENTS_QUALITY.name} table to '
+                                                    'register the written quality partitions in')
+parser.add_argument('--glue-region', help='region of the Glue catalog, defaults to the boto3 configuration')
+# The processed table, its id index, quality metrics and Glue partitions are all by event date and hour, so only the
+# file layout within them is configurable.
+ParquetLayout.add_arguments(parser, default=ATOMIC_EVENTS_LAYOUT, partitioning=False)
+args = parser.parse_args()
+layout = ParquetLayout.from_arguments(args)
+context = JobContext.from_arguments(args)
+instrumentation = context.instrumentation('convert_to_parquet')
+
+spark = context.spark('raw_to_processed', {'spark.sql.sources.partitionColumnTypeInference.enabled': 'false'})
+
+source = (args.source or context.uri('raw', 'atomic_events')).rstrip('/')
+target = (args.target or context.uri('processed', 'atomic_events')).rstrip('/')
+quarantine = (args.quarantine or context.uri('processed', '_quarantine', 'atomic_events')).rstrip('/')
+event_ids = KeyIndex(spark, args.event_id_index or context.uri('processed', '_indexes', 'atomic_events_event_id'),
+                     'event_id')
+quality_target = (args.quality_target or context.uri('curated', ATOMIC_EVENTS_QUALITY.name)).rstrip('/')
+lateness = args.max_lateness_hours
+max_delay_hours = args.max_delay_hours if args.max_delay_hours is not None else lateness + 1
+source_fs = HadoopFileSystem(spark, source)
+
+checkpoint = PartitionCheckpoint(spark, args.checkpoint or context.uri('processed', '_checkpoints', 'atomic_events.json'))
+if args.full_refresh:
+    checkpoint.watermark, checkpoint.partitions = None, {}
+
+preceding = set()
+if context.range:
+    # A backfill slice rewrites exactly the event hours of its range, whatever the checkpoint says. Slices never
+    # write the same partitions and run side by side, so instead of the id index another slice may still be writing,
+    # the raw hours of the lookback are read along and only decide which copy of an event comes first.
+    pending = {partition: None for partition in map(Partition.from_datetime, context.range.hours())
+               if source_fs.exists(f'{source}/{partition.path}')}
+    affected = set(map(Partition.from_datetime, context.range.hours()))
+    preceding = {Partition.from_datetime(context.range.start - timedelta(hours=lag))
+                 for lag in range(1, args.dedupe_lookback_hours + 1)}
+else:
+    pending = checkpoint.pending(source)
+    # An event lands in raw hours [event hour, event hour + lateness], so rewriting the event hours touched by
+    # the new raw hours needs the neighbouring raw hours as well.
+    affected = {Partition.from_datetime(partition.hour_start - timedelta(hours=lag))
+                for partition in pending for lag in range(lateness + 1)}
+print(f'{len(pending)} raw partitions to process')
+
+if pending:
+    candidates = {Partition.from_datetime(partition.hour_start + timedelta(hours=lag))
+                  for partition in affected for lag in range(lateness + 1)}
+    to_read = [partition for partition in sorted(candidates | preceding)
+               if partition in pending or source_fs.exists(f'{source}/{partition.path}')]
+
+    # Files are loaded by path, so partitions nested below the hour by Firehose dynamic partitioning do not clash
+    # with event columns, and the arrival hour is taken from the file path.
+    statuses = [status for partition in to_read
+                for status in source_fs.list_published_files(f'{source}/{partition.path}')]
+    files = [status.getPath().toString() for status in statuses]
+    reader = spark.read.format(args.source_format)
+    if args.source_format == 'json':
+        # Records that do not parse into the schema keep their raw text here and are quarantined.
+        reader = reader\
+            .schema(f'{ATOMIC_EVENTS.ddl()}, `{CORRUPT_RECORD}` string')\
+            .option('columnNameOfCorruptRecord', CORRUPT_RECORD)
+    else:
+        reader = reader.schema(ATOMIC_EVENTS.ddl())
+    df = reader.load(files)
+
+    arrival_hour = F.to_timestamp(
+        F.regexp_extract(F.input_file_name(), r'year=(\d{4})/month=(\d{2})/day=(\d{2})/hour=(\d{2})', 0),
+        "'year='yyyy'/month='MM'/day='dd'/hour='HH"
+    )
+    partition_hour = F.least(
+        F.greatest(
+            F.coalesce(F.date_trunc('hour', F.to_timestamp('event_timestamp')), F.col('arrival_hour')),
+            F.col('arrival_hour') - F.expr(f'INTERVAL {lateness} HOURS')
+        ),
+        F.col('arrival_hour')
+    )
+
+    quality = QualityCheck(
+        ATOMIC_EVENTS,
+        partition_by=layout.partition_by,
+        unique_key='event_id',
+        timestamp_fields=['event_timestamp'],
+        max_null_rates=MAX_NULL_RATES,
+        max_quarantine_rate=args.max_quarantine_rate,
+        max_duplicate_rate=args.max_duplicate_rate
+    )
+    seen_event_ids = None
+    if args.dedupe_lookback_hours and not context.range:
+        seen_event_ids = event_ids.keys_before({partition.hour_start for partition in affected},
+                                               args.dedupe_lookback_hours)
+
+    def in_hours(partitions):
+        return F.date_format('partition_hour', 'yyyy/MM/dd/HH').isin(
+            [f'{partition.year}/{partition.month}/{partition.day}/{partition.hour}' for partition in partitions])
+
+    annotated = quality.annotate(
+        df
+        .withColumn('arrival_hour', arrival_hour)
+        .withColumn('partition_hour', partition_hour)
+        .where(in_hours(affected | preceding))
+        .withColumn('event_date', F.date_format('partition_hour', 'yyyy-MM-dd'))
+        .withColumn('event_hour', F.hour('partition_hour')),
+        order_by=['arrival_hour', 'event_timestamp'],
+        seen_keys=seen_event_ids
+    ).where(in_hours(affected)).persist(StorageLevel.MEMORY_AND_DISK)
+
+    # Valid rows, quarantined rows and metrics all come from the persisted rows, so the raw files are read once.
+    valid = quality.valid(annotated).drop('arrival_hour', 'partition_hour')
+    with instrumentation.stage('convert') as stage:
+        layout.write(valid, target)
+        event_ids.write(valid)
+        quarantined = quality.quarantined(annotated).drop('partition_hour')
+        quarantined.write.mode('overwrite').partitionBy(*layout.partition_by).parquet(quarantine)
+        partition_stats = valid\
+            .groupBy('event_date', 'event_hour')\
+            .agg(F.count('*').alias('rows'), F.max(F.to_timestamp('event_timestamp').cast('long')).alias('newest'))\
+            .collect()
+        stage.rows = sum(row.rows for row in partition_stats)
+        stage.bytes = sum(status.getLen() for status in statuses)
+
+    target_fs = HadoopFileSystem(spark, target)
+    for row in partition_stats:
+        partition = f'event_date={row.event_date}/event_hour={row.event_hour}'
+        instrumentation.record(ROWS, row.rows, stage='partition', partition=partition)
+        instrumentation.record(BYTES, target_fs.size(f'{target}/{partition}'), 'Bytes', 'partition', partition)
+        instrumentation.lag(datetime.fromtimestamp(row.newest, timezone.utc), 'partition', partition)
+    if partition_stats and not context.range:
+        # Time from the newest event to its availability in the processed layer, backfills are not freshness.
+        instrumentation.lag(datetime.fromtimestamp(max(row.newest for row in partition_stats), timezone.utc), 'convert')
+
+    delay_seconds = (F.col('arrival_hour').cast('long') + 3600) - F.to_timestamp('event_timestamp').cast('long')
+    metrics = quality.metrics(annotated, datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S'), extra=[
+        ('late_records', F.sum(F.when(F.col('partition_hour') < F.col('arrival_hour'), 1).otherwise(0)), None),
+        ('max_delay_seconds', F.max(delay_seconds), max_delay_hours * 3600),
+    ]).cache()
+    ParquetLayout(partition_by=layout.partition_by, sort_by=['metric'], target_file_mb=64)\
+        .write(metrics.select(*ATOMIC_EVENTS_QUALITY.field_names, *layout.partition_by), quality_target)
+
+    # Every affected hour is rebuilt, so the ones left without rows in an output lose their old files, which dynamic
+    # overwrite would keep.
+    rebuilt = [(f'{partition.year}-{partition.month}-{partition.day}', str(int(partition.hour)))
+               for partition in sorted(affected)]
+    for uri, df in [(target, valid), (event_ids.uri, valid), (quarantine, quarantined), (quality_target, metrics)]:
+        written = {tuple(map(str, row)) for row in df.select(*layout.partition_by).distinct().collect()}
+        HadoopFileSystem(spark, uri).delete_stale_partitions(uri, layout.partition_by, rebuilt, written)
+
+    failed = metrics.where(~F.col('passed')).orderBy(*layout.partition_by, 'metric').collect()
+    for row in failed:
+        print(f'quality check failed for event_date={row.event_date}/event_hour={row.event_hour}: '
+              f'{row.metric} {row.value} above {row.threshold}')
+    print(f'{len(failed)} quality checks failed')
+    totals = {row.metric: row.value for row in metrics.where(F.col('metric').isin('records', 'duplicate_records'))
+              .groupBy('metric').agg(F.sum('value').alias('value')).collect()}
+    instrumentation.record(QUALITY_CHECKS_FAILED, len(failed), stage='convert')
+    instrumentation.record(DUPLICATE_RATE, totals.get('duplicate_records', 0) / totals['records'] if totals.get('records')
+                           else 0, 'None', 'convert')
+    annotated.unpersist()
+
+    glue = boto3.client('glue', region_name=args.glue_region) if args.glue_table or args.glue_curated_database else None
+    if args.glue_table:
+        database, table = args.glue_table.split('.', 1)
+        written = [values for values in rebuilt
+                   if target_fs.exists(f'{target}/event_date={values[0]}/event_hour={values[1]}')]
+        registrar = PartitionRegistrar(glue, database, table)
+        print(f'{len(registrar.register(written))} partitions registered in {args.glue_table}')
+    if args.glue_curated_database:
+        quality_fs = HadoopFileSystem(spark, quality_target)
+        written = [values for values in rebuilt
+                   if quality_fs.exists(f'{quality_target}/event_date={values[0]}/event_hour={values[1]}')]
+        registrar = PartitionRegistrar(glue, args.glue_curated_database, ATOMIC_EVENTS_QUALITY.name)
+        print(f'{len(registrar.register(written))} partitions registered in '
+              f'{args.glue_curated_database}.{ATOMIC_EVENTS_QUALITY.name}')
+
+    if not context.range:
+        checkpoint.commit(pending)
+    instrumentation.flush()
+
+    if failed and args.fail_on_quality:
+        raise SystemExit(f'{len(failed)} quality checks failed')
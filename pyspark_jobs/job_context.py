@@ -0,0 +1,104 @@
+import argparse
+import os
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+import naming
+from instrumentation import SINKS, Instrumentation
+from pyspark.sql import SparkSession
+
+ENVIRONMENTS = ['production', 'staging', 'dev']
+SPARK_DEFAULTS = {
+    'hive.metastore.connect.retries': '5',
+    'hive.metastore.client.factory.class': 'com.amazonaws.glue.catalog.metastore.AWSGlueDataCatalogHiveClientFactory',
+    'spark.sql.sources.partitionOverwriteMode': 'dynamic',
+    'spark.sql.session.timeZone': 'UTC',
+}
+
+
+def parse_hour(value, end=False):
+    for pattern, step in (('%Y-%m-%dT%H', timedelta(0)), ('%Y-%m-%d', timedelta(hours=23))):
+        try:
+            parsed = datetime.strptime(value, pattern)
+        except ValueError:
+            continue
+        return parsed + step if end else parsed
+    raise argparse.ArgumentTypeError(f'expected YYYY-MM-DD or YYYY-MM-DDTHH, got {value!r}')
+
+
+def spark_conf(value):
+    key, separator, setting = value.partition('=')
+    if not separator or not key:
+        raise argparse.ArgumentTypeError(f'expected key=value, got {value!r}')
+    return key, setting
+
+
+class HourRange(namedtuple('HourRange', ['start', 'end'])):
+
+    def __contains__(self, hour):
+        return self.start <= hour <= self.end
+
+    def hours(self):
+        hour = self.start
+        while hour <= self.end:
+            yield hour
+            hour += timedelta(hours=1)
+
+    def dates(self):
+        return sorted({f'{hour:%Y-%m-%d}' for hour in self.hours()})
+
+
+class JobContext:
+
+    def __init__(self, environment='production', local_root=None, hour_range=None, spark_conf=(), metrics=None,
+                 metrics_path=None):
+        self.environment = environment
+        self.local_root = local_root
+        self.range = hour_range
+        self.spark_conf = dict(spark_conf)
+        self.metrics = metrics or ('local' if local_root else 'cloudwatch')
+        self.metrics_path = metrics_path
+
+    @staticmethod
+    def parser(description):
+        parser = argparse.ArgumentParser(description=description)
+        parser.add_argument('--environment', choices=ENVIRONMENTS, default='production',
+                            help='data lake buckets to read and write, named after the environment')
+        parser.add_argument('--local-root', help='read and write the layers under this directory instead of S3')
+        parser.add_argument('--start', help='first hour to process, YYYY-MM-DD or YYYY-MM-DDTHH')
+        parser.add_argument('--end', help='last hour to process, inclusive, YYYY-MM-DD or YYYY-MM-DDTHH')
+        parser.add_argument('--spark-conf', type=spark_conf, action='append', default=[], metavar='KEY=VALUE',
+                            help='spark session setting, may be repeated')
+        parser.add_argument('--metrics', choices=SINKS,
+                            help='where job metrics go, defaults to cloudwatch, or local with --local-root')
+        parser.add_argument('--metrics-path', help='json lines file of the local sink, defaults to stdout on S3 runs '
+                                                   'and _metrics/<job>.jsonl under --local-root')
+        return parser
+
+    @classmethod
+    def from_arguments(cls, args):
+        if bool(args.start) != bool(args.end):
+            raise SystemExit('--start and --end must be given together')
+        hour_range = HourRange(parse_hour(args.start), parse_hour(args.end, end=True)) if args.start else None
+        if hour_range and hour_range.start > hour_range.end:
+            raise SystemExit(f'--start {args.start} is after --end {args.end}')
+        return cls(args.environment, args.local_root, hour_range, args.spark_conf, args.metrics, args.metrics_path)
+
+    def uri(self, layer, *path):
+        if self.local_root:
+            return os.path.join(os.path.abspath(self.local_root), layer, *path)
+        return naming.data_lake_uri(self.environment, layer, *path)
+
+    def instrumentation(self, job):
+        path = self.metrics_path
+        if path is None and self.local_root:
+            path = os.path.join(os.path.abspath(self.local_root), '_metrics', f'{job}.jsonl')
+        return Instrumentation.create(self.metrics, self.environment, job, path)
+
+    def spark(self, app_name, settings=None):
+        builder = SparkSession.builder.appName(app_name)
+        for key, value in {**SPARK_DEFAULTS, **(settings or {}), **self.spark_conf}.items():
+            builder = builder.config(key, value)
+        if not self.local_root:
+            builder = builder.enableHiveSupport()
+        return builder.getOrCreate()
@@ -0,0 +1,61 @@
+from schemas import PROCESSED_ATOMIC_EVENTS
+
+COMPRESSION_CODECS = ['snappy', 'gzip', 'zstd', 'lz4', 'none']
+
+
+class ParquetLayout:
+
+    def __init__(self, partition_by, sort_by=(), target_file_mb=256, compression='snappy', bytes_per_record=150):
+        if compression not in COMPRESSION_CODECS:
+            raise ValueError(f'compression must be one of {COMPRESSION_CODECS}, got {compression}')
+        self.partition_by = list(partition_by)
+        self.sort_by = list(sort_by)
+        self.target_file_mb = target_file_mb
+        self.compression = compression
+        self.bytes_per_record = bytes_per_record
+
+    @property
+    def records_per_file(self):
+        return max(1, int(self.target_file_mb * 1024 * 1024 / self.bytes_per_record))
+
+    @classmethod
+    def add_arguments(cls, parser, default, partitioning=True):
+        if partitioning:
+            parser.add_argument('--partition-by', type=comma_separated, default=default.partition_by)
+        else:
+            parser.set_defaults(partition_by=default.partition_by)
+        parser.add_argument('--sort-by', type=comma_separated, default=default.sort_by)
+        parser.add_argument('--target-file-mb', type=int, default=default.target_file_mb)
+        parser.add_argument('--compression', choices=COMPRESSION_CODECS, default=default.compression)
+        parser.add_argument('--bytes-per-record', type=int, default=default.bytes_per_record,
+                            help='estimated compressed size of one record, used to size output files')
+
+    @classmethod
+    def from_arguments(cls, args):
+        return cls(args.partition_by, args.sort_by, args.target_file_mb, args.compression, args.bytes_per_record)
+
+    def write(self, df, path, mode='overwrite'):
+        if self.partition_by:
+            df = df.repartition(*self.partition_by)
+        if self.partition_by or self.sort_by:
+            df = df.sortWithinPartitions(*(self.partition_by + self.sort_by))
+
+        df.write\
+            .mode(mode)\
+            .partitionBy(*self.partition_by)\
+            .option('compression', self.compression)\
+            .option('maxRecordsPerFile', self.records_per_file)\
+            .option('parquet.block.size', min(self.target_file_mb, 128) * 1024 * 1024)\
+            .parquet(path)
+
+
+def comma_separated(value):
+    return [item for item in value.split(',') if item]
+
+
+ATOMIC_EVENTS_LAYOUT = ParquetLayout(
+    partition_by=[key.name for key in PROCESSED_ATOMIC_EVENTS.partition_keys],
+    sort_by=['event_type', 'page_url_path', 'user_domain_id'],
+    target_file_mb=256,
+    compression='snappy'
+)
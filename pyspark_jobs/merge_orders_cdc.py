@@ -0,0 +1,114 @@
+from datetime import datetime, timezone
+
+import boto3
+from pyspark.sql import Window, functions as F
+from job_context import JobContext
+from partition_registrar import PartitionRegistrar
+from partitions import FileCheckpoint, HadoopFileSystem
+from schemas import ORDERS_CDC
+
+parser = JobContext.parser('Merge DMS change files into the current state of orders.')
+parser.add_argument('--source', help='defaults to orders/public/orders on the raw layer of the environment')
+parser.add_argument('--target', help='defaults to orders on the processed layer of the environment')
+parser.add_argument('--tombstones', help='defaults to _tombstones/orders on the processed layer')
+parser.add_argument('--checkpoint', help='defaults to _checkpoints/orders.json on the processed layer')
+parser.add_argument('--order-range-size', type=int, default=100000,
+                    help='orders per target partition; changing it requires a --full-refresh')
+parser.add_argument('--tombstone-retention-days', type=int, default=7,
+                    help='keep deleted orders this long so replayed change files cannot resurrect them')
+parser.add_argument('--max-files', type=int, default=0, help='limit change files per run, 0 for no limit')
+parser.add_argument('--full-refresh', action='store_true', help='rebuild the current state from every change file')
+parser.add_argument('--glue-table', help='database.table to register the written order ranges in')
+parser.add_argument('--glue-region', help='region of the Glue catalog, defaults to the boto3 configuration')
+args = parser.parse_args()
+context = JobContext.from_arguments(args)
+if context.range:
+    parser.error('change files are not partitioned by time, merge them without --start and --end')
+
+spark = context.spark('orders_cdc_merge')
+instrumentation = context.instrumentation('merge_orders_cdc')
+
+source = args.source or context.uri('raw', 'orders', 'public', 'orders')
+target = args.target or context.uri('processed', 'orders')
+tombstones_target = args.tombstones or context.uri('processed', '_tombstones', 'orders')
+
+checkpoint = FileCheckpoint(spark, args.checkpoint or context.uri('processed', '_checkpoints', 'orders.json'))
+if args.full_refresh:
+    checkpoint.watermark, checkpoint.files_at_watermark = 0, []
+
+pending = checkpoint.pending(source)
+if args.max_files:
+    pending = dict(list(pending.items())[:args.max_files])
+print(f'{len(pending)} change files to merge')
+
+if pending:
+    changes = spark.read.schema(ORDERS_CDC.ddl()).parquet(*pending)\
+        .withColumn('order_range', F.floor(F.col('order_id') / args.order_range_size).cast('int'))
+
+    ranges = changes\
+        .groupBy('order_range')\
+        .agg(F.count('*').alias('changes'), F.max(F.to_timestamp('extracted_at').cast('long')).alias('newest'))\
+        .collect()
+    affected = [row.order_range for row in ranges]
+    print(f'{len(affected)} order ranges affected')
+
+    current = None
+    if not args.full_refresh:
+        # Deleted orders are kept apart from the current state, so readers of the orders table never see them.
+        for path in [target, tombstones_target]:
+            fs = HadoopFileSystem(spark, path)
+            if fs.exists(path) and fs.list_files(path, recursive=True):
+                df = spark.read.parquet(path).where(F.col('order_range').isin(affected))
+                current = df if current is None else current.unionByName(df)
+
+    merged = changes if current is None else changes.unionByName(current.select(*changes.columns))
+    op_priority = F.when(F.col('op') == 'D', 3).when(F.col('op') == 'U', 2).otherwise(1)
+    latest = Window.partitionBy('order_id').orderBy(F.col('extracted_at').desc(), op_priority.desc())
+    tombstone_cutoff = F.date_format(
+        F.current_timestamp() - F.expr(f'INTERVAL {args.tombstone_retention_days} DAYS'), 'yyyy-MM-dd HH:mm:ss')
+
+    # DMS may send only the key of a deleted order, its tombstone keeps the creation date of the order so the
+    # revenue rollup knows which date to rebuild.
+    versions = latest.rowsBetween(Window.unboundedPreceding, Window.unboundedFollowing)
+    newest_changes = merged\
+        .withColumn('created_at', F.coalesce('created_at', F.first('created_at', ignorenulls=True).over(versions)))\
+        .withColumn('rank', F.row_number().over(latest))\
+        .where(F.col('rank') == 1)\
+        .drop('rank')\
+        .localCheckpoint()
+    state = newest_changes.where(F.col('op').isNull() | (F.col('op') != 'D'))
+    tombstones = newest_changes.where((F.col('op') == 'D') & (F.col('extracted_at') >= tombstone_cutoff))
+
+    def write_ranges(df, path):
+        df.repartition('order_range')\
+            .sortWithinPartitions('order_range', 'order_id')\
+            .write.mode('overwrite')\
+            .partitionBy('order_range')\
+            .parquet(path)
+        # Dynamic overwrite only replaces the ranges that still have rows, the others are emptied here.
+        written = {str(row.order_range) for row in df.select('order_range').distinct().collect()}
+        fs = HadoopFileSystem(spark, path)
+        for order_range in set(map(str, affected)) - written:
+            fs.delete(f'{path}/order_range={order_range}')
+
+    with instrumentation.stage('merge') as stage:
+        write_ranges(state, target)
+        write_ranges(tombstones, tombstones_target)
+        stage.rows = sum(row.changes for row in ranges)
+        stage.bytes = sum(checkpoint.sizes[path] for path in pending)
+
+    # extracted_at is stamped by DMS when it reads the change, so the lag covers DMS and this merge.
+    newest = [row.newest for row in ranges if row.newest is not None]
+    if newest:
+        instrumentation.lag(datetime.fromtimestamp(max(newest), timezone.utc), 'merge')
+
+    if args.glue_table:
+        database, table = args.glue_table.split('.', 1)
+        target_fs = HadoopFileSystem(spark, target)
+        written = [(str(order_range),) for order_range in sorted(affected)
+                   if target_fs.exists(f'{target}/order_range={order_range}')]
+        registrar = PartitionRegistrar(boto3.client('glue', region_name=args.glue_region), database, table)
+        print(f'{len(registrar.register(written))} partitions registered in {args.glue_table}')
+
+    checkpoint.commit(pending)
+    instrumentation.flush()
@@ -0,0 +1,253 @@
+import json
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+PARTITION_KEYS = ['year', 'month', 'day', 'hour']
+# Written by local_scripts/compact_small_files.py.
+COMPACTION_MARKER = '_compaction.json'
+
+
+class Partition(namedtuple('Partition', PARTITION_KEYS)):
+
+    @classmethod
+    def from_path(cls, path):
+        values = dict(part.split('=', 1) for part in path.rstrip('/').split('/') if '=' in part)
+        return cls(*(values[key] for key in PARTITION_KEYS))
+
+    @classmethod
+    def from_datetime(cls, value):
+        return cls(f'{value:%Y}', f'{value:%m}', f'{value:%d}', f'{value:%H}')
+
+    @property
+    def path(self):
+        return '/'.join(f'{key}={value}' for key, value in zip(PARTITION_KEYS, self))
+
+    @property
+    def hour_start(self):
+        return datetime(int(self.year), int(self.month), int(self.day), int(self.hour))
+
+
+class HadoopFileSystem:
+
+    def __init__(self, spark, uri):
+        self.jvm = spark._jvm
+        self.fs = self.path(uri).getFileSystem(spark._jsc.hadoopConfiguration())
+
+    def path(self, uri):
+        return self.jvm.org.apache.hadoop.fs.Path(uri)
+
+    def exists(self, uri):
+        return self.fs.exists(self.path(uri))
+
+    def size(self, uri):
+        return self.fs.getContentSummary(self.path(uri)).getLength() if self.exists(uri) else 0
+
+    def glob(self, pattern):
+        return [status for status in (self.fs.globStatus(self.path(pattern)) or []) if status.isDirectory()]
+
+    def qualified(self, uri):
+        return self.fs.makeQualified(self.path(uri)).toString()
+
+    def list_files(self, uri, recursive=False):
+        files = []
+        iterator = self.fs.listFiles(self.path(uri), recursive)
+        while iterator.hasNext():
+            status = iterator.next()
+            relative = status.getPath().toString()[len(self.qualified(uri)):]
+            if not any(part.startswith(('_', '.')) for part in relative.split('/')):
+                files.append(status)
+        return files
+
+    def list_published_files(self, uri):
+        # The compactor writes the merged files of a directory under a hidden location named by its marker, and the
+        # marker replaces the files it lists until they are deleted.
+        statuses = []
+        iterator = self.fs.listFiles(self.path(uri), True)
+        while iterator.hasNext():
+            statuses.append(iterator.next())
+        markers = {status.getPath().getParent().toString(): json.loads(self.read_text(status.getPath().toString()))
+                   for status in statuses if status.getPath().getName() == COMPACTION_MARKER}
+
+        files = []
+        for status in statuses:
+            path = status.getPath()
+            parent = path.getParent()
+            if path.getName() in markers.get(parent.toString(), {}).get('inputs', []):
+                continue
+            parts = path.toString()[len(self.qualified(uri)):].split('/')
+            if markers.get(parent.getParent().toString(), {}).get('location') == parent.getName():
+                del parts[-2]
+            if not any(part.startswith(('_', '.')) for part in parts):
+                files.append(status)
+        return files
+
+    def read_text(self, uri):
+        stream = self.fs.open(self.path(uri))
+        try:
+            return self.jvm.org.apache.commons.io.IOUtils.toString(stream, 'UTF-8')
+        finally:
+            stream.close()
+
+    def write_text(self, uri, text):
+        tmp = self.path(f'{uri}.tmp')
+        stream = self.fs.create(tmp, True)
+        try:
+            stream.write(bytearray(text.encode('utf-8')))
+        finally:
+            stream.close()
+        self.fs.delete(self.path(uri), False)
+        self.fs.rename(tmp, self.path(uri))
+
+    def rename(self, source, destination):
+        self.fs.mkdirs(self.path(destination).getParent())
+        if not self.fs.rename(self.path(source), self.path(destination)):
+            raise IOError(f'could not rename {source} to {destination}')
+
+    def delete(self, uri, recursive=True):
+        self.fs.delete(self.path(uri), recursive)
+
+    def delete_stale_partitions(self, uri, partition_by, rebuilt, written):
+        # Dynamic overwrite only replaces the partitions that get rows, so the partitions below the rebuilt values of
+        # the leading keys that got none keep their old files until deleted here.
+        root = self.qualified(uri.rstrip('/'))
+        for values in rebuilt:
+            pattern = '/'.join([root] + [f'{key}={value}' for key, value in zip(partition_by, values)] +
+                               ['*'] * (len(partition_by) - len(values)))
+            for status in self.glob(pattern):
+                path = status.getPath().toString()
+                parts = dict(part.split('=', 1) for part in path[len(root):].split('/') if '=' in part)
+                if tuple(parts[key] for key in partition_by) not in written:
+                    self.delete(path)
+
+
+class PartitionCheckpoint:
+
+    def __init__(self, spark, uri, retention_hours=48):
+        self.spark = spark
+        self.uri = uri
+        self.retention_hours = retention_hours
+        self.fs = HadoopFileSystem(spark, uri)
+        self.watermark = None
+        self.partitions = {}
+
+        if self.fs.exists(uri):
+            state = json.loads(self.fs.read_text(uri))
+            self.watermark = Partition.from_path(state['watermark']) if state['watermark'] else None
+            self.partitions = state['partitions']
+
+    def pending(self, source_root):
+        source_root = source_root.rstrip('/')
+        fs = HadoopFileSystem(self.spark, source_root)
+        pending = {}
+
+        for pattern in self.globs():
+            for status in fs.glob(f'{source_root}/{pattern}'):
+                partition = Partition.from_path(status.getPath().toString())
+                if self.watermark and partition <= self.watermark:
+                    continue
+                files = fs.list_files(status.getPath().toString(), recursive=True)
+                if not files:
+                    continue
+                signature = f'{len(files)}:{max(file.getModificationTime() for file in files)}'
+                if self.partitions.get(partition.path) != signature:
+                    pending[partition] = signature
+
+        return dict(sorted(pending.items()))
+
+    def globs(self):
+        if not self.watermark:
+            return ['year=*/month=*/day=*/hour=*']
+        day = self.watermark.hour_start.date()
+        globs = []
+        while day <= datetime.utcnow().date():
+            globs.append(f'{Partition.from_datetime(day).path.rsplit("/", 1)[0]}/hour=*')
+            day += timedelta(days=1)
+        return globs
+
+    def commit(self, processed):
+        self.partitions.update({partition.path: signature for partition, signature in processed.items()})
+
+        cutoff = Partition.from_datetime(datetime.utcnow() - timedelta(hours=self.retention_hours))
+        expired = [Partition.from_path(path) for path in self.partitions if Partition.from_path(path) < cutoff]
+        if expired:
+            self.watermark = max(expired + ([self.watermark] if self.watermark else []))
+            for partition in expired:
+                del self.partitions[partition.path]
+
+        self.fs.write_text(self.uri, json.dumps({
+            'watermark': self.watermark.path if self.watermark else None,
+            'partitions': self.partitions
+        }, indent=2, sort_keys=True))
+
+
+class FileCheckpoint:
+
+    def __init__(self, spark, uri):
+        self.spark = spark
+        self.uri = uri
+        self.fs = HadoopFileSystem(spark, uri)
+        self.watermark = 0
+        self.files_at_watermark = []
+        self.sizes = {}
+
+        if self.fs.exists(uri):
+            state = json.loads(self.fs.read_text(uri))
+            self.watermark = state['watermark']
+            self.files_at_watermark = state['files_at_watermark']
+
+    def pending(self, source_dir, recursive=False):
+        fs = HadoopFileSystem(self.spark, source_dir)
+        pending = {}
+        self.sizes = {}
+        for status in fs.list_files(source_dir, recursive=recursive):
+            path = status.getPath().toString()
+            modified_at = status.getModificationTime()
+            if modified_at > self.watermark or \
+                    (modified_at == self.watermark and path not in self.files_at_watermark):
+                pending[path] = modified_at
+                self.sizes[path] = status.getLen()
+        return dict(sorted(pending.items(), key=lambda item: (item[1], item[0])))
+
+    def commit(self, processed):
+        if processed:
+            watermark = max(processed.values())
+            previous = self.files_at_watermark if watermark == self.watermark else []
+            self.files_at_watermark = sorted(set(previous) | {path for path, modified_at in processed.items()
+                                                                if modified_at == watermark})
+            self.watermark = watermark
+
+        self.fs.write_text(self.uri, json.dumps({
+            'watermark': self.watermark,
+            'files_at_watermark': self.files_at_watermark
+        }, indent=2))
+
+
+class KeyIndex:
+
+    def __init__(self, spark, uri, key):
+        self.spark = spark
+        self.uri = uri.rstrip('/')
+        self.key = key
+        self.fs = HadoopFileSystem(spark, self.uri)
+
+    def path(self, hour):
+        return f'{self.uri}/event_date={hour:%Y-%m-%d}/event_hour={hour.hour}'
+
+    def keys_before(self, hours, lookback_hours, include_hours=False):
+        # Only the hours of the lookback are read, and only their sorted key files, so a run reads the same amount
+        # of index however much history there is. Jobs that append to the hours they write include them.
+        paths = []
+        hour = min(hours) - timedelta(hours=lookback_hours)
+        while hour <= max(hours):
+            if (include_hours or hour not in hours) and self.fs.exists(self.path(hour)):
+                paths.append(self.path(hour))
+            hour += timedelta(hours=1)
+        return self.spark.read.parquet(*paths).select(self.key) if paths else None
+
+    def write(self, df, mode='overwrite'):
+        df.select(self.key, 'event_date', 'event_hour')\
+            .repartition('event_date', 'event_hour')\
+            .sortWithinPartitions('event_date', 'event_hour', self.key)\
+            .write.mode(mode)\
+            .partitionBy('event_date', 'event_hour')\
+            .parquet(self.uri)
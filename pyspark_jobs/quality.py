@@ -0,0 +1,89 @@
+from pyspark.sql import Window, functions as F
+
+CORRUPT_RECORD = '_corrupt_record'
+ERRORS = 'quality_errors'
+DUPLICATE = '_duplicate'
+
+
+class QualityCheck:
+
+    def __init__(self, schema, partition_by, unique_key=None, timestamp_fields=(), max_null_rates=None,
+                 max_quarantine_rate=0.01, max_duplicate_rate=None):
+        self.schema = schema
+        self.partition_by = list(partition_by)
+        self.unique_key = unique_key
+        self.timestamp_fields = list(timestamp_fields)
+        self.max_null_rates = max_null_rates or {}
+        self.max_quarantine_rate = max_quarantine_rate
+        self.max_duplicate_rate = max_duplicate_rate
+
+    @property
+    def error_codes(self):
+        codes = ['schema_violation']
+        codes += [f'missing_{field.name}' for field in self.schema.fields if not field.nullable]
+        codes += [f'invalid_{name}' for name in self.timestamp_fields]
+        return codes
+
+    def annotate(self, df, order_by=(), seen_keys=None):
+        # Every check is a column expression over the same rows, so the checks run in the pass that converts them.
+        conditions = [F.col(CORRUPT_RECORD).isNotNull() if CORRUPT_RECORD in df.columns else F.lit(False)]
+        conditions += [F.col(field.name).isNull() for field in self.schema.fields if not field.nullable]
+        conditions += [F.col(name).isNotNull() & F.to_timestamp(name).isNull() for name in self.timestamp_fields]
+        errors = F.array(*[F.when(condition, F.lit(code)) for code, condition in zip(self.error_codes, conditions)])
+        df = df\
+            .withColumn(ERRORS, errors)\
+            .withColumn(ERRORS, F.expr(f'filter({ERRORS}, error -> error IS NOT NULL)'))
+
+        if not self.unique_key:
+            return df.withColumn(DUPLICATE, F.lit(False))
+
+        # Retried deliveries repeat a record byte for byte, so only the first copy of a key is kept: later copies in
+        # the same run, and keys already written to earlier partitions, are dropped and counted.
+        columns = df.columns
+        copies = Window.partitionBy(self.unique_key).orderBy(*order_by, self.unique_key)
+        duplicate = F.col(self.unique_key).isNotNull() & (F.row_number().over(copies) > 1)
+        if seen_keys is not None:
+            # Joined and windowed on the same key, so both share one shuffle.
+            seen = seen_keys.select(self.unique_key).dropDuplicates().withColumn('_seen', F.lit(True))
+            df = df.join(seen, self.unique_key, 'left')
+            duplicate = duplicate | F.col('_seen').isNotNull()
+        return df.select(*columns, duplicate.alias(DUPLICATE))
+
+    def valid(self, annotated):
+        return annotated.where((F.size(ERRORS) == 0) & ~F.col(DUPLICATE)).drop(ERRORS, DUPLICATE, CORRUPT_RECORD)
+
+    def quarantined(self, annotated):
+        return annotated.where((F.size(ERRORS) > 0) & ~F.col(DUPLICATE)).drop(DUPLICATE)
+
+    def metrics(self, annotated, checked_at, extra=()):
+        # extra holds (metric, aggregate column, threshold) for checks that depend on the job, e.g. arrival delays.
+        records = F.count('*')
+        quarantined = F.sum(F.when((F.size(ERRORS) > 0) & ~F.col(DUPLICATE), 1).otherwise(0))
+        duplicates = F.sum(F.when(F.col(DUPLICATE), 1).otherwise(0))
+        definitions = [
+            ('records', records, None),
+            ('quarantined_records', quarantined, None),
+            ('quarantine_rate', quarantined / records, self.max_quarantine_rate),
+            ('duplicate_records', duplicates, None),
+            ('duplicate_rate', duplicates / records, self.max_duplicate_rate),
+        ]
+        definitions += [(code, F.sum(F.when(F.array_contains(ERRORS, code), 1).otherwise(0)), None)
+                        for code in self.error_codes]
+        definitions += [(f'null_rate_{field.name}', F.sum(F.when(F.col(field.name).isNull(), 1).otherwise(0)) / records,
+                         self.max_null_rates.get(field.name)) for field in self.schema.fields if field.nullable]
+        definitions += list(extra)
+
+        aggregated = annotated\
+            .groupBy(*self.partition_by)\
+            .agg(*[aggregate.cast('double').alias(name) for name, aggregate, _ in definitions])
+
+        rows = F.explode(F.array(*[
+            F.struct(F.lit(name).alias('metric'), F.col(name).alias('value'),
+                     F.lit(threshold).cast('double').alias('threshold'))
+            for name, _, threshold in definitions
+        ]))
+        return aggregated\
+            .select(*self.partition_by, rows.alias('row'))\
+            .select(*self.partition_by, 'row.*')\
+            .withColumn('passed', F.col('threshold').isNull() | (F.col('value') <= F.col('threshold')))\
+            .withColumn('checked_at', F.lit(checked_at).cast('timestamp'))
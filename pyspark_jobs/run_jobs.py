@@ -0,0 +1,298 @@
+# execute from the repository root: PYTHONPATH=bootcamp_data_platform python pyspark_jobs/run_jobs.py --environment production
+import argparse
+import json
+import os
+import subprocess
+import tempfile
+import time
+import uuid
+import zipfile
+from datetime import datetime, timedelta, timezone
+
+import boto3
+import naming
+from schemas import ORDERS, PROCESSED_ATOMIC_EVENTS
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEPENDENCIES = [
+    'pyspark_jobs/job_context.py',
+    'pyspark_jobs/partitions.py',
+    'pyspark_jobs/layout.py',
+    'pyspark_jobs/quality.py',
+    'bootcamp_data_platform/instrumentation.py',
+    'bootcamp_data_platform/naming.py',
+    'bootcamp_data_platform/schemas.py',
+    'lambdas/partition_registrar/partition_registrar.py',
+]
+
+
+class Job:
+
+    def __init__(self, name, script, args=(), depends_on=()):
+        self.name = name
+        self.script = script
+        self.args = list(args)
+        self.depends_on = list(depends_on)
+
+
+def package(directory, dependencies=DEPENDENCIES):
+    path = os.path.join(directory, 'dependencies.zip')
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for dependency in dependencies:
+            archive.write(os.path.join(ROOT, dependency), os.path.basename(dependency))
+    return path
+
+
+class EmrBackend:
+
+    def __init__(self, environment, emr_client=None, s3_client=None, cluster_id=None):
+        self.environment = environment
+        self.emr = emr_client or boto3.client('emr')
+        self.s3 = s3_client or boto3.client('s3')
+        self.cluster_id = cluster_id or self.find_cluster()
+        self.prefix = None
+        self.py_files = None
+        self.scripts = {}
+
+    def find_cluster(self):
+        name = naming.emr_cluster(self.environment)
+        paginator = self.emr.get_paginator('list_clusters')
+        for page in paginator.paginate(ClusterStates=['STARTING', 'BOOTSTRAPPING', 'RUNNING', 'WAITING']):
+            for cluster in page['Clusters']:
+                if cluster['Name'] == name:
+                    return cluster['Id']
+        raise RuntimeError(f'no active EMR cluster named {name}')
+
+    @property
+    def concurrency(self):
+        return self.emr.describe_cluster(ClusterId=self.cluster_id)['Cluster'].get('StepConcurrencyLevel', 1)
+
+    def upload(self, path):
+        bucket = naming.emr_logs_bucket(self.environment)
+        key = f'{self.prefix}/{os.path.basename(path)}'
+        self.s3.upload_file(path, bucket, key)
+        return f's3://{bucket}/{key}'
+
+    def prepare(self, jobs):
+        self.prefix = f'jobs/{datetime.now(timezone.utc):%Y%m%dT%H%M%S}-{uuid.uuid4().hex[:8]}'
+        with tempfile.TemporaryDirectory() as directory:
+            self.py_files = self.upload(package(directory))
+        self.scripts = {job.script: self.upload(os.path.join(ROOT, job.script)) for job in jobs}
+
+    def submit(self, job):
+        response = self.emr.add_job_flow_steps(
+            JobFlowId=self.cluster_id,
+            Steps=[{
+                'Name': job.name,
+                'ActionOnFailure': 'CONTINUE',
+                'HadoopJarStep': {
+                    'Jar': 'command-runner.jar',
+                    'Args': ['spark-submit', '--deploy-mode', 'cluster', '--py-files', self.py_files,
+                             self.scripts[job.script], *job.args]
+                }
+            }]
+        )
+        return response['StepIds'][0]
+
+    def poll(self, handle):
+        status = self.emr.describe_step(ClusterId=self.cluster_id, StepId=handle)['Step']['Status']
+        if status['State'] in ('PENDING', 'RUNNING', 'CANCEL_PENDING'):
+            return None
+        timeline = status.get('Timeline', {})
+        timings = {}
+        if 'StartDateTime' in timeline:
+            timings['queued_seconds'] = (timeline['StartDateTime'] - timeline['CreationDateTime']).total_seconds()
+            if 'EndDateTime' in timeline:
+                timings['run_seconds'] = (timeline['EndDateTime'] - timeline['StartDateTime']).total_seconds()
+        return status['State'] == 'COMPLETED', timings, status.get('FailureDetails', {}).get('Message')
+
+
+class LocalBackend:
+
+    def __init__(self, master='local[*]', concurrency=1, spark_submit='spark-submit', log_dir=None):
+        self.master = master
+        self.concurrency = concurrency
+        self.spark_submit = spark_submit
+        self.directory = tempfile.mkdtemp(prefix='run_jobs_')
+        self.log_dir = log_dir or self.directory
+        self.py_files = None
+
+    def prepare(self, jobs):
+        self.py_files = package(self.directory)
+
+    def submit(self, job):
+        log = open(os.path.join(self.log_dir, f'{job.name}.log'), 'w')
+        process = subprocess.Popen(
+            [self.spark_submit, '--master', self.master, '--py-files', self.py_files,
+             os.path.join(ROOT, job.script), *job.args],
+            stdout=log, stderr=subprocess.STDOUT
+        )
+        return process, log, time.monotonic()
+
+    def poll(self, handle):
+        process, log, started_at = handle
+        if process.poll() is None:
+            return None
+        log.close()
+        failure = None if process.returncode == 0 else f'exit code {process.returncode}, see {log.name}'
+        return process.returncode == 0, {'run_seconds': round(time.monotonic() - started_at, 2)}, failure
+
+
+class DagRunner:
+
+    def __init__(self, backend, jobs, max_concurrent=None, min_poll_seconds=1.0, max_poll_seconds=30.0):
+        names = {job.name for job in jobs}
+        for job in jobs:
+            missing = set(job.depends_on) - names
+            if missing:
+                raise ValueError(f'{job.name} depends on unknown jobs {sorted(missing)}')
+        self.backend = backend
+        self.jobs = {job.name: job for job in jobs}
+        self.max_concurrent = max_concurrent
+        self.min_poll_seconds = min_poll_seconds
+        self.max_poll_seconds = max_poll_seconds
+
+    def run(self):
+        self.backend.prepare(list(self.jobs.values()))
+        limit = min(self.max_concurrent or self.backend.concurrency, self.backend.concurrency)
+        started_at = time.monotonic()
+        results = {}
+        running = {}
+        delay = self.min_poll_seconds
+
+        while len(results) < len(self.jobs):
+            for name, job in self.jobs.items():
+                if name in results or name in running:
+                    continue
+                if any(results.get(dependency, {}).get('state') in ('FAILED', 'SKIPPED') for dependency in job.depends_on):
+                    results[name] = {'state': 'SKIPPED'}
+                    print(f'{name}: skipped, a dependency did not complete')
+                elif len(running) < limit and all(results.get(dependency, {}).get('state') == 'COMPLETED'
+                                                  for dependency in job.depends_on):
+                    running[name] = (self.backend.submit(job), time.monotonic())
+                    print(f'{name}: submitted')
+                    delay = self.min_poll_seconds
+
+            if len(results) == len(self.jobs):
+                break
+            time.sleep(delay)
+
+            finished = False
+            for name, (handle, submitted_at) in list(running.items()):
+                outcome = self.backend.poll(handle)
+                if outcome is None:
+                    continue
+                completed, timings, failure = outcome
+                results[name] = {'state': 'COMPLETED' if completed else 'FAILED',
+                                 'wall_seconds': round(time.monotonic() - submitted_at, 2), **timings}
+                if failure:
+                    results[name]['failure'] = failure
+                del running[name]
+                finished = True
+                print(f'{name}: {results[name]["state"].lower()} in {results[name]["wall_seconds"]} s')
+
+            delay = self.min_poll_seconds if finished else min(delay * 2, self.max_poll_seconds)
+
+        return {'seconds': round(time.monotonic() - started_at, 2), 'jobs': results}
+
+
+def catalog_args(catalog, layer, table=None):
+    # Spark on EMR and Redshift Spectrum only see registered partitions, projection is read by Athena alone. Local
+    # runs have no catalog, catalog is None.
+    if not catalog:
+        return []
+    environment, region = catalog
+    database = naming.glue_database(environment, layer)
+    target = ['--glue-table', f'{database}.{table}'] if table else ['--glue-database', database]
+    return target + (['--glue-region', region] if region else [])
+
+
+def convert_catalog_args(catalog):
+    # The quality metrics of the conversion are a curated table.
+    if not catalog:
+        return []
+    return [*catalog_args(catalog, 'processed', PROCESSED_ATOMIC_EVENTS.name),
+            '--glue-curated-database', naming.glue_database(catalog[0], 'curated')]
+
+
+def pipeline(context_args, catalog=None):
+    return [
+        Job('convert_to_parquet', 'pyspark_jobs/convert_to_parquet.py',
+            [*context_args, *convert_catalog_args(catalog)]),
+        Job('merge_orders_cdc', 'pyspark_jobs/merge_orders_cdc.py',
+            [*context_args, *catalog_args(catalog, 'processed', ORDERS.name)]),
+        Job('build_event_rollups', 'pyspark_jobs/build_event_rollups.py',
+            [*context_args, *catalog_args(catalog, 'curated')], depends_on=['convert_to_parquet']),
+        Job('build_revenue_rollups', 'pyspark_jobs/build_revenue_rollups.py',
+            [*context_args, *catalog_args(catalog, 'curated')], depends_on=['merge_orders_cdc']),
+    ]
+
+
+def backfill(context_args, start, end, slice_days=1, catalog=None):
+    # Each slice rewrites only the event hours of its own days and dedupes them against the raw hours before them,
+    # not against what the previous slice writes, so the slices run side by side. The rollups of the whole range are
+    # rebuilt once all of them are done.
+    jobs = []
+    day = start
+    while day <= end:
+        last = min(day + timedelta(days=slice_days - 1), end)
+        jobs.append(Job(f'convert_to_parquet_{day:%Y%m%d}', 'pyspark_jobs/convert_to_parquet.py',
+                        [*context_args, '--start', f'{day:%Y-%m-%d}', '--end', f'{last:%Y-%m-%d}',
+                         *convert_catalog_args(catalog)]))
+        day = last + timedelta(days=1)
+    range_args = [*context_args, '--start', f'{start:%Y-%m-%d}', '--end', f'{end:%Y-%m-%d}',
+                  *catalog_args(catalog, 'curated')]
+    return jobs + [
+        Job('build_event_rollups', 'pyspark_jobs/build_event_rollups.py', range_args,
+            depends_on=[job.name for job in jobs]),
+        Job('build_revenue_rollups', 'pyspark_jobs/build_revenue_rollups.py', range_args),
+    ]
+
+
+def date(value):
+    return datetime.strptime(value, '%Y-%m-%d')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the data lake spark jobs on EMR, or locally.')
+    parser.add_argument('--environment', default='production')
+    parser.add_argument('--jobs', nargs='*', help='jobs to run, defaults to the whole pipeline')
+    parser.add_argument('--cluster-id', help='defaults to the active cluster named after the environment')
+    parser.add_argument('--max-concurrent', type=int, help='defaults to the step concurrency level of the cluster')
+    parser.add_argument('--local-root', help='run with spark-submit --master local[*] on layers under this directory')
+    parser.add_argument('--local-concurrency', type=int, default=1)
+    parser.add_argument('--backfill-start', type=date, help='first day to backfill, YYYY-MM-DD')
+    parser.add_argument('--backfill-end', type=date, help='last day to backfill, inclusive, YYYY-MM-DD')
+    parser.add_argument('--slice-days', type=int, default=1, help='days converted by each backfill job')
+    parser.add_argument('--spark-conf', action='append', default=[], metavar='KEY=VALUE',
+                        help='spark session setting passed to every job, may be repeated')
+    args = parser.parse_args()
+
+    if bool(args.backfill_start) != bool(args.backfill_end):
+        parser.error('--backfill-start and --backfill-end must be given together')
+
+    if args.local_root:
+        backend = LocalBackend(concurrency=args.local_concurrency)
+        context_args = ['--local-root', os.path.abspath(args.local_root)]
+        catalog = None
+    else:
+        backend = EmrBackend(args.environment, cluster_id=args.cluster_id)
+        context_args = ['--environment', args.environment]
+        catalog = (args.environment, backend.emr.meta.region_name)
+    context_args += [argument for setting in args.spark_conf for argument in ('--spark-conf', setting)]
+
+    if args.backfill_start:
+        jobs = backfill(context_args, args.backfill_start, args.backfill_end, args.slice_days, catalog)
+    else:
+        jobs = pipeline(context_args, catalog)
+
+    if args.jobs:
+        jobs = [job for job in jobs if job.name in args.jobs]
+        for job in jobs:
+            job.depends_on = [dependency for dependency in job.depends_on if dependency in args.jobs]
+
+    print(json.dumps(DagRunner(backend, jobs, max_concurrent=args.max_concurrent).run(), indent=2))
+
+
+if __name__ == '__main__':
+    main()
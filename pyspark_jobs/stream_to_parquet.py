@@ -0,0 +1,280 @@
+# long running, submit with the --py-files of run_jobs.py; --local-root DIR --once drains the raw files and stops
+import json
+from datetime import datetime, timezone
+
+import boto3
+import naming
+from pyspark import StorageLevel
+from pyspark.sql import functions as F
+from instrumentation import DUPLICATE_RATE, QUALITY_CHECKS_FAILED
+from job_context import JobContext
+from layout import ATOMIC_EVENTS_LAYOUT, ParquetLayout
+from partition_registrar import PartitionRegistrar
+from partitions import HadoopFileSystem, KeyIndex
+from quality import CORRUPT_RECORD, QualityCheck
+from schemas import ATOMIC_EVENTS, ATOMIC_EVENTS_QUALITY, PROCESSED_ATOMIC_EVENTS
+
+MAX_NULL_RATES = {'user_domain_id': 0.01, 'page_url_path': 0.01, 'device_type': 0.05}
+
+parser = JobContext.parser('Convert raw atomic events to parquet on the processed layer as they arrive.')
+parser.add_argument('--source-type', choices=['files', 'kinesis'], default='files',
+                    help='new raw files written by Firehose, or the Kinesis stream in front of it')
+parser.add_argument('--source', help='defaults to atomic_events on the raw layer of the environment')
+parser.add_argument('--kinesis-stream', help='defaults to the raw atomic events stream of the environment')
+parser.add_argument('--kinesis-endpoint', help='e.g. https://kinesis.eu-west-1.amazonaws.com')
+parser.add_argument('--kinesis-format', default='kinesis', help='spark source name of the Kinesis connector jar')
+parser.add_argument('--starting-position', choices=['TRIM_HORIZON', 'LATEST'], default='LATEST',
+                    help='where the stream is read from when the checkpoint is empty')
+parser.add_argument('--target', help='defaults to atomic_events on the processed layer of the environment')
+parser.add_argument('--checkpoint', help='defaults to _checkpoints/stream_atomic_events on the processed layer')
+parser.add_argument('--trigger-seconds', type=int, default=60, help='interval between micro-batches')
+parser.add_argument('--once', action='store_true', help='process what is available in one micro-batch and stop')
+parser.add_argument('--max-files-per-trigger', type=int, default=500)
+parser.add_argument('--compact-min-files', type=int, default=16,
+                    help='rewrite a partition with the layout once micro-batches appended this many files to it')
+parser.add_argument('--max-lateness-hours', type=int, default=1,
+                    help='events arriving later than this are written to the partition of arrival hour minus lateness')
+parser.add_argument('--quarantine', help='defaults to _quarantine/atomic_events on the processed layer')
+parser.add_argument('--quality-target', help='defaults to atomic_events_quality on the curated layer')
+parser.add_argument('--max-quarantine-rate', type=float, default=0.01)
+parser.add_argument('--max-duplicate-rate', type=float, help='fail the quality check above this share of duplicates')
+parser.add_argument('--event-id-index', help='defaults to _indexes/atomic_events_event_id on the processed layer')
+parser.add_argument('--dedupe-lookback-hours', type=int, default=24,
+                    help='drop events whose id was already written this many hours back, 0 to disable')
+parser.add_argument('--max-delay-hours', type=int,
+                    help='longest accepted delay between an event and its arrival, defaults to lateness plus one hour')
+parser.add_argument('--glue-table', help='database.table to register new partitions in')
+parser.add_argument('--glue-region', help='region of the Glue catalog, defaults to the boto3 configuration')
+# The processed table, its id index, quality metrics and Glue partitions are all by event date and hour, so only the
+# file layout within them is configurable.
+ParquetLayout.add_arguments(parser, default=ATOMIC_EVENTS_LAYOUT, partitioning=False)
+args = parser.parse_args()
+layout = ParquetLayout.from_arguments(args)
+context = JobContext.from_arguments(args)
+if context.range:
+    parser.error('--start and --end do not apply to a stream, backfill with convert_to_parquet.py')
+instrumentation = context.instrumentation('stream_to_parquet')
+
+spark = context.spark('raw_to_processed_stream', {'spark.sql.sources.partitionColumnTypeInference.enabled': 'false'})
+
+source = (args.source or context.uri('raw', 'atomic_events')).rstrip('/')
+target = (args.target or context.uri('processed', 'atomic_events')).rstrip('/')
+quarantine = (args.quarantine or context.uri('processed', '_quarantine', 'atomic_events')).rstrip('/')
+event_ids = KeyIndex(spark, args.event_id_index or context.uri('processed', '_indexes', 'atomic_events_event_id'),
+                     'event_id')
+quality_target = (args.quality_target or context.uri('curated', ATOMIC_EVENTS_QUALITY.name)).rstrip('/')
+checkpoint = (args.checkpoint or context.uri('processed', '_checkpoints', 'stream_atomic_events')).rstrip('/')
+# Kept in the checkpoint location, so starting the stream over from an empty checkpoint starts the batch ids over too.
+batch_state = f'{checkpoint}/batches.json'
+checkpoint_fs = HadoopFileSystem(spark, checkpoint)
+lateness = args.max_lateness_hours
+max_delay_hours = args.max_delay_hours if args.max_delay_hours is not None else lateness + 1
+target_fs = HadoopFileSystem(spark, target)
+registrar = None
+if args.glue_table:
+    database, table = args.glue_table.split('.', 1)
+    registrar = PartitionRegistrar(boto3.client('glue', region_name=args.glue_region), database, table)
+
+quality = QualityCheck(
+    ATOMIC_EVENTS,
+    partition_by=layout.partition_by,
+    unique_key='event_id',
+    timestamp_fields=['event_timestamp'],
+    max_null_rates=MAX_NULL_RATES,
+    max_quarantine_rate=args.max_quarantine_rate,
+    max_duplicate_rate=args.max_duplicate_rate
+)
+raw_schema = f'{ATOMIC_EVENTS.ddl()}, `{CORRUPT_RECORD}` string'
+
+if args.source_type == 'files':
+    # Firehose writes each object once, so the file source sees every raw file exactly once across micro-batches.
+    events = spark.readStream\
+        .schema(raw_schema)\
+        .option('columnNameOfCorruptRecord', CORRUPT_RECORD)\
+        .option('maxFilesPerTrigger', args.max_files_per_trigger)\
+        .option('recursiveFileLookup', 'true')\
+        .json(source)\
+        .withColumn('arrival_hour', F.to_timestamp(
+            F.regexp_extract(F.input_file_name(), r'year=(\d{4})/month=(\d{2})/day=(\d{2})/hour=(\d{2})', 0),
+            "'year='yyyy'/month='MM'/day='dd'/hour='HH"
+        ))
+else:
+    records = spark.readStream\
+        .format(args.kinesis_format)\
+        .option('streamName', args.kinesis_stream or naming.kinesis_stream(context.environment))\
+        .option('startingposition', args.starting_position)
+    if args.kinesis_endpoint:
+        records = records.option('endpointUrl', args.kinesis_endpoint)
+    # A record may hold several newline delimited events when the producer aggregates them.
+    events = records.load()\
+        .select(F.explode(F.split(F.col('data').cast('string'), '\n')).alias('line'),
+                F.date_trunc('hour', 'approximateArrivalTimestamp').alias('arrival_hour'))\
+        .where(F.trim('line') != '')\
+        .select(F.from_json('line', raw_schema, {'columnNameOfCorruptRecord': CORRUPT_RECORD}).alias('event'),
+                'arrival_hour')\
+        .select('event.*', 'arrival_hour')
+
+partition_hour = F.least(
+    F.greatest(
+        F.coalesce(F.date_trunc('hour', F.to_timestamp('event_timestamp')), F.col('arrival_hour')),
+        F.col('arrival_hour') - F.expr(f'INTERVAL {lateness} HOURS')
+    ),
+    F.col('arrival_hour')
+)
+events = events\
+    .withColumn('partition_hour', partition_hour)\
+    .withColumn('event_date', F.date_format('partition_hour', 'yyyy-MM-dd'))\
+    .withColumn('event_hour', F.hour('partition_hour'))
+
+
+def read_batch_state():
+    if not checkpoint_fs.exists(batch_state):
+        return {'committed': -1, 'publishing': None}
+    return json.loads(checkpoint_fs.read_text(batch_state))
+
+
+def write_batch_state(committed, publishing=None):
+    checkpoint_fs.write_text(batch_state, json.dumps({'committed': committed, 'publishing': publishing}, indent=2))
+
+
+def staging_path(root, name):
+    return f'{root}/_staging/{name}'
+
+
+def write_staged(root, name, write):
+    # Outputs are written under _staging, which readers skip, and moved into their partitions once all are written.
+    fs = HadoopFileSystem(spark, root)
+    staging = staging_path(root, name)
+    fs.delete(staging)
+    write(staging)
+    return [(status.getPath().toString(), fs.qualified(root) + status.getPath().toString()[len(fs.qualified(staging)):])
+            for status in fs.list_files(staging, recursive=True)]
+
+
+def partitioned(df):
+    return lambda staging: df.write.mode('overwrite').partitionBy(*layout.partition_by).parquet(staging)
+
+
+def publish(committed, renames, deletes=(), staging=()):
+    # The moves are recorded before any of them is made, so a micro-batch failing half way through them is finished
+    # by the next one rather than written again.
+    publishing = {'deletes': list(deletes), 'renames': renames, 'staging': list(staging)}
+    write_batch_state(committed, publishing)
+    finish_publishing(committed, publishing)
+
+
+def finish_publishing(committed, publishing):
+    for source, destination in publishing['renames']:
+        fs = HadoopFileSystem(spark, source)
+        if fs.exists(source):
+            fs.rename(source, destination)
+    for uri in publishing['deletes']:
+        HadoopFileSystem(spark, uri).delete(uri, recursive=False)
+    for uri in publishing['staging']:
+        HadoopFileSystem(spark, uri).delete(uri)
+    write_batch_state(committed)
+
+
+def compact(partitions, committed):
+    # Every micro-batch adds a file per partition, partitions that collected enough of them are rewritten with the
+    # layout. The rewrite goes to _staging and is moved in before the small files are deleted, so queries running
+    # meanwhile never miss rows, though one listing the partition between the two may read them twice. Batches run one
+    # after another, so nothing is added to a partition while it is rewritten.
+    paths, inputs = [], []
+    for event_date, event_hour in partitions:
+        path = f'{target}/event_date={event_date}/event_hour={event_hour}'
+        files = [status for status in target_fs.list_files(path) if status.getPath().getName().endswith('.parquet')]
+        if len(files) >= args.compact_min_files:
+            paths.append(path)
+            inputs += [status.getPath().toString() for status in files]
+    if paths:
+        compacted = spark.read\
+            .schema(f'{PROCESSED_ATOMIC_EVENTS.ddl()}, event_date string, event_hour int')\
+            .option('basePath', target)\
+            .parquet(*inputs)
+        renames = write_staged(target, 'compaction', lambda staging: layout.write(compacted, staging))
+        publish(committed, renames, deletes=inputs, staging=[staging_path(target, 'compaction')])
+    return len(paths)
+
+
+def process_batch(batch, batch_id):
+    state = read_batch_state()
+    if state['publishing']:
+        finish_publishing(state['committed'], state['publishing'])
+    if batch_id <= state['committed']:
+        # Spark replays a micro-batch it did not log as done, its outputs were already published.
+        print(f'batch {batch_id}: already committed, skipped')
+        return
+
+    # The source is read once, the hours of the batch decide which part of the id index is read.
+    batch = batch.persist(StorageLevel.MEMORY_AND_DISK)
+    hours = {datetime.strptime(f'{row.event_date} {row.event_hour}', '%Y-%m-%d %H')
+             for row in batch.select('event_date', 'event_hour').distinct().collect() if row.event_date}
+    if not hours:
+        batch.unpersist()
+        return
+    seen_event_ids = None
+    if args.dedupe_lookback_hours:
+        seen_event_ids = event_ids.keys_before(hours, args.dedupe_lookback_hours, include_hours=True)
+    annotated = quality.annotate(batch, order_by=['arrival_hour', 'event_timestamp'], seen_keys=seen_event_ids)\
+        .persist(StorageLevel.MEMORY_AND_DISK)
+
+    name = f'batch_id={batch_id}'
+    valid = quality.valid(annotated).drop('arrival_hour', 'partition_hour')
+    with instrumentation.stage('stream_batch') as stage:
+        renames = write_staged(target, name, lambda staging: layout.write(valid, staging))
+        renames += write_staged(quarantine, name, partitioned(quality.quarantined(annotated).drop('partition_hour')))
+        partition_stats = valid\
+            .groupBy('event_date', 'event_hour')\
+            .agg(F.count('*').alias('rows'), F.max(F.to_timestamp('event_timestamp').cast('long')).alias('newest'))\
+            .collect()
+        stage.rows = sum(row.rows for row in partition_stats)
+    if partition_stats:
+        instrumentation.lag(datetime.fromtimestamp(max(row.newest for row in partition_stats), timezone.utc),
+                            'stream_batch')
+
+    delay_seconds = (F.col('arrival_hour').cast('long') + 3600) - F.to_timestamp('event_timestamp').cast('long')
+    metrics = quality.metrics(annotated, datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S'), extra=[
+        ('late_records', F.sum(F.when(F.col('partition_hour') < F.col('arrival_hour'), 1).otherwise(0)), None),
+        ('max_delay_seconds', F.max(delay_seconds), max_delay_hours * 3600),
+    ]).cache()
+    # Each micro-batch adds its own metrics, told apart by checked_at.
+    renames += write_staged(quality_target, name,
+                            partitioned(metrics.select(*ATOMIC_EVENTS_QUALITY.field_names, *layout.partition_by)))
+    failed = metrics.where(~F.col('passed')).orderBy(*layout.partition_by, 'metric').collect()
+    for row in failed:
+        print(f'batch {batch_id}: quality check failed for event_date={row.event_date}/event_hour={row.event_hour}: '
+              f'{row.metric} {row.value} above {row.threshold}')
+    totals = {row.metric: row.value for row in metrics.where(F.col('metric').isin('records', 'duplicate_records'))
+              .groupBy('metric').agg(F.sum('value').alias('value')).collect()}
+    instrumentation.record(QUALITY_CHECKS_FAILED, len(failed), stage='stream_batch')
+    instrumentation.record(DUPLICATE_RATE, totals.get('duplicate_records', 0) / totals['records'] if totals.get('records')
+                           else 0, 'None', 'stream_batch')
+
+    # The ids are published with their rows, so a replayed batch neither finds its own ids in the index nor writes its
+    # rows twice. Staged apart from the index, they do not recache the annotated rows, which would count them as seen.
+    renames += write_staged(event_ids.uri, name, lambda staging: KeyIndex(spark, staging, 'event_id').write(valid))
+    publish(batch_id, renames, staging=[staging_path(root, name)
+                                        for root in (target, quarantine, quality_target, event_ids.uri)])
+    metrics.unpersist()
+    annotated.unpersist()
+    batch.unpersist()
+
+    with instrumentation.stage('compact'):
+        compacted = compact([(row.event_date, row.event_hour) for row in partition_stats], batch_id)
+
+    if registrar:
+        registrar.register([(row.event_date, str(row.event_hour)) for row in partition_stats])
+    instrumentation.flush()
+    print(f'batch {batch_id}: {sum(row.rows for row in partition_stats)} rows written to {len(partition_stats)} '
+          f'partitions, {compacted} partitions compacted')
+
+
+writer = events.writeStream\
+    .foreachBatch(process_batch)\
+    .option('checkpointLocation', checkpoint)
+if args.once:
+    writer = writer.trigger(once=True)
+else:
+    writer = writer.trigger(processingTime=f'{args.trigger_seconds} seconds')
+writer.start().awaitTermination()
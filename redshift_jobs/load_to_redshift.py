@@ -0,0 +1,242 @@
+# execute from the repository root: PYTHONPATH=bootcamp_data_platform python redshift_jobs/load_to_redshift.py
+import argparse
+import json
+import os
+import time
+import uuid
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import boto3
+import psycopg2
+from psycopg2.extras import execute_values
+import naming
+from warehouse_sql import DIALECTS, WAREHOUSE_TABLES, create_schema_sql
+
+
+class S3Storage:
+
+    def __init__(self, client):
+        self.client = client
+
+    @staticmethod
+    def split(uri):
+        bucket, _, key = uri[len('s3://'):].partition('/')
+        return bucket, key
+
+    def list_files(self, uri):
+        bucket, prefix = self.split(uri.rstrip('/') + '/')
+        paginator = self.client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+            for obj in page.get('Contents', []):
+                yield {'uri': f's3://{bucket}/{obj["Key"]}', 'relative': obj['Key'][len(prefix):], 'size': obj['Size'],
+                       'modified_at': int(obj['LastModified'].timestamp() * 1000)}
+
+    def read_text(self, uri):
+        bucket, key = self.split(uri)
+        try:
+            return self.client.get_object(Bucket=bucket, Key=key)['Body'].read().decode('utf-8')
+        except self.client.exceptions.NoSuchKey:
+            return None
+
+    def write_text(self, uri, text):
+        bucket, key = self.split(uri)
+        self.client.put_object(Bucket=bucket, Key=key, Body=text.encode('utf-8'))
+
+
+class LocalStorage:
+
+    def list_files(self, uri):
+        for root, _, names in os.walk(uri):
+            for name in names:
+                path = os.path.join(root, name)
+                yield {'uri': path, 'relative': os.path.relpath(path, uri), 'size': os.path.getsize(path),
+                       'modified_at': int(os.path.getmtime(path) * 1000)}
+
+    def read_text(self, uri):
+        if not os.path.exists(uri):
+            return None
+        with open(uri) as file:
+            return file.read()
+
+    def write_text(self, uri, text):
+        os.makedirs(os.path.dirname(uri), exist_ok=True)
+        with open(f'{uri}.tmp', 'w') as file:
+            file.write(text)
+        os.replace(f'{uri}.tmp', uri)
+
+
+class TableLoader:
+
+    def __init__(self, table, storage, layer_root, connect, iam_role=None, dialect='redshift',
+                 analyze_threshold_percent=10, dry_run=False):
+        self.table = table
+        self.storage = storage
+        self.source = f'{layer_root.rstrip("/")}/{table.schema.name}'
+        self.state_uri = f'{layer_root.rstrip("/")}/_checkpoints/redshift/{table.schema.name}.json'
+        self.manifest_root = f'{layer_root.rstrip("/")}/_manifests/redshift/{table.schema.name}'
+        self.connect = connect
+        self.iam_role = iam_role
+        self.dialect = dialect
+        self.analyze_threshold_percent = analyze_threshold_percent
+        self.dry_run = dry_run
+
+        state = json.loads(self.storage.read_text(self.state_uri) or '{"watermark": 0, "files_at_watermark": []}')
+        self.watermark = state['watermark']
+        self.files_at_watermark = state['files_at_watermark']
+
+    def partition_values(self, relative):
+        parts = dict(part.split('=', 1) for part in relative.split('/')[:-1] if '=' in part)
+        keys = [key.name for key in self.table.schema.partition_keys]
+        return tuple(parts[key] for key in keys) if all(key in parts for key in keys) else None
+
+    def pending(self):
+        files = defaultdict(list)
+        new_files = {}
+        for file in self.storage.list_files(self.source):
+            if any(part.startswith(('_', '.')) for part in file['relative'].split('/')) or \
+                    not file['relative'].endswith('.parquet'):
+                continue
+            values = self.partition_values(file['relative'])
+            if values is None:
+                continue
+            files[values].append(file)
+            if file['modified_at'] > self.watermark or \
+                    (file['modified_at'] == self.watermark and file['uri'] not in self.files_at_watermark):
+                new_files[file['uri']] = (values, file['modified_at'])
+
+        # Partitions are rewritten as a whole upstream, so a partition with new files is reloaded with all its files.
+        changed = sorted({values for values, _ in new_files.values()})
+        return {values: files[values] for values in changed}, {uri: modified_at for uri, (_, modified_at) in new_files.items()}
+
+    def manifest(self, files):
+        return {'entries': [{'url': file['uri'], 'mandatory': True, 'meta': {'content_length': file['size']}}
+                            for file in files]}
+
+    def load(self):
+        started_at = time.monotonic()
+        partitions, new_files = self.pending()
+        report = {'table': self.table.name, 'partitions': len(partitions),
+                  'files': sum(len(files) for files in partitions.values()), 'analyzed': False}
+        if not partitions:
+            return report
+
+        run_id = uuid.uuid4().hex[:12]
+        statements = [create_schema_sql(self.table.layer), self.table.create_sql(self.dialect),
+                      self.table.create_staging_sql()]
+        loads = []
+        for index, (values, files) in enumerate(sorted(partitions.items())):
+            manifest_uri = f'{self.manifest_root}/{run_id}-{index:05d}.manifest'
+            self.storage.write_text(manifest_uri, json.dumps(self.manifest(files), indent=2))
+            loads.append((values, manifest_uri, files))
+
+        if self.dry_run:
+            for statement in statements:
+                print(f'{statement};\n')
+            for values, manifest_uri, _ in loads:
+                print(f'{self.table.copy_sql(manifest_uri, self.iam_role or "<iam-role>")};\n')
+                for statement in self.table.replace_partition_sql(values):
+                    print(f'{statement};\n')
+            return report
+
+        connection = self.connect()
+        try:
+            with connection:
+                with connection.cursor() as cursor:
+                    for statement in statements:
+                        cursor.execute(statement)
+                    for values, manifest_uri, files in loads:
+                        self.copy(cursor, manifest_uri, files)
+                        for statement in self.table.replace_partition_sql(values):
+                            cursor.execute(statement)
+
+            connection.autocommit = True
+            with connection.cursor() as cursor:
+                report['analyzed'] = self.analyze_if_needed(cursor)
+        finally:
+            connection.close()
+
+        self.commit(new_files)
+        report['seconds'] = round(time.monotonic() - started_at, 2)
+        return report
+
+    def copy(self, cursor, manifest_uri, files):
+        if self.dialect == 'redshift':
+            cursor.execute(self.table.copy_sql(manifest_uri, self.iam_role))
+            return
+
+        # Postgres stand-in: read the manifest entries locally and insert them into the staging table.
+        import pyarrow.parquet as pq
+        columns = self.table.schema.field_names
+        for file in files:
+            rows = pq.read_table(file['uri'], columns=columns).to_pylist()
+            if rows:
+                execute_values(cursor, f'INSERT INTO {self.table.staging_name} ({", ".join(columns)}) VALUES %s',
+                               [tuple(row[column] for column in columns) for row in rows], page_size=1000)
+
+    def analyze_if_needed(self, cursor):
+        if self.dialect == 'redshift':
+            cursor.execute(self.table.stats_off_sql())
+            row = cursor.fetchone()
+            if row is not None and row[0] is not None and row[0] < self.analyze_threshold_percent:
+                return False
+        cursor.execute(self.table.analyze_sql(self.dialect))
+        return True
+
+    def commit(self, new_files):
+        if new_files:
+            watermark = max(new_files.values())
+            previous = self.files_at_watermark if watermark == self.watermark else []
+            self.files_at_watermark = sorted(set(previous) | {uri for uri, modified_at in new_files.items()
+                                                                if modified_at == watermark})
+            self.watermark = watermark
+        self.storage.write_text(self.state_uri, json.dumps({
+            'watermark': self.watermark,
+            'files_at_watermark': self.files_at_watermark
+        }, indent=2))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load new processed and curated parquet files into Redshift.')
+    parser.add_argument('--environment', default='production')
+    parser.add_argument('--tables', nargs='*', help='tables to load, e.g. processed.orders, defaults to all')
+    parser.add_argument('--host', default=os.environ.get('REDSHIFT_HOST'))
+    parser.add_argument('--port', type=int, default=5439)
+    parser.add_argument('--database', default='dw')
+    parser.add_argument('--user', default='admin')
+    parser.add_argument('--iam-role', help='role Redshift assumes to read the manifests and files')
+    parser.add_argument('--dialect', choices=DIALECTS, default='redshift',
+                        help='postgres loads files through INSERT, to test the pipeline against a local stand-in')
+    parser.add_argument('--local-root', help='directory holding processed/ and curated/, instead of the S3 buckets')
+    parser.add_argument('--parallelism', type=int, default=4, help='tables loaded at the same time')
+    parser.add_argument('--analyze-threshold-percent', type=int, default=10,
+                        help='run ANALYZE only when the stale statistics of a table exceed this percentage')
+    parser.add_argument('--dry-run', action='store_true', help='write the manifests and print the SQL only')
+    args = parser.parse_args()
+
+    if args.dialect == 'redshift' and not args.iam_role and not args.dry_run:
+        parser.error('--iam-role is required to COPY into Redshift')
+
+    storage = LocalStorage() if args.local_root else S3Storage(boto3.client('s3'))
+
+    def layer_root(layer):
+        if args.local_root:
+            return os.path.join(args.local_root, layer)
+        return naming.data_lake_uri(args.environment, layer)
+
+    def connect():
+        return psycopg2.connect(host=args.host, port=args.port, dbname=args.database, user=args.user,
+                                password=os.environ['REDSHIFT_PASSWORD'])
+
+    tables = [table for table in WAREHOUSE_TABLES if not args.tables or table.name in args.tables]
+    loaders = [TableLoader(table, storage, layer_root(table.layer), connect, iam_role=args.iam_role,
+                           dialect=args.dialect, analyze_threshold_percent=args.analyze_threshold_percent,
+                           dry_run=args.dry_run) for table in tables]
+
+    with ThreadPoolExecutor(max_workers=args.parallelism) as executor:
+        for report in executor.map(TableLoader.load, loaders):
+            print(json.dumps(report))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,47 @@
+# execute from the repository root: PYTHONPATH=bootcamp_data_platform python redshift_jobs/sync_warehouse_objects.py
+import argparse
+import os
+
+import psycopg2
+from warehouse_sql import existing_objects_sql, objects_table_sql, sync_sql
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Create the Spectrum external schemas, tables and materialized views '
+                                                 'declared in warehouse_sql.py.')
+    parser.add_argument('--environment', default='production')
+    parser.add_argument('--host', default=os.environ.get('REDSHIFT_HOST'))
+    parser.add_argument('--port', type=int, default=5439)
+    parser.add_argument('--database', default='dw')
+    parser.add_argument('--user', default='admin')
+    parser.add_argument('--iam-role', required=True, help='Spectrum role ARN, see the data warehouse stack outputs')
+    parser.add_argument('--no-refresh', action='store_true',
+                        help='skip refreshing the materialized views that cannot auto refresh')
+    parser.add_argument('--dry-run', action='store_true', help='print the SQL without running it')
+    args = parser.parse_args()
+
+    if args.dry_run:
+        for statement in sync_sql(args.environment, args.iam_role, existing={}, refresh=not args.no_refresh):
+            print(f'{statement};\n')
+        return
+
+    connection = psycopg2.connect(host=args.host, port=args.port, dbname=args.database, user=args.user,
+                                  password=os.environ['REDSHIFT_PASSWORD'])
+    # External schemas and materialized views over external tables cannot be created inside a transaction block.
+    connection.autocommit = True
+    try:
+        with connection.cursor() as cursor:
+            for statement in objects_table_sql():
+                cursor.execute(statement)
+            cursor.execute(existing_objects_sql())
+            existing = dict(cursor.fetchall())
+
+            for statement in sync_sql(args.environment, args.iam_role, existing, refresh=not args.no_refresh):
+                print(statement.split('\n', 1)[0])
+                cursor.execute(statement)
+    finally:
+        connection.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+import itertools
+import json
+import os
+import runpy
+import sys
+from datetime import datetime, timedelta
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# The jobs, scripts and stacks import their neighbours flat, as they do on EMR and under PYTHONPATH.
+for directory in ('bootcamp_data_platform', 'pyspark_jobs', 'local_scripts', 'redshift_jobs',
+                  'lambdas/partition_registrar', 'lambdas/bucket_notifications'):
+    sys.path.insert(0, os.path.join(ROOT, directory))
+
+
+@pytest.fixture(scope='session')
+def spark():
+    pytest.importorskip('pyspark')
+    from pyspark.sql import SparkSession
+    session = SparkSession.builder\
+        .master('local[2]')\
+        .config('spark.sql.shuffle.partitions', '4')\
+        .config('spark.ui.enabled', 'false')\
+        .config('spark.sql.session.timeZone', 'UTC')\
+        .getOrCreate()
+    yield session
+    session.stop()
+
+
+@pytest.fixture(scope='session')
+def postgres_server(tmp_path_factory):
+    pgserver = pytest.importorskip('pgserver')
+    server = pgserver.get_server(str(tmp_path_factory.mktemp('postgres')), cleanup_mode='stop')
+    yield server
+    server.cleanup()
+
+
+DATABASES = itertools.count()
+
+
+@pytest.fixture
+def postgres(postgres_server):
+    # A database per test, the server is started once.
+    name = f'test_{next(DATABASES)}'
+    postgres_server.psql(f'CREATE DATABASE {name};')
+    yield {'dbname': name, 'user': 'postgres', 'password': '', 'host': str(postgres_server.pgdata), 'port': 5432}
+
+
+@pytest.fixture
+def run_job(spark, monkeypatch):
+    # Jobs run in the test process and pick up its session, as spark-submit would hand them one.
+    def run(script, *args):
+        monkeypatch.setattr(sys, 'argv', [script, *map(str, args)])
+        return runpy.run_path(os.path.join(ROOT, 'pyspark_jobs', script), run_name='__main__')
+    return run
+
+
+def hours_ago(hours):
+    return datetime.utcnow().replace(minute=0, second=0, microsecond=0) - timedelta(hours=hours)
+
+
+def atomic_event(event_id, timestamp, **fields):
+    return {'event_id': event_id, 'event_timestamp': f'{timestamp:%Y-%m-%d %H:%M:%S}', 'event_type': 'pageview',
+            'page_url_path': '/home', 'device_type': 'Desktop', 'user_domain_id': f'user-{event_id}', **fields}
+
+
+def write_raw(root, arrival_hour, events, name='part-0000'):
+    # Lays files out as Firehose does, one directory per arrival hour of newline delimited json.
+    directory = os.path.join(root, 'raw', 'atomic_events', f'year={arrival_hour:%Y}/month={arrival_hour:%m}/'
+                                                           f'day={arrival_hour:%d}/hour={arrival_hour:%H}')
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, name), 'w') as file:
+        file.writelines(json.dumps(event) + '\n' for event in events)
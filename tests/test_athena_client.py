@@ -0,0 +1,135 @@
+from datetime import datetime, timezone
+
+import boto3
+import pytest
+from athena_client import AthenaClient, AthenaQueryError, cache_key, normalize_sql
+from botocore.stub import ANY, Stubber
+
+moto = pytest.importorskip('moto')
+
+RESULTS_BUCKET = 'athena-results'
+WORKGROUP = 'workgroup'
+
+
+@pytest.fixture
+def s3():
+    with moto.mock_aws():
+        client = boto3.client('s3', region_name='us-east-1')
+        client.create_bucket(Bucket=RESULTS_BUCKET)
+        yield client
+
+
+@pytest.fixture
+def athena():
+    client = boto3.client('athena', region_name='us-east-1', aws_access_key_id='test', aws_secret_access_key='test')
+    with Stubber(client) as stubber:
+        yield client, stubber
+        stubber.assert_no_pending_responses()
+
+
+def execution(query_execution_id, state='SUCCEEDED', scanned=0, reason=None):
+    status = {'State': state, 'CompletionDateTime': datetime.now(timezone.utc)}
+    if reason:
+        status['StateChangeReason'] = reason
+    return {'QueryExecution': {'QueryExecutionId': query_execution_id, 'Status': status,
+                               'Statistics': {'DataScannedInBytes': scanned, 'EngineExecutionTimeInMillis': 10}}}
+
+
+def results(*values):
+    rows = [{'Data': [{'VarCharValue': 'event_type'}]}] + [{'Data': [{'VarCharValue': value}]} for value in values]
+    return {'ResultSet': {'Rows': rows, 'ResultSetMetadata': {'ColumnInfo': [
+        {'Name': 'event_type', 'Type': 'varchar'}]}}}
+
+
+def expect_query(stubber, query_execution_id, database, scanned=0, values=('pageview',)):
+    stubber.add_response('start_query_execution', {'QueryExecutionId': query_execution_id},
+                         {'QueryString': ANY, 'WorkGroup': WORKGROUP, 'QueryExecutionContext': {'Database': database}})
+    stubber.add_response('get_query_execution', execution(query_execution_id, scanned=scanned),
+                         {'QueryExecutionId': query_execution_id})
+    stubber.add_response('get_query_results', results(*values), {'QueryExecutionId': query_execution_id,
+                                                                 'MaxResults': ANY})
+
+
+def client(athena, s3, database='processed', **kwargs):
+    return AthenaClient(WORKGROUP, RESULTS_BUCKET, database=database, client=athena[0], s3_client=s3, **kwargs)
+
+
+def test_normalizes_whitespace_case_and_comments_outside_literals():
+    assert normalize_sql("SELECT  *\n FROM events -- all\nWHERE type = 'Page View';") == \
+        normalize_sql("select * from events where type = 'Page View'")
+    assert normalize_sql("select 'A'") != normalize_sql("select 'a'")
+    assert normalize_sql("select a/* x */from t--y\n") == 'select a from t'
+    assert normalize_sql('select a - b / c from t') == 'select a - b / c from t'
+
+
+def test_keeps_comment_markers_inside_literals():
+    assert normalize_sql("select * from t where url = 'http://x--a'") != \
+        normalize_sql("select * from t where url = 'http://x--b'")
+    assert normalize_sql("select '/*' as a, x from t where y='*/'") == "select '/*' as a, x from t where y= '*/'"
+    assert normalize_sql('select "a--b" from t -- c') == 'select "a--b" from t'
+
+
+def test_cache_key_covers_partitions_database_and_workgroup():
+    sql = 'select count(*) from atomic_events'
+    assert cache_key(sql, ['event_date=2020-10-01']) != cache_key(sql, ['event_date=2020-10-02'])
+    assert cache_key(sql, database='processed') != cache_key(sql, database='curated')
+    assert cache_key(sql, workgroup='a') != cache_key(sql, workgroup='b')
+    assert cache_key(sql.upper(), database='processed') == cache_key(sql, database='processed')
+
+
+def test_reuses_a_recent_result(athena, s3):
+    stubber = athena[1]
+    expect_query(stubber, 'q1', 'processed', scanned=100)
+    stubber.add_response('get_query_execution', execution('q1'), {'QueryExecutionId': 'q1'})
+    stubber.add_response('get_query_results', results('pageview'), {'QueryExecutionId': 'q1', 'MaxResults': ANY})
+
+    athena_client = client(athena, s3)
+    assert list(athena_client.query('select event_type from atomic_events')) == [{'event_type': 'pageview'}]
+    assert list(athena_client.query('SELECT event_type FROM atomic_events')) == [{'event_type': 'pageview'}]
+    assert [stats.cached for stats in athena_client.stats] == [False, True]
+    assert athena_client.bytes_scanned == 100
+
+
+def test_does_not_reuse_a_result_of_another_database(athena, s3):
+    stubber = athena[1]
+    expect_query(stubber, 'q1', 'processed')
+    expect_query(stubber, 'q2', 'curated', values=('click',))
+
+    sql = 'select event_type from atomic_events'
+    assert list(client(athena, s3, database='processed').query(sql)) == [{'event_type': 'pageview'}]
+    assert list(client(athena, s3, database='curated').query(sql)) == [{'event_type': 'click'}]
+
+
+def test_expired_results_are_not_reused(athena, s3):
+    stubber = athena[1]
+    expect_query(stubber, 'q1', 'processed')
+    expect_query(stubber, 'q2', 'processed')
+
+    athena_client = client(athena, s3, ttl_seconds=-1)
+    list(athena_client.query('select 1'))
+    list(athena_client.query('select 1'))
+    assert [stats.query_execution_id for stats in athena_client.stats] == ['q1', 'q2']
+
+
+def test_stops_once_the_scan_budget_is_spent(athena, s3):
+    expect_query(athena[1], 'q1', 'processed', scanned=2048)
+
+    athena_client = client(athena, s3, budget_bytes=1024)
+    list(athena_client.query('select 1'))
+    with pytest.raises(AthenaQueryError, match='budget'):
+        athena_client.query('select 2')
+
+
+def test_raises_the_reason_of_a_failed_query(athena, s3):
+    stubber = athena[1]
+    stubber.add_response('start_query_execution', {'QueryExecutionId': 'q1'})
+    stubber.add_response('get_query_execution', execution('q1', state='FAILED', reason='TABLE_NOT_FOUND'))
+
+    with pytest.raises(AthenaQueryError, match='q1 failed: TABLE_NOT_FOUND'):
+        client(athena, s3).query('select * from missing')
+
+
+def test_names_follow_the_environment():
+    athena_client = AthenaClient.for_environment('dev', client=object(), s3_client=object())
+    assert (athena_client.workgroup, athena_client.results_bucket) == \
+        ('s3-belisco-dev-data-lake-athena-workgroup', 's3-belisco-dev-data-lake-athena-results')
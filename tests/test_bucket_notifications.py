@@ -0,0 +1,51 @@
+import boto3
+import bucket_notifications
+import pytest
+
+moto = pytest.importorskip('moto')
+
+BUCKET = 'raw'
+REGISTRAR = 'arn:aws:lambda:us-east-1:123456789012:function:production-raw-partition-registrar'
+OTHER = 'arn:aws:lambda:us-east-1:123456789012:function:audit'
+
+
+@pytest.fixture
+def s3(monkeypatch):
+    with moto.mock_aws():
+        client = boto3.client('s3', region_name='us-east-1')
+        client.create_bucket(Bucket=BUCKET)
+        client.put_bucket_notification_configuration(Bucket=BUCKET, NotificationConfiguration={
+            'LambdaFunctionConfigurations': [{'Events': ['s3:ObjectRemoved:*'], 'LambdaFunctionArn': OTHER}]
+        })
+        monkeypatch.setattr(bucket_notifications, 'CLIENT', client)
+        yield client
+
+
+def configuration(function, prefix):
+    return {'Events': ['s3:ObjectCreated:*'], 'LambdaFunctionArn': function,
+            'Filter': {'Key': {'FilterRules': [{'Name': 'prefix', 'Value': prefix}]}}}
+
+
+def event(request_type, *configurations, old=None):
+    event = {'RequestType': request_type, 'ResourceProperties': {'Bucket': BUCKET, 'Configurations': list(configurations)}}
+    if old is not None:
+        event['OldResourceProperties'] = {'Bucket': BUCKET, 'Configurations': old}
+    return event
+
+
+def functions(s3):
+    configurations = s3.get_bucket_notification_configuration(Bucket=BUCKET).get('LambdaFunctionConfigurations', [])
+    return sorted((c['LambdaFunctionArn'], c['Filter']['Key']['FilterRules'][0]['Value'] if 'Filter' in c else None)
+                  for c in configurations)
+
+
+def test_keeps_the_other_notifications_of_the_bucket(s3):
+    bucket_notifications.handler(event('Create', configuration(REGISTRAR, 'atomic_events/')), None)
+    assert functions(s3) == [(OTHER, None), (REGISTRAR, 'atomic_events/')]
+
+    bucket_notifications.handler(event('Update', configuration(REGISTRAR, 'events/'),
+                                       old=[configuration(REGISTRAR, 'atomic_events/')]), None)
+    assert functions(s3) == [(OTHER, None), (REGISTRAR, 'events/')]
+
+    bucket_notifications.handler(event('Delete', configuration(REGISTRAR, 'events/')), None)
+    assert functions(s3) == [(OTHER, None)]
@@ -0,0 +1,179 @@
+import gzip
+import io
+import json
+
+import boto3
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+from compact_small_files import Compactor
+from partition_registrar import PartitionRegistrar
+
+moto = pytest.importorskip('moto')
+
+BUCKET = 'raw'
+DIRECTORY = 'atomic_events/year=2020/month=10/day=01/hour=08'
+
+
+@pytest.fixture
+def s3():
+    with moto.mock_aws():
+        client = boto3.client('s3', region_name='us-east-1')
+        client.create_bucket(Bucket=BUCKET)
+        yield client
+
+
+@pytest.fixture
+def glue(s3):
+    client = boto3.client('glue', region_name='us-east-1')
+    client.create_database(DatabaseInput={'Name': 'raw'})
+    client.create_table(DatabaseName='raw', TableInput={
+        'Name': 'atomic_events',
+        'StorageDescriptor': {'Columns': [{'Name': 'event_id', 'Type': 'string'}],
+                              'Location': f's3://{BUCKET}/atomic_events/'},
+        'PartitionKeys': [{'Name': key, 'Type': 'string'} for key in ['year', 'month', 'day', 'hour']],
+    })
+    return client
+
+
+def put_parquet(s3, key, table):
+    buffer = io.BytesIO()
+    pq.write_table(table, buffer)
+    s3.put_object(Bucket=BUCKET, Key=key, Body=buffer.getvalue())
+
+
+def put_gzip(s3, names, directory=DIRECTORY):
+    for name in names:
+        s3.put_object(Bucket=BUCKET, Key=f'{directory}/{name}',
+                      Body=gzip.compress(json.dumps({'event_id': name}).encode('utf-8') + b'\n'))
+
+
+def keys(s3, prefix=''):
+    return sorted(obj['Key'] for obj in s3.list_objects_v2(Bucket=BUCKET, Prefix=prefix).get('Contents', []))
+
+
+def published(s3, directory=DIRECTORY):
+    marker = json.loads(s3.get_object(Bucket=BUCKET, Key=f'{directory}/_compaction.json')['Body'].read())
+    return marker, keys(s3, f'{directory}/{marker["location"]}/')
+
+
+def compactor(s3, glue, prefix='atomic_events'):
+    return Compactor(s3, BUCKET, prefix, PartitionRegistrar(glue, 'raw', 'atomic_events'), min_age_minutes=0)
+
+
+def test_concatenates_gzip_json(s3, glue):
+    put_gzip(s3, ['part-0.gz', 'part-1.gz', 'part-2.gz'])
+
+    report = compactor(s3, glue).run()
+
+    assert (report['files_in'], report['files_out']) == (3, 1)
+    marker, [output] = published(s3)
+    assert keys(s3) == sorted([f'{DIRECTORY}/_compaction.json', output])
+    body = gzip.decompress(s3.get_object(Bucket=BUCKET, Key=output)['Body'].read())
+    assert [json.loads(line)['event_id'] for line in body.splitlines()] == ['part-0.gz', 'part-1.gz', 'part-2.gz']
+    partition = glue.get_partition(DatabaseName='raw', TableName='atomic_events',
+                                   PartitionValues=['2020', '10', '01', '08'])['Partition']
+    assert partition['StorageDescriptor']['Location'] == f's3://{BUCKET}/{DIRECTORY}/{marker["location"]}/'
+
+
+def test_merges_parquet_with_drifted_schemas(s3, glue):
+    put_parquet(s3, f'{DIRECTORY}/a.parquet', pa.table({'order_id': pa.array([1], pa.int32())}))
+    put_parquet(s3, f'{DIRECTORY}/b.parquet', pa.table({'order_id': pa.array([2], pa.int64()), 'value': [9.5]}))
+
+    compactor(s3, glue).run()
+
+    _, [output] = published(s3)
+    table = pq.read_table(io.BytesIO(s3.get_object(Bucket=BUCKET, Key=output)['Body'].read()))
+    assert table.schema.field('order_id').type == pa.int64()
+    assert table.to_pylist() == [{'order_id': 1, 'value': None}, {'order_id': 2, 'value': 9.5}]
+
+
+def test_merges_compacted_outputs_only_with_new_small_files(s3, glue):
+    put_gzip(s3, ['part-0.gz', 'part-1.gz'])
+    compactor(s3, glue).run()
+    first, _ = published(s3)
+    put_gzip(s3, ['late-0.gz'])
+
+    assert compactor(s3, glue).run()['partitions'] == []
+
+    put_gzip(s3, ['late-1.gz'])
+    compactor(s3, glue).run()
+
+    second, [output] = published(s3)
+    assert second['location'] != first['location']
+    assert keys(s3) == sorted([f'{DIRECTORY}/_compaction.json', output])
+    body = gzip.decompress(s3.get_object(Bucket=BUCKET, Key=output)['Body'].read())
+    assert sorted(json.loads(line)['event_id'] for line in body.splitlines()) == \
+        ['late-0.gz', 'late-1.gz', 'part-0.gz', 'part-1.gz']
+
+
+def test_leaves_dms_change_files_alone(s3, glue):
+    directory = 'orders/public/orders'
+    for index in range(2):
+        put_parquet(s3, f'{directory}/20201001-08000000{index}.parquet', pa.table({'order_id': [index]}))
+
+    report = compactor(s3, glue, prefix='orders').run()
+
+    assert report['partitions'] == []
+    assert len(keys(s3, directory)) == 2
+
+
+def test_publishes_outputs_before_deleting_inputs(s3, glue):
+    put_gzip(s3, ['part-0.gz', 'part-1.gz'])
+    calls = []
+    s3.meta.events.register('before-parameter-build.s3.DeleteObject',
+                            lambda params, **kwargs: calls.append(('delete', params['Key'])))
+    s3.meta.events.register('before-parameter-build.s3.PutObject',
+                            lambda params, **kwargs: calls.append(('put', params['Key'])))
+    for operation in ['CreatePartition', 'UpdatePartition']:
+        glue.meta.events.register(f'before-parameter-build.glue.{operation}',
+                                  lambda params, **kwargs: calls.append(('glue', None)))
+
+    compactor(s3, glue).run()
+
+    marker = calls.index(('put', f'{DIRECTORY}/_compaction.json'))
+    switch = calls.index(('glue', None))
+    deleted = [index for index, (operation, key) in enumerate(calls) if operation == 'delete' and '/part-' in key]
+    assert len(deleted) == 2 and max(marker, switch) < min(deleted)
+
+
+def test_recovers_an_interrupted_publish(s3, glue):
+    put_gzip(s3, ['part-0.gz', 'part-1.gz'])
+    interrupted = compactor(s3, glue)
+
+    def fail(manifest):
+        raise RuntimeError('interrupted')
+    interrupted.finish = fail
+    with pytest.raises(RuntimeError):
+        interrupted.run()
+
+    report = compactor(s3, glue).run()
+
+    assert len(report['recovered']) == 1
+    _, [output] = published(s3)
+    assert keys(s3) == sorted([f'{DIRECTORY}/_compaction.json', output])
+
+
+def test_discards_the_outputs_of_an_interrupted_compaction(s3, glue):
+    put_gzip(s3, ['part-0.gz', 'part-1.gz'])
+    interrupted = compactor(s3, glue)
+    interrupted.target_bytes = 1
+    written = []
+
+    def fail(objects, key):
+        if written:
+            raise RuntimeError('interrupted')
+        written.append(key)
+        s3.put_object(Bucket=BUCKET, Key=key, Body=b'')
+    interrupted.concatenate_gzip = fail
+    with pytest.raises(RuntimeError):
+        interrupted.run()
+    assert written[0] in keys(s3)
+
+    report = compactor(s3, glue).run()
+
+    assert report['recovered'] == [] and report['files_out'] == 1
+    _, [output] = published(s3)
+    assert keys(s3) == sorted([f'{DIRECTORY}/_compaction.json', output])
+    body = gzip.decompress(s3.get_object(Bucket=BUCKET, Key=output)['Body'].read())
+    assert len(body.splitlines()) == 2
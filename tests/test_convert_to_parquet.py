@@ -0,0 +1,98 @@
+import json
+import os
+from datetime import datetime
+
+from tests.conftest import atomic_event, hours_ago, write_raw
+
+
+def processed(spark, root):
+    return spark.read.parquet(os.path.join(root, 'processed', 'atomic_events'))
+
+
+def rows_by_hour(rows):
+    return {int(row.event_hour): row['count'] for row in rows.groupBy('event_hour').count().collect()}
+
+
+def test_processes_only_new_raw_partitions(spark, run_job, tmp_path, capsys):
+    root = str(tmp_path)
+    first, second = hours_ago(6), hours_ago(5)
+    write_raw(root, first, [atomic_event(f'a{index}', first.replace(minute=index)) for index in range(20)])
+
+    run_job('convert_to_parquet.py', '--local-root', root)
+    assert '1 raw partitions to process' in capsys.readouterr().out
+    assert processed(spark, root).count() == 20
+    with open(os.path.join(root, 'processed', '_checkpoints', 'atomic_events.json')) as file:
+        assert list(json.load(file)['partitions']) == [f'year={first:%Y}/month={first:%m}/day={first:%d}/hour={first:%H}']
+
+    run_job('convert_to_parquet.py', '--local-root', root)
+    assert '0 raw partitions to process' in capsys.readouterr().out
+
+    write_raw(root, second, [atomic_event(f'b{index}', second.replace(minute=index)) for index in range(10)])
+    run_job('convert_to_parquet.py', '--local-root', root)
+    assert '1 raw partitions to process' in capsys.readouterr().out
+    rows = processed(spark, root)
+    assert rows.count() == 30
+    assert rows_by_hour(rows) == {first.hour: 20, second.hour: 10}
+
+
+def test_a_late_file_rewrites_its_event_hour(spark, run_job, tmp_path, capsys):
+    root = str(tmp_path)
+    first, second = hours_ago(6), hours_ago(5)
+    write_raw(root, first, [atomic_event(f'a{index}', first.replace(minute=index)) for index in range(20)])
+    run_job('convert_to_parquet.py', '--local-root', root)
+
+    # Events of the first hour that arrive an hour late land in their own hour, next to the ones already written.
+    write_raw(root, second, [atomic_event(f'late{index}', first.replace(minute=50)) for index in range(5)])
+    run_job('convert_to_parquet.py', '--local-root', root)
+    assert rows_by_hour(processed(spark, root)) == {first.hour: 25}
+
+
+def test_reads_the_compacted_files_of_a_partition(spark, run_job, tmp_path):
+    root = str(tmp_path)
+    hour = hours_ago(6)
+    events = [atomic_event(f'a{index}', hour.replace(minute=index)) for index in range(10)]
+    # The compactor has published its output but not deleted its inputs yet, which are skipped whatever they hold,
+    # and a file has arrived since.
+    write_raw(root, hour, [atomic_event('stale', hour)], name='part-0000')
+    write_raw(root, hour, [atomic_event('b0', hour)], name='part-0002')
+    directory = os.path.join(root, 'raw', 'atomic_events', f'year={hour:%Y}/month={hour:%m}/day={hour:%d}/hour={hour:%H}')
+    os.makedirs(os.path.join(directory, '_compacted-1'))
+    with open(os.path.join(directory, '_compacted-1', 'part-00000'), 'w') as file:
+        file.writelines(json.dumps(event) + '\n' for event in events)
+    with open(os.path.join(directory, '_compaction.json'), 'w') as file:
+        json.dump({'location': '_compacted-1', 'inputs': ['part-0000', 'part-0001']}, file)
+
+    run_job('convert_to_parquet.py', '--local-root', root)
+
+    ids = {row.event_id for row in processed(spark, root).collect()}
+    assert ids == {f'a{index}' for index in range(10)} | {'b0'}
+
+
+def test_drops_retried_events(spark, run_job, tmp_path):
+    root = str(tmp_path)
+    first, second = hours_ago(6), hours_ago(4)
+    events = [atomic_event(f'a{index}', first.replace(minute=index)) for index in range(20)]
+    write_raw(root, first, events + events[:3])
+    run_job('convert_to_parquet.py', '--local-root', root)
+
+    # A retry delivered two hours later is past the lateness, it is clamped into a later hour and dropped by id.
+    write_raw(root, second, events[:5])
+    run_job('convert_to_parquet.py', '--local-root', root)
+    rows = processed(spark, root)
+    assert rows.count() == 20
+    assert rows.select('event_id').distinct().count() == 20
+
+
+def test_a_backfill_slice_drops_events_of_the_previous_slice(spark, run_job, tmp_path):
+    root = str(tmp_path)
+    evening, next_morning = datetime(2020, 10, 1, 22), datetime(2020, 10, 2, 3)
+    events = [atomic_event(f'a{index}', evening.replace(minute=index)) for index in range(10)]
+    write_raw(root, evening, events)
+    write_raw(root, next_morning, events[:4] + [atomic_event('b0', next_morning)])
+
+    # Slices run side by side, the second one finds the retries among the raw hours before its range even when it
+    # runs first.
+    run_job('convert_to_parquet.py', '--local-root', root, '--start', '2020-10-02', '--end', '2020-10-02')
+    run_job('convert_to_parquet.py', '--local-root', root, '--start', '2020-10-01', '--end', '2020-10-01')
+    rows = processed(spark, root)
+    assert sorted(row.event_id for row in rows.collect()) == sorted([f'a{index}' for index in range(10)] + ['b0'])
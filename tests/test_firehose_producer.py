@@ -0,0 +1,68 @@
+import json
+
+import pytest
+from firehose_producer import FirehoseProducer, KinesisProducer
+
+
+class Exceptions:
+
+    class ServiceUnavailableException(Exception):
+        pass
+
+    class ProvisionedThroughputExceededException(Exception):
+        pass
+
+
+class StubClient:
+    exceptions = Exceptions
+
+    def __init__(self, fail_calls=()):
+        self.fail_calls = set(fail_calls)
+        self.calls = 0
+        self.records = []
+
+    def _put(self, records):
+        self.calls += 1
+        if self.calls in self.fail_calls:
+            raise RuntimeError(f'call {self.calls} failed')
+        self.records += [record['Data'] for record in records]
+        return [{} for _ in records]
+
+    def put_record_batch(self, DeliveryStreamName, Records):
+        return {'FailedPutCount': 0, 'RequestResponses': self._put(Records)}
+
+    def put_records(self, StreamName, Records):
+        return {'FailedRecordCount': 0, 'Records': self._put(Records)}
+
+
+@pytest.mark.parametrize('producer_class', [FirehoseProducer, KinesisProducer])
+def test_sends_every_event_once(producer_class):
+    client = StubClient()
+    with producer_class('stream', client=client, max_batch_records=10) as producer:
+        for index in range(100):
+            producer.put({'event_id': str(index)})
+    assert sorted(json.loads(data)['event_id'] for data in client.records) == sorted(map(str, range(100)))
+    assert producer.stats()['records_sent'] == 100
+
+
+@pytest.mark.parametrize('producer_class', [FirehoseProducer, KinesisProducer])
+def test_close_raises_a_failed_batch(producer_class):
+    client = StubClient(fail_calls={1})
+    producer = producer_class('stream', client=client, max_batch_records=10, max_workers=1)
+    for index in range(100):
+        producer.put({'event_id': str(index)})
+    with pytest.raises(RuntimeError, match='call 1 failed'):
+        producer.close()
+    assert producer.stats()['records_sent'] == 90
+    assert producer.stats()['records_failed'] == 10
+
+
+def test_flush_reports_a_failure_once():
+    producer = FirehoseProducer('stream', client=StubClient(fail_calls={1}), max_batch_records=10)
+    producer.put({'event_id': '1'})
+    with pytest.raises(RuntimeError):
+        producer.flush()
+    producer.put({'event_id': '2'})
+    producer.close()
+    assert producer.stats()['records_sent'] == 1
+    assert producer.stats()['records_failed'] == 1
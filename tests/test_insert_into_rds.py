@@ -0,0 +1,70 @@
+import importlib
+
+import pytest
+from psycopg2.pool import ThreadedConnectionPool
+
+
+@pytest.fixture
+def rds(postgres, monkeypatch):
+    # The script reads its connection from the environment when it is imported.
+    for key, value in postgres.items():
+        monkeypatch.setenv(key, str(value))
+    module = importlib.reload(importlib.import_module('insert_into_rds'))
+    pool = ThreadedConnectionPool(2, 2, module.dsn)
+    conn = pool.getconn()
+    module.reset_table(conn)
+    pool.putconn(conn)
+    yield module, pool
+    pool.closeall()
+
+
+def orders_in_table(pool):
+    conn = pool.getconn()
+    try:
+        with conn.cursor() as cur:
+            cur.execute('select count(*), count(distinct order_id) from orders')
+            return cur.fetchone()
+    finally:
+        conn.rollback()
+        pool.putconn(conn)
+
+
+@pytest.mark.parametrize('method', ['copy', 'values'])
+def test_inserts_updates_and_deletes(rds, method):
+    module, pool = rds
+    generator = module.OrderGenerator(pool, workers=2, batch_size=50, rate=2000, update_ratio=0.2, delete_ratio=0.1,
+                                      method=method)
+    report = generator.run(duration_seconds=1, report_every_seconds=0.2)
+
+    assert report['errors'] == 0 and report['insert'] > 0
+    assert 0 < report['update'] and 0 < report['delete']
+    # Counts come from the rows the statements touched, so the table holds exactly the inserts left undeleted.
+    assert orders_in_table(pool) == (report['insert'] - report['delete'],) * 2
+    assert report['p50_commit_latency_ms'] <= report['p99_commit_latency_ms']
+
+
+def test_resumes_after_the_highest_order_id(rds):
+    module, pool = rds
+    conn = pool.getconn()
+    with conn.cursor() as cur:
+        cur.execute('insert into orders values (now(), 41, %s, 1.0)', ('casa',))
+    conn.commit()
+    assert module.max_order_id(conn) == 41
+    pool.putconn(conn)
+
+
+def test_failed_batches_are_paced_and_reported(rds):
+    module, pool = rds
+    conn = pool.getconn()
+    with conn.cursor() as cur:
+        cur.execute('drop table orders')
+    conn.commit()
+    pool.putconn(conn)
+
+    generator = module.OrderGenerator(pool, workers=1, batch_size=10, rate=100, update_ratio=0, delete_ratio=0,
+                                      method='values')
+    report = generator.run(duration_seconds=1, report_every_seconds=0.2)
+    # 100 rows/s in batches of 10 is 10 attempts a second, failed or not.
+    assert 5 <= report['errors'] <= 15
+    assert 'UndefinedTable' in report['first_error']
+    assert report['insert'] == 0
@@ -0,0 +1,143 @@
+import os
+import threading
+
+import boto3
+import pytest
+from firehose_producer import KinesisProducer
+from kinesis_consumer import FileCheckpoint, KinesisConsumer, decode
+
+moto = pytest.importorskip('moto')
+
+STREAM = 'atomic-events'
+
+
+@pytest.fixture
+def kinesis():
+    with moto.mock_aws():
+        client = boto3.client('kinesis', region_name='us-east-1')
+        client.create_stream(StreamName=STREAM, ShardCount=2)
+        yield client
+
+
+def produce(client, event_ids, **kwargs):
+    # One worker, the stand-in is not safe for concurrent puts.
+    with KinesisProducer(STREAM, client=client, max_workers=1, **kwargs) as producer:
+        for event_id in event_ids:
+            producer.put({'event_id': event_id, 'event_type': 'pageview'})
+    return producer
+
+
+def consume(client, checkpoint, handler=None, **kwargs):
+    received = []
+
+    def collect(shard_id, events):
+        if handler:
+            handler(shard_id, events)
+        received.extend(event['event_id'] for event in events)
+
+    consumer = KinesisConsumer(STREAM, collect, checkpoint, client=client, poll_seconds=0.2, **kwargs)
+    consumer.run(duration_seconds=1.5)
+    return received, consumer
+
+
+def test_reads_every_event_of_every_shard(kinesis, tmp_path):
+    produce(kinesis, [f'a{index}' for index in range(50)])
+    produce(kinesis, [f'b{index}' for index in range(50)], aggregate_records=True)
+
+    received, consumer = consume(kinesis, FileCheckpoint(str(tmp_path / 'checkpoint')))
+    assert sorted(received) == sorted([f'a{index}' for index in range(50)] + [f'b{index}' for index in range(50)])
+    stats = consumer.stats()
+    assert stats['shards'] == 2 and stats['events_received'] == 100
+    # Aggregated events share records, so there are fewer records than events.
+    assert stats['records_received'] < 100
+
+
+def test_resumes_after_the_checkpoint(kinesis, tmp_path):
+    path = str(tmp_path / 'checkpoint')
+    produce(kinesis, [f'a{index}' for index in range(20)])
+    assert len(consume(kinesis, FileCheckpoint(path))[0]) == 20
+
+    produce(kinesis, [f'b{index}' for index in range(10)])
+    received, _ = consume(kinesis, FileCheckpoint(path))
+    assert sorted(received) == sorted(f'b{index}' for index in range(10))
+    assert set(os.listdir(path)) == {f'{shard["ShardId"]}.json'
+                                     for shard in kinesis.list_shards(StreamName=STREAM)['Shards']}
+
+
+def test_a_failed_batch_is_read_again(kinesis, tmp_path):
+    path = str(tmp_path / 'checkpoint')
+    produce(kinesis, [f'a{index}' for index in range(20)])
+
+    def fail(shard_id, events):
+        raise RuntimeError('handler failed')
+
+    with pytest.raises(RuntimeError, match='handler failed'):
+        consume(kinesis, FileCheckpoint(path), handler=fail)
+    received, _ = consume(kinesis, FileCheckpoint(path))
+    assert sorted(received) == sorted(f'a{index}' for index in range(20))
+
+
+def test_workers_split_the_shards(kinesis, tmp_path):
+    produce(kinesis, [f'a{index}' for index in range(40)])
+    first, first_consumer = consume(kinesis, FileCheckpoint(str(tmp_path / 'checkpoint')), worker_count=2)
+    second, second_consumer = consume(kinesis, FileCheckpoint(str(tmp_path / 'checkpoint')), worker_index=1,
+                                      worker_count=2)
+    assert first_consumer.stats()['shards'] == second_consumer.stats()['shards'] == 1
+    assert sorted(first + second) == sorted(f'a{index}' for index in range(40))
+
+
+class SplitShards:
+    # The stand-in keeps writing to a split shard and never ends it, Kinesis ends it with a last empty batch
+    # without a next iterator.
+
+    def __init__(self, client, split):
+        self.client = client
+        self.split = split
+        self.shards = {}
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+    def get_shard_iterator(self, ShardId, **kwargs):
+        response = self.client.get_shard_iterator(ShardId=ShardId, **kwargs)
+        self.shards[response['ShardIterator']] = ShardId
+        return response
+
+    def get_records(self, ShardIterator, **kwargs):
+        response = self.client.get_records(ShardIterator=ShardIterator, **kwargs)
+        shard_id = self.shards[ShardIterator]
+        if shard_id in self.split and not response['Records']:
+            return {**response, 'NextShardIterator': None}
+        self.shards[response['NextShardIterator']] = shard_id
+        return response
+
+
+def test_workers_start_the_children_of_a_parent_read_by_another_worker(kinesis, tmp_path):
+    produce(kinesis, [f'a{index}' for index in range(20)])
+    parent = kinesis.list_shards(StreamName=STREAM)['Shards'][0]
+    start, end = (int(parent['HashKeyRange'][key]) for key in ('StartingHashKey', 'EndingHashKey'))
+    kinesis.split_shard(StreamName=STREAM, ShardToSplit=parent['ShardId'], NewStartingHashKey=str((start + end) // 2))
+    children = {shard['ShardId'] for shard in kinesis.list_shards(StreamName=STREAM)['Shards']
+                if shard.get('ParentShardId') == parent['ShardId']}
+    client = SplitShards(kinesis, {parent['ShardId']})
+
+    # The workers share the checkpoint, and one of the children belongs to the worker not reading the parent.
+    results = {}
+
+    def work(worker_index):
+        results[worker_index] = consume(client, FileCheckpoint(str(tmp_path / 'checkpoint')), worker_count=2,
+                                        worker_index=worker_index, shard_refresh_seconds=0.2)
+    workers = [threading.Thread(target=work, args=(index,)) for index in range(2)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    assert sorted(results[0][0] + results[1][0]) == sorted(f'a{index}' for index in range(20))
+    started = [set(consumer._threads) & children for _, consumer in results.values()]
+    assert all(len(shards) == 1 for shards in started) and set.union(*started) == children
+
+
+def test_decode_splits_aggregated_records():
+    records = [{'Data': b'{"event_id": "a"}\n{"event_id": "b"}\n'}, {'Data': b'{"event_id": "c"}\n\n'}]
+    assert [event['event_id'] for event in decode(records)] == ['a', 'b', 'c']
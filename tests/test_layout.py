@@ -0,0 +1,23 @@
+import argparse
+
+import pytest
+from layout import ATOMIC_EVENTS_LAYOUT, ParquetLayout
+
+
+def parse(*args, **kwargs):
+    parser = argparse.ArgumentParser()
+    ParquetLayout.add_arguments(parser, default=ATOMIC_EVENTS_LAYOUT, **kwargs)
+    return ParquetLayout.from_arguments(parser.parse_args(args))
+
+
+def test_arguments_override_the_default_layout():
+    layout = parse('--partition-by', 'event_date', '--sort-by', 'event_type,', '--compression', 'zstd')
+    assert (layout.partition_by, layout.sort_by, layout.compression) == (['event_date'], ['event_type'], 'zstd')
+    assert layout.target_file_mb == ATOMIC_EVENTS_LAYOUT.target_file_mb
+
+
+def test_fixed_partitioning_keeps_the_default_partitions():
+    layout = parse('--target-file-mb', '128', partitioning=False)
+    assert layout.partition_by == ['event_date', 'event_hour'] and layout.target_file_mb == 128
+    with pytest.raises(SystemExit):
+        parse('--partition-by', 'event_type', partitioning=False)
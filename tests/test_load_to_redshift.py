@@ -0,0 +1,96 @@
+import itertools
+import json
+import os
+import time
+
+import psycopg2
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+from load_to_redshift import LocalStorage, TableLoader
+from warehouse_sql import WAREHOUSE_TABLES
+
+TABLE = next(table for table in WAREHOUSE_TABLES if table.name == 'curated.revenue_by_product_daily')
+SCHEMA = pa.schema([('product_name', pa.string()), ('orders', pa.int64()), ('revenue', pa.float64())])
+# Each write gets a later modification time, the loader tracks files by them.
+CLOCK = itertools.count(int(time.time()))
+
+
+def write_partition(root, order_date, rows, schema=SCHEMA):
+    # Laid out as Spark writes the rollup, the partition value is in the path only.
+    directory = os.path.join(root, 'curated', TABLE.schema.name, f'order_date={order_date}')
+    os.makedirs(directory, exist_ok=True)
+    for name in os.listdir(directory):
+        os.remove(os.path.join(directory, name))
+    path = os.path.join(directory, 'part-00000.parquet')
+    pq.write_table(pa.Table.from_pylist([dict(zip(schema.names, row)) for row in rows], schema), path)
+    modified_at = next(CLOCK)
+    os.utime(path, (modified_at, modified_at))
+    return path
+
+
+@pytest.fixture
+def warehouse(tmp_path, postgres):
+    root = str(tmp_path)
+
+    def loader():
+        return TableLoader(TABLE, LocalStorage(), os.path.join(root, 'curated'), lambda: psycopg2.connect(**postgres),
+                           dialect='postgres')
+
+    def rows():
+        with psycopg2.connect(**postgres) as connection, connection.cursor() as cursor:
+            cursor.execute('SELECT to_regclass(%s)', (TABLE.name,))
+            if cursor.fetchone()[0] is None:
+                return None
+            cursor.execute(f'SELECT order_date, product_name, orders, revenue FROM {TABLE.name} ORDER BY 1, 2')
+            return cursor.fetchall()
+    return root, loader, rows
+
+
+def state(root):
+    with open(os.path.join(root, 'curated', '_checkpoints', 'redshift', f'{TABLE.schema.name}.json')) as file:
+        return json.load(file)
+
+
+def test_replaces_the_partitions_with_new_files(warehouse):
+    root, loader, rows = warehouse
+    first = write_partition(root, '2020-10-01', [('casa', 2, 30.0)])
+    write_partition(root, '2020-10-02', [('casa', 1, 10.0), ('mesa', 1, 5.0)])
+
+    report = loader().load()
+
+    assert (report['partitions'], report['files']) == (2, 2)
+    assert rows() == [('2020-10-01', 'casa', 2, 30.0), ('2020-10-02', 'casa', 1, 10.0), ('2020-10-02', 'mesa', 1, 5.0)]
+    manifests = os.path.join(root, 'curated', '_manifests', 'redshift', TABLE.schema.name)
+    entries = []
+    for name in sorted(os.listdir(manifests)):
+        with open(os.path.join(manifests, name)) as file:
+            entries += json.load(file)['entries']
+    assert entries[0] == {'url': first, 'mandatory': True, 'meta': {'content_length': os.path.getsize(first)}}
+    assert len(entries) == 2
+
+    # The rewritten date is deleted and inserted again, the other one is left alone.
+    write_partition(root, '2020-10-02', [('casa', 3, 40.0)])
+    assert loader().load()['partitions'] == 1
+    assert rows() == [('2020-10-01', 'casa', 2, 30.0), ('2020-10-02', 'casa', 3, 40.0)]
+
+    assert loader().load()['partitions'] == 0
+
+
+def test_commits_the_checkpoint_only_after_the_load(warehouse):
+    root, loader, rows = warehouse
+    write_partition(root, '2020-10-01', [('casa', 2, 30.0)])
+    broken = write_partition(root, '2020-10-02', [('casa',)], schema=pa.schema([('product_name', pa.string())]))
+
+    with pytest.raises(Exception):
+        loader().load()
+    assert rows() is None
+    assert not os.path.exists(os.path.join(root, 'curated', '_checkpoints'))
+
+    os.remove(broken)
+    write_partition(root, '2020-10-02', [('casa', 1, 10.0)])
+    assert loader().load()['partitions'] == 2
+    assert rows() == [('2020-10-01', 'casa', 2, 30.0), ('2020-10-02', 'casa', 1, 10.0)]
+    assert state(root)['watermark'] == max(int(os.path.getmtime(path) * 1000) for path in [
+        os.path.join(root, 'curated', TABLE.schema.name, f'order_date={date}', 'part-00000.parquet')
+        for date in ('2020-10-01', '2020-10-02')])
@@ -0,0 +1,87 @@
+import os
+import shutil
+from datetime import datetime, timedelta
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+SCHEMA = pa.schema([('op', pa.string()), ('extracted_at', pa.string()), ('created_at', pa.timestamp('us')),
+                    ('order_id', pa.int32()), ('product_name', pa.string()), ('value', pa.float64())])
+
+
+def write_changes(root, name, changes):
+    # Laid out as DMS writes them, parquet change files directly under the table prefix.
+    directory = os.path.join(root, 'raw', 'orders', 'public', 'orders')
+    os.makedirs(directory, exist_ok=True)
+    # Recent extraction times, tombstones older than their retention are dropped.
+    extracted_at = datetime.utcnow().replace(second=0, microsecond=0) - timedelta(hours=1)
+    rows = [{'op': op, 'extracted_at': f'{extracted_at + timedelta(minutes=minutes):%Y-%m-%d %H:%M:%S}',
+             'created_at': datetime(2020, 10, 1), 'order_id': order_id, 'product_name': 'casa', 'value': value}
+            for op, minutes, order_id, value in changes]
+    path = os.path.join(directory, name)
+    pq.write_table(pa.Table.from_pylist(rows, SCHEMA), path)
+    return path
+
+
+def current_orders(spark, root):
+    rows = spark.read.parquet(os.path.join(root, 'processed', 'orders')).collect()
+    return {row.order_id: row.value for row in rows}
+
+
+def test_merges_changes_into_the_current_state(spark, run_job, tmp_path, capsys):
+    root = str(tmp_path)
+    first = write_changes(root, '20201001-080000000.parquet', [('I', 1, 1, 10.0), ('I', 1, 2, 20.0), ('I', 1, 3, 30.0)])
+    run_job('merge_orders_cdc.py', '--local-root', root)
+    assert current_orders(spark, root) == {1: 10.0, 2: 20.0, 3: 30.0}
+
+    write_changes(root, '20201001-090000000.parquet', [('U', 2, 2, 25.0), ('D', 3, 3, None)])
+    run_job('merge_orders_cdc.py', '--local-root', root)
+    assert '1 change files to merge' in capsys.readouterr().out
+    assert current_orders(spark, root) == {1: 10.0, 2: 25.0}
+    tombstones = spark.read.parquet(os.path.join(root, 'processed', '_tombstones', 'orders')).collect()
+    assert [(row.order_id, row.op) for row in tombstones] == [(3, 'D')]
+
+    # A replayed older change file is merged again, the tombstone keeps the deleted order from coming back.
+    shutil.copy(first, os.path.join(os.path.dirname(first), '20201001-100000000.parquet'))
+    run_job('merge_orders_cdc.py', '--local-root', root)
+    assert current_orders(spark, root) == {1: 10.0, 2: 25.0}
+
+    run_job('merge_orders_cdc.py', '--local-root', root)
+    assert '0 change files to merge' in capsys.readouterr().out
+
+
+def test_full_refresh_rebuilds_from_every_change_file(spark, run_job, tmp_path):
+    root = str(tmp_path)
+    write_changes(root, '20201001-080000000.parquet', [('I', 1, 1, 10.0), ('I', 1, 200001, 20.0)])
+    write_changes(root, '20201001-090000000.parquet', [('U', 2, 200001, 21.0)])
+    run_job('merge_orders_cdc.py', '--local-root', root)
+    run_job('merge_orders_cdc.py', '--local-root', root, '--full-refresh')
+    orders = spark.read.parquet(os.path.join(root, 'processed', 'orders'))
+    assert current_orders(spark, root) == {1: 10.0, 200001: 21.0}
+    assert sorted(int(row.order_range) for row in orders.select('order_range').distinct().collect()) == [0, 2]
+
+
+def test_deleting_every_order_of_a_range_empties_it(spark, run_job, tmp_path):
+    root = str(tmp_path)
+    write_changes(root, '20201001-080000000.parquet', [('I', 1, 1, 10.0), ('I', 1, 200001, 20.0)])
+    run_job('merge_orders_cdc.py', '--local-root', root)
+    write_changes(root, '20201001-090000000.parquet', [('D', 2, 200001, None)])
+    run_job('merge_orders_cdc.py', '--local-root', root)
+    assert current_orders(spark, root) == {1: 10.0}
+
+
+def test_deleting_an_order_rebuilds_the_revenue_of_its_date(spark, run_job, tmp_path):
+    root = str(tmp_path)
+    write_changes(root, '20201001-080000000.parquet', [('I', 1, 1, 10.0), ('I', 1, 200001, 20.0)])
+    run_job('merge_orders_cdc.py', '--local-root', root)
+    run_job('build_revenue_rollups.py', '--local-root', root)
+
+    # The delete empties its order range and carries the key only, as DMS sends it without a full replica identity.
+    path = write_changes(root, '20201001-090000000.parquet', [('D', 2, 200001, None)])
+    changes = pq.read_table(path)
+    pq.write_table(changes.set_column(2, 'created_at', pa.nulls(1, pa.timestamp('us'))), path)
+    run_job('merge_orders_cdc.py', '--local-root', root)
+    run_job('build_revenue_rollups.py', '--local-root', root)
+
+    revenue = spark.read.parquet(os.path.join(root, 'curated', 'revenue_by_product_daily')).collect()
+    assert [(str(row.order_date), row.orders, row.revenue) for row in revenue] == [('2020-10-01', 1, 10.0)]
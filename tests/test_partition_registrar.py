@@ -0,0 +1,69 @@
+import json
+
+import boto3
+import partition_registrar
+import pytest
+from partition_registrar import PartitionRegistrar
+
+moto = pytest.importorskip('moto')
+
+DATABASE = 'raw'
+LOCATION = 's3://raw-bucket/atomic_events/'
+
+
+@pytest.fixture
+def glue(monkeypatch):
+    with moto.mock_aws():
+        client = boto3.client('glue', region_name='us-east-1')
+        client.create_database(DatabaseInput={'Name': DATABASE})
+        client.create_table(DatabaseName=DATABASE, TableInput={
+            'Name': 'atomic_events',
+            'StorageDescriptor': {'Columns': [{'Name': 'event_id', 'Type': 'string'}], 'Location': LOCATION},
+            'PartitionKeys': [{'Name': key, 'Type': 'string'} for key in ('year', 'month', 'day', 'hour')],
+        })
+        monkeypatch.setattr(partition_registrar.boto3, 'client', lambda service: client)
+        monkeypatch.setattr(partition_registrar, 'REGISTRARS', None)
+        monkeypatch.setenv('TABLES', json.dumps({'atomic_events': [DATABASE, 'atomic_events']}))
+        yield client
+
+
+def s3_event(*keys):
+    return {'Records': [{'s3': {'object': {'key': key}}} for key in keys]}
+
+
+def partitions(glue):
+    return {tuple(partition['Values']): partition['StorageDescriptor']['Location']
+            for partition in glue.get_partitions(DatabaseName=DATABASE, TableName='atomic_events')['Partitions']}
+
+
+def test_registers_the_partitions_of_new_objects(glue):
+    created = partition_registrar.handler(s3_event(
+        'atomic_events/year%3D2020/month%3D10/day%3D01/hour%3D08/firehose-1.gz',
+        'atomic_events/year=2020/month=10/day=01/hour=08/firehose-2.gz',
+        'atomic_events/year=2020/month=10/day=01/hour=09/firehose-3.gz',
+        'orders/public/orders/20201001-08.parquet',
+        'atomic_events/bad_records/file.gz',
+    ), None)
+
+    assert created == {'raw.atomic_events': ['2020/10/01/08', '2020/10/01/09']}
+    assert partitions(glue) == {
+        ('2020', '10', '01', '08'): f'{LOCATION}year=2020/month=10/day=01/hour=08/',
+        ('2020', '10', '01', '09'): f'{LOCATION}year=2020/month=10/day=01/hour=09/',
+    }
+
+
+def test_known_partitions_are_not_created_again(glue):
+    key = 'atomic_events/year=2020/month=10/day=01/hour=08/firehose-1.gz'
+    partition_registrar.handler(s3_event(key), None)
+    # A cold start forgets the partitions it created, the catalog still has them.
+    partition_registrar.REGISTRARS = None
+    assert partition_registrar.handler(s3_event(key), None) == {}
+    assert len(partitions(glue)) == 1
+
+
+def test_registers_in_batches(glue):
+    registrar = PartitionRegistrar(glue, DATABASE, 'atomic_events')
+    hours = [('2020', '10', f'{day:02d}', f'{hour:02d}') for day in range(1, 6) for hour in range(24)]
+    assert len(registrar.register(hours)) == 120
+    assert registrar.register(hours) == []
+    assert len(partitions(glue)) == 120
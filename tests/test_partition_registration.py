@@ -0,0 +1,54 @@
+import boto3
+import pytest
+
+from tests.conftest import atomic_event, hours_ago, write_raw
+from tests.test_merge_orders_cdc import write_changes
+
+moto = pytest.importorskip('moto')
+
+TABLES = {
+    'processed': {'atomic_events': ['event_date', 'event_hour'], 'orders': ['order_range']},
+    'curated': {'page_views_hourly': ['event_date'], 'sessions_daily': ['event_date'], 'funnel_daily': ['event_date'],
+                'revenue_by_product_daily': ['order_date'], 'atomic_events_quality': ['event_date', 'event_hour']},
+}
+
+
+@pytest.fixture
+def glue(monkeypatch):
+    monkeypatch.setenv('AWS_DEFAULT_REGION', 'us-east-1')
+    with moto.mock_aws():
+        client = boto3.client('glue')
+        for database, tables in TABLES.items():
+            client.create_database(DatabaseInput={'Name': database})
+            for table, keys in tables.items():
+                client.create_table(DatabaseName=database, TableInput={
+                    'Name': table,
+                    'StorageDescriptor': {'Columns': [], 'Location': f's3://{database}/{table}/'},
+                    'PartitionKeys': [{'Name': key, 'Type': 'string'} for key in keys],
+                })
+        yield client
+
+
+def partitions(glue, database, table):
+    return sorted(tuple(partition['Values'])
+                  for partition in glue.get_partitions(DatabaseName=database, TableName=table)['Partitions'])
+
+
+def test_jobs_register_the_partitions_they_write(glue, run_job, tmp_path):
+    root = str(tmp_path)
+    hour = hours_ago(6)
+    write_raw(root, hour, [atomic_event(f'a{index}', hour.replace(minute=index)) for index in range(10)])
+    write_changes(root, '20201001-080000000.parquet', [('I', 1, 1, 10.0), ('I', 1, 250000, 20.0)])
+
+    run_job('convert_to_parquet.py', '--local-root', root, '--glue-table', 'processed.atomic_events',
+            '--glue-curated-database', 'curated')
+    run_job('merge_orders_cdc.py', '--local-root', root, '--glue-table', 'processed.orders')
+    run_job('build_event_rollups.py', '--local-root', root, '--glue-database', 'curated')
+    run_job('build_revenue_rollups.py', '--local-root', root, '--glue-database', 'curated')
+
+    assert partitions(glue, 'processed', 'atomic_events') == [(f'{hour:%Y-%m-%d}', str(hour.hour))]
+    assert partitions(glue, 'curated', 'atomic_events_quality') == [(f'{hour:%Y-%m-%d}', str(hour.hour))]
+    assert partitions(glue, 'processed', 'orders') == [('0',), ('2',)]
+    for table in ('page_views_hourly', 'sessions_daily', 'funnel_daily'):
+        assert partitions(glue, 'curated', table) == [(f'{hour:%Y-%m-%d}',)]
+    assert partitions(glue, 'curated', 'revenue_by_product_daily') == [('2020-10-01',)]
@@ -0,0 +1,17 @@
+import os
+
+from partitions import HadoopFileSystem
+
+
+def test_deletes_the_partitions_of_rebuilt_dates_left_without_rows(spark, tmp_path):
+    root = str(tmp_path / 'page_views_hourly')
+    for partition in ['event_date=2020-10-01/event_hour=1', 'event_date=2020-10-01/event_hour=2',
+                      'event_date=2020-10-02/event_hour=1', 'event_date=2020-10-03/event_hour=1']:
+        os.makedirs(os.path.join(root, partition))
+        open(os.path.join(root, partition, 'part-0.parquet'), 'w').close()
+
+    HadoopFileSystem(spark, root).delete_stale_partitions(
+        root, ['event_date', 'event_hour'], [('2020-10-01',), ('2020-10-02',)], {('2020-10-01', '1')})
+
+    remaining = sorted(os.path.relpath(directory, root) for directory, _, files in os.walk(root) if files)
+    assert remaining == ['event_date=2020-10-01/event_hour=1', 'event_date=2020-10-03/event_hour=1']
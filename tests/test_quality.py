@@ -0,0 +1,124 @@
+import os
+
+import pytest
+from quality import CORRUPT_RECORD, DUPLICATE, ERRORS, QualityCheck
+from schemas import Field, Schema
+
+from tests.conftest import atomic_event, hours_ago, write_raw
+
+EVENTS = Schema('events', 1, [
+    Field('event_id', 'string', nullable=False),
+    Field('event_timestamp', 'string', nullable=False),
+    Field('country', 'string'),
+])
+DDL = f'{EVENTS.ddl()}, `{CORRUPT_RECORD}` string, hour int'
+
+
+def check(**kwargs):
+    return QualityCheck(EVENTS, partition_by=['hour'], unique_key='event_id', timestamp_fields=['event_timestamp'],
+                        **kwargs)
+
+
+def test_annotates_each_failed_check(spark):
+    df = spark.createDataFrame([
+        ('a', '2020-10-01 10:00:00', 'BR', None, 10),
+        ('b', 'yesterday', 'BR', None, 10),
+        (None, '2020-10-01 10:00:00', None, None, 10),
+        (None, None, None, '{"event_id": ', 10),
+    ], DDL)
+    rows = check().annotate(df).collect()
+    errors = {row.event_id or row[CORRUPT_RECORD] or 'no id': sorted(row[ERRORS]) for row in rows}
+    assert errors == {
+        'a': [],
+        'b': ['invalid_event_timestamp'],
+        'no id': ['missing_event_id'],
+        '{"event_id": ': ['missing_event_id', 'missing_event_timestamp', 'schema_violation'],
+    }
+    # Records without a key are never duplicates of each other.
+    assert not any(row[DUPLICATE] for row in rows)
+
+
+def test_keeps_the_first_copy_of_a_key(spark):
+    df = spark.createDataFrame([
+        ('a', '2020-10-01 10:05:00', 'late copy', None, 10),
+        ('a', '2020-10-01 10:00:00', 'first copy', None, 10),
+        ('b', 'yesterday', None, None, 10),
+        ('b', 'yesterday', None, None, 10),
+        ('seen', '2020-10-01 10:00:00', None, None, 10),
+    ], DDL)
+    quality = check()
+    annotated = quality.annotate(df, order_by=['event_timestamp'], seen_keys=spark.createDataFrame([('seen',)], 'event_id string'))
+
+    assert [(row.event_id, row.country) for row in quality.valid(annotated).collect()] == [('a', 'first copy')]
+    assert quality.valid(annotated).columns == ['event_id', 'event_timestamp', 'country', 'hour']
+    # A duplicate of an invalid record is counted as a duplicate and quarantined once.
+    quarantined = quality.quarantined(annotated).collect()
+    assert [(row.event_id, row[ERRORS]) for row in quarantined] == [('b', ['invalid_event_timestamp'])]
+    assert sum(row[DUPLICATE] for row in annotated.collect()) == 3
+
+
+def test_metrics_compare_each_partition_with_its_thresholds(spark):
+    df = spark.createDataFrame(
+        [(f'a{index}', '2020-10-01 10:00:00', 'BR' if index % 2 else None, None, 10) for index in range(10)] +
+        [(f'b{index}', '2020-10-01 11:00:00', 'BR', None, 11) for index in range(9)] +
+        [('b0', '2020-10-01 11:00:00', 'BR', None, 11), ('bad', 'never', 'BR', None, 11)],
+        DDL)
+    quality = check(max_null_rates={'country': 0.2}, max_quarantine_rate=0.05, max_duplicate_rate=0.1)
+    rows = quality.metrics(quality.annotate(df), '2020-10-01 12:00:00').collect()
+    metrics = {(row.hour, row.metric): row for row in rows}
+
+    assert metrics[10, 'records'].value == 10 and metrics[11, 'records'].value == 11
+    assert metrics[10, 'null_rate_country'].value == 0.5 and not metrics[10, 'null_rate_country'].passed
+    assert metrics[11, 'null_rate_country'].passed
+    assert metrics[11, 'invalid_event_timestamp'].value == 1
+    assert metrics[11, 'quarantine_rate'].threshold == 0.05 and not metrics[11, 'quarantine_rate'].passed
+    assert metrics[11, 'duplicate_records'].value == 1 and metrics[11, 'duplicate_rate'].passed
+    assert metrics[10, 'records'].threshold is None and metrics[10, 'records'].passed
+    assert {row.metric for row in rows if row.hour == 10} == set(quality.error_codes) | {
+        'records', 'quarantined_records', 'quarantine_rate', 'duplicate_records', 'duplicate_rate',
+        'null_rate_country'}
+    assert str(rows[0].checked_at) == '2020-10-01 12:00:00'
+
+
+def test_convert_quarantines_bad_records_and_fails_on_quality(spark, run_job, tmp_path, capsys):
+    root = str(tmp_path)
+    hour = hours_ago(6)
+    events = [atomic_event(f'a{index}', hour.replace(minute=index)) for index in range(20)]
+    events += [atomic_event('no-time', hour, event_timestamp='soon'), {'event_id': 'no-type', 'event_timestamp':
+                                                                       f'{hour:%Y-%m-%d %H:%M:%S}'}]
+    write_raw(root, hour, events)
+    with open(os.path.join(root, 'raw', 'atomic_events', f'year={hour:%Y}/month={hour:%m}/day={hour:%d}/'
+                                                         f'hour={hour:%H}', 'part-0001'), 'w') as file:
+        file.write('{"event_id": "truncated", "event_ti\n')
+
+    with pytest.raises(SystemExit, match='quality checks failed'):
+        run_job('convert_to_parquet.py', '--local-root', root, '--fail-on-quality')
+    assert 'quarantine_rate' in capsys.readouterr().out
+
+    assert spark.read.parquet(os.path.join(root, 'processed', 'atomic_events')).count() == 20
+    quarantined = spark.read.parquet(os.path.join(root, 'processed', '_quarantine', 'atomic_events')).collect()
+    assert sorted(sorted(row[ERRORS]) for row in quarantined) == [
+        ['invalid_event_timestamp'],
+        ['missing_event_id', 'missing_event_timestamp', 'missing_event_type', 'schema_violation'],
+        ['missing_event_type'],
+    ]
+    metrics = {row.metric: row for row in spark.read.parquet(
+        os.path.join(root, 'curated', 'atomic_events_quality')).collect()}
+    assert metrics['records'].value == 23 and metrics['quarantined_records'].value == 3
+    assert not metrics['quarantine_rate'].passed
+
+
+def test_reprocessing_an_hour_replaces_its_quarantined_records(spark, run_job, tmp_path):
+    root = str(tmp_path)
+    hour = hours_ago(6)
+    events = [atomic_event(f'a{index}', hour.replace(minute=index)) for index in range(5)]
+    write_raw(root, hour, events + [atomic_event('no-time', hour, event_timestamp='soon')])
+    run_job('convert_to_parquet.py', '--local-root', root)
+    partition = os.path.join(root, 'processed', '_quarantine', 'atomic_events', f'event_date={hour:%Y-%m-%d}',
+                             f'event_hour={hour.hour}')
+    assert os.path.exists(partition)
+
+    write_raw(root, hour, events + [atomic_event('no-time', hour)])
+    run_job('convert_to_parquet.py', '--local-root', root, '--full-refresh')
+    assert not os.path.exists(partition)
+    assert spark.read.parquet(os.path.join(root, 'processed', 'atomic_events')).count() == 6
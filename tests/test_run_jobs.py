@@ -0,0 +1,28 @@
+from datetime import datetime
+
+from run_jobs import backfill, pipeline
+
+
+def test_pipeline_registers_partitions_on_emr():
+    jobs = {job.name: job.args for job in pipeline(['--environment', 'dev'], catalog=('dev', 'eu-west-1'))}
+    assert jobs['convert_to_parquet'] == ['--environment', 'dev', '--glue-table',
+                                          'glue_belisco_dev_data_lake_processed.atomic_events',
+                                          '--glue-region', 'eu-west-1',
+                                          '--glue-curated-database', 'glue_belisco_dev_data_lake_curated']
+    assert jobs['merge_orders_cdc'][2:4] == ['--glue-table', 'glue_belisco_dev_data_lake_processed.orders']
+    for name in ('build_event_rollups', 'build_revenue_rollups'):
+        assert jobs[name][2:4] == ['--glue-database', 'glue_belisco_dev_data_lake_curated']
+
+
+def test_local_pipeline_has_no_catalog():
+    assert all(job.args == ['--local-root', '/tmp/lake'] for job in pipeline(['--local-root', '/tmp/lake']))
+
+
+def test_backfill_slices_run_side_by_side():
+    jobs = backfill(['--local-root', '/tmp/lake'], datetime(2020, 10, 1), datetime(2020, 10, 5), slice_days=2)
+    slices = [job for job in jobs if job.name.startswith('convert_to_parquet')]
+    assert [job.args[-3::2] for job in slices] == [['2020-10-01', '2020-10-02'], ['2020-10-03', '2020-10-04'],
+                                                   ['2020-10-05', '2020-10-05']]
+    assert all(job.depends_on == [] for job in slices)
+    rollups = {job.name: job.depends_on for job in jobs}
+    assert rollups['build_event_rollups'] == [job.name for job in slices]
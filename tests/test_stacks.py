@@ -0,0 +1,161 @@
+import os
+import subprocess
+import sys
+
+import pytest
+from aws_cdk import core
+from catalog import GlueCatalog
+from common import Environment
+from ingestion import RawIngestion
+from ingestion_settings import FIREHOSE_SETTINGS, FirehoseSettings
+from sizing import SizingProfile
+from stacks import STACKS, DataPlatform
+
+from tests.conftest import ROOT
+
+ENVIRONMENTS = [environment.value for environment in Environment]
+
+
+def synth(app):
+    return {stack.stack_name: stack.template for stack in app.synth().stacks}
+
+
+def properties(template, resource_type):
+    return [resource['Properties'] for resource in template['Resources'].values() if resource['Type'] == resource_type]
+
+
+@pytest.fixture(scope='module', params=ENVIRONMENTS)
+def environment(request):
+    return request.param
+
+
+@pytest.fixture(scope='module')
+def templates(environment, tmp_path_factory):
+    app = core.App(outdir=str(tmp_path_factory.mktemp('cdk.out')))
+    DataPlatform(app, environment).build(list(STACKS))
+    return {name[len(environment) + 1:]: template for name, template in synth(app).items()}
+
+
+def test_firehose_buffering_follows_the_environment(environment, templates):
+    settings = FIREHOSE_SETTINGS[Environment(environment)]
+    [stream] = properties(templates['data-lake-raw-ingestion'], 'AWS::KinesisFirehose::DeliveryStream')
+    destination = stream['ExtendedS3DestinationConfiguration']
+    assert destination['BufferingHints'] == {'IntervalInSeconds': settings.buffering_interval_seconds,
+                                             'SizeInMBs': settings.buffering_size_mb}
+    assert destination['CompressionFormat'] == 'GZIP'
+    assert 'DataFormatConversionConfiguration' not in destination
+    assert 'DynamicPartitioningConfiguration' not in destination
+
+
+def test_firehose_partitions_and_converts_to_parquet(tmp_path):
+    settings = FirehoseSettings(buffering_interval_seconds=300, buffering_size_mb=128, parquet_conversion=True,
+                                partition_keys={'type': '.event_type'})
+    app = core.App(outdir=str(tmp_path))
+    platform = DataPlatform(app, 'dev')
+    common, data_lake = platform.stack('common'), platform.stack('data-lake')
+    catalog = GlueCatalog(app, data_lake=data_lake, firehose_settings=settings)
+    RawIngestion(app, common=common, data_lake=data_lake, settings=settings).add_dependency(catalog)
+    templates = synth(app)
+
+    [stream] = properties(templates['dev-data-lake-raw-ingestion'], 'AWS::KinesisFirehose::DeliveryStream')
+    destination = stream['ExtendedS3DestinationConfiguration']
+    assert destination['CompressionFormat'] == 'UNCOMPRESSED'
+    assert destination['Prefix'].endswith('/type=!{partitionKeyFromQuery:type}/')
+    assert destination['DynamicPartitioningConfiguration']['Enabled'] is True
+    assert destination['DataFormatConversionConfiguration']['Enabled'] is True
+    [query] = [parameter['ParameterValue'] for processor in destination['ProcessingConfiguration']['Processors']
+               for parameter in processor['Parameters'] if parameter['ParameterName'] == 'MetadataExtractionQuery']
+    assert query == '{type:.event_type}'
+
+    # The raw table is the atomic_events table partitioned by hour, the processed one is partitioned by event_date.
+    [raw_events] = [table['TableInput'] for table in properties(templates['dev-glue-catalog'], 'AWS::Glue::Table')
+                    if table['TableInput']['Name'] == 'atomic_events' and
+                    table['TableInput']['PartitionKeys'][0]['Name'] == 'year']
+    assert [key['Name'] for key in raw_events['PartitionKeys']] == ['year', 'month', 'day', 'hour', 'type']
+    assert 'parquet' in raw_events['StorageDescriptor']['InputFormat'].lower()
+
+
+@pytest.mark.parametrize('settings, message', [
+    (FirehoseSettings(buffering_interval_seconds=30), 'buffering_interval_seconds'),
+    (FirehoseSettings(parquet_conversion=True), 'parquet conversion'),
+    (FirehoseSettings(buffering_size_mb=64, partition_keys={'event_type': '.event_type'}), 'clash'),
+])
+def test_invalid_firehose_settings_are_rejected(settings, message):
+    with pytest.raises(ValueError, match=message):
+        settings.validate()
+
+
+def test_firehose_settings_do_not_share_partition_keys():
+    assert FirehoseSettings().partition_keys is None
+    assert not FirehoseSettings().dynamic_partitioning
+
+
+def test_sizing_follows_the_environment(environment, templates):
+    sizing = SizingProfile.for_environment(Environment(environment))
+    [database] = properties(templates['common'], 'AWS::RDS::DBInstance')
+    assert database['DBInstanceClass'] == f'db.{sizing.rds.instance_type}'
+    assert database['AllocatedStorage'] == str(sizing.rds.allocated_storage_gb)
+    assert database['MultiAZ'] == sizing.rds.multi_az
+
+    [replication] = properties(templates['data-lake-raw-ingestion'], 'AWS::DMS::ReplicationInstance')
+    assert replication['ReplicationInstanceClass'] == sizing.dms.instance_class
+    assert replication['AllocatedStorage'] == sizing.dms.allocated_storage_gb
+    assert replication['MultiAZ'] == sizing.dms.multi_az
+
+    [warehouse] = properties(templates['data-warehouse'], 'AWS::Redshift::Cluster')
+    assert warehouse['NodeType'] == sizing.redshift.node_type.lower().replace('_', '.')
+    assert warehouse.get('NumberOfNodes') == (sizing.redshift.number_of_nodes
+                                              if sizing.redshift.number_of_nodes > 1 else None)
+
+
+def instance_types(fleet):
+    return {config['InstanceType']: config['WeightedCapacity'] for config in fleet['InstanceTypeConfigs']}
+
+
+def test_emr_runs_on_instance_fleets(environment, templates):
+    sizing = SizingProfile.for_environment(Environment(environment)).emr
+    [cluster] = properties(templates['emr-transform'], 'AWS::EMR::Cluster')
+    instances = cluster['Instances']
+    assert 'MasterInstanceGroup' not in instances and 'CoreInstanceGroup' not in instances
+    assert instance_types(instances['MasterInstanceFleet']) == sizing.master.instance_types
+    assert instance_types(instances['CoreInstanceFleet']) == sizing.core.instance_types
+    assert instances['CoreInstanceFleet']['TargetOnDemandCapacity'] == sizing.core.on_demand_capacity
+    assert cluster.get('StepConcurrencyLevel', 1) == sizing.step_concurrency_level
+
+    task_fleets = properties(templates['emr-transform'], 'AWS::EMR::InstanceFleetConfig')
+    if not sizing.task:
+        assert task_fleets == []
+        return
+    [task] = task_fleets
+    assert task['InstanceFleetType'] == 'TASK'
+    assert instance_types(task) == sizing.task.instance_types
+    assert (task['TargetOnDemandCapacity'], task['TargetSpotCapacity']) == \
+        (sizing.task.on_demand_capacity, sizing.task.spot_capacity)
+    spot = task['LaunchSpecifications']['SpotSpecification']
+    assert (spot['TimeoutAction'], spot['AllocationStrategy']) == ('SWITCH_TO_ON_DEMAND', 'capacity-optimized')
+
+
+def test_emr_managed_scaling_stays_within_the_profile(environment, templates):
+    scaling = SizingProfile.for_environment(Environment(environment)).emr.scaling
+    [cluster] = properties(templates['emr-transform'], 'AWS::EMR::Cluster')
+    if not scaling:
+        assert 'ManagedScalingPolicy' not in cluster
+        return
+    limits = cluster['ManagedScalingPolicy']['ComputeLimits']
+    assert limits == {
+        'UnitType': 'InstanceFleetUnits',
+        'MinimumCapacityUnits': scaling.minimum_capacity_units,
+        'MaximumCapacityUnits': scaling.maximum_capacity_units,
+        'MaximumOnDemandCapacityUnits': scaling.maximum_on_demand_capacity_units,
+        'MaximumCoreCapacityUnits': scaling.maximum_core_capacity_units,
+    }
+    assert limits['MaximumOnDemandCapacityUnits'] <= limits['MaximumCapacityUnits']
+
+
+def test_catalog_does_not_load_the_ingestion_constructs():
+    # The catalog reads the Firehose settings, a fresh interpreter shows which modules that pulls in.
+    modules = ['ingestion', 'aws_cdk.aws_kinesis', 'aws_cdk.aws_kinesisfirehose', 'aws_cdk.aws_dms']
+    code = f'import sys, catalog; print([name for name in {modules} if name in sys.modules])'
+    env = dict(os.environ, PYTHONPATH=os.path.join(ROOT, 'bootcamp_data_platform'))
+    result = subprocess.run([sys.executable, '-c', code], env=env, capture_output=True, text=True, check=True)
+    assert result.stdout == '[]\n'
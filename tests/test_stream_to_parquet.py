@@ -0,0 +1,94 @@
+import glob
+import json
+import os
+
+import pytest
+
+from tests.conftest import atomic_event, hours_ago, write_raw
+
+
+def stream(run_job, root, *args):
+    run_job('stream_to_parquet.py', '--local-root', root, '--once', '--compact-min-files', 3, *args)
+
+
+def processed_ids(spark, root):
+    return sorted(row.event_id for row in spark.read.parquet(os.path.join(root, 'processed', 'atomic_events')).collect())
+
+
+def batch_state(root):
+    with open(os.path.join(root, 'processed', '_checkpoints', 'stream_atomic_events', 'batches.json')) as file:
+        return json.load(file)
+
+
+def partition_files(root, hour):
+    return glob.glob(os.path.join(root, 'processed', 'atomic_events', f'event_date={hour:%Y-%m-%d}',
+                                  f'event_hour={hour.hour}', '*.parquet'))
+
+
+def test_appends_new_files_and_compacts_small_ones(spark, run_job, tmp_path, capsys):
+    root = str(tmp_path)
+    hour = hours_ago(3)
+    events = [atomic_event(f'a{index}', hour.replace(minute=index)) for index in range(30)]
+
+    write_raw(root, hour, events[:10], name='part-0000')
+    stream(run_job, root)
+    assert processed_ids(spark, root) == sorted(event['event_id'] for event in events[:10])
+
+    # Retries of events already written are dropped by id.
+    write_raw(root, hour, events[10:20] + events[:3], name='part-0001')
+    stream(run_job, root)
+    assert processed_ids(spark, root) == sorted(event['event_id'] for event in events[:20])
+    assert len(partition_files(root, hour)) == 2
+
+    write_raw(root, hour, events[20:], name='part-0002')
+    stream(run_job, root)
+    assert 'batch 2: 10 rows written to 1 partitions, 1 partitions compacted' in capsys.readouterr().out
+    assert processed_ids(spark, root) == sorted(event['event_id'] for event in events)
+    assert len(partition_files(root, hour)) == 1
+    assert batch_state(root) == {'committed': 2, 'publishing': None}
+    assert not os.listdir(os.path.join(root, 'processed', 'atomic_events', '_staging'))
+
+
+def test_a_replayed_batch_is_skipped(spark, run_job, tmp_path, capsys):
+    root = str(tmp_path)
+    hour = hours_ago(3)
+    write_raw(root, hour, [atomic_event(f'a{index}', hour.replace(minute=index)) for index in range(10)] +
+              [atomic_event('bad', hour, event_timestamp='never')])
+    stream(run_job, root)
+
+    # Without its commit log entry, Spark runs the last batch again over the same files.
+    commits = os.path.join(root, 'processed', '_checkpoints', 'stream_atomic_events', 'commits')
+    for name in ('0', '.0.crc'):
+        os.remove(os.path.join(commits, name))
+    stream(run_job, root)
+    assert 'batch 0: already committed, skipped' in capsys.readouterr().out
+    assert len(processed_ids(spark, root)) == 10
+    assert spark.read.parquet(os.path.join(root, 'processed', '_quarantine', 'atomic_events')).count() == 1
+    assert spark.read.parquet(os.path.join(root, 'curated', 'atomic_events_quality'))\
+        .where("metric = 'records'").count() == 1
+
+
+def test_a_batch_failing_while_publishing_is_finished_on_replay(spark, run_job, tmp_path, monkeypatch):
+    from partitions import HadoopFileSystem
+    root = str(tmp_path)
+    hour = hours_ago(3)
+    write_raw(root, hour, [atomic_event(f'a{index}', hour.replace(minute=index)) for index in range(10)])
+
+    rename = HadoopFileSystem.rename
+    renamed = []
+
+    def fail_after_the_first(self, source, destination):
+        if renamed:
+            raise IOError('storage unavailable')
+        renamed.append(source)
+        rename(self, source, destination)
+
+    monkeypatch.setattr(HadoopFileSystem, 'rename', fail_after_the_first)
+    with pytest.raises(Exception, match='storage unavailable'):
+        stream(run_job, root)
+    assert batch_state(root)['publishing']
+
+    monkeypatch.setattr(HadoopFileSystem, 'rename', rename)
+    stream(run_job, root)
+    assert processed_ids(spark, root) == sorted(f'a{index}' for index in range(10))
+    assert batch_state(root) == {'committed': 0, 'publishing': None}
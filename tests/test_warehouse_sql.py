@@ -0,0 +1,67 @@
+import re
+
+from warehouse_sql import MATERIALIZED_VIEWS, OBJECTS_TABLE, WAREHOUSE_TABLES, MaterializedView, literal, sync_sql
+
+TABLES = {table.name: table for table in WAREHOUSE_TABLES}
+FROM = re.compile(r'\bFROM\s+([\w.]+)', re.IGNORECASE)
+
+
+def test_views_read_the_loaded_tables():
+    for view in MATERIALIZED_VIEWS:
+        sources = FROM.findall(view.query)
+        assert sources and all(source in TABLES for source in sources), view.name
+        assert view.auto_refresh, view.name
+
+
+def test_view_columns_exist_in_their_tables():
+    for view in MATERIALIZED_VIEWS:
+        columns = {field.name for field in TABLES[FROM.findall(view.query)[0]].columns}
+        grouped = view.query.split('GROUP BY', 1)[1]
+        assert all(column.strip().split('(')[-1].rstrip(')') in columns for column in grouped.split(',')), view.name
+
+
+def test_sync_recreates_only_changed_views():
+    view = MaterializedView('analytics.mv_test', 'SELECT 1 AS one FROM processed.orders', auto_refresh=False)
+    changed = MaterializedView('analytics.mv_changed', 'SELECT 2 AS two FROM processed.orders')
+    existing = {view.name: view.definition_hash, changed.name: 'stale', 'analytics.mv_gone': 'hash'}
+
+    statements = sync_sql('dev', 'arn:aws:iam::1:role/spectrum', existing, views=[view, changed])
+    assert view.create_sql() not in statements
+    assert view.refresh_sql() in statements
+    assert statements.index(changed.drop_sql()) < statements.index(changed.create_sql())
+    assert f"INSERT INTO {OBJECTS_TABLE} VALUES ('analytics.mv_changed', '{changed.definition_hash}')" in statements
+    assert 'DROP MATERIALIZED VIEW IF EXISTS analytics.mv_gone' in statements
+    assert "DATABASE 'glue_belisco_dev_data_lake_processed'" in '\n'.join(statements)
+
+    assert view.refresh_sql() not in sync_sql('dev', 'role', existing, views=[view], refresh=False)
+
+
+def test_sync_creates_schemas_before_their_objects():
+    statements = sync_sql('production', 'role', existing={})
+    for view in MATERIALIZED_VIEWS:
+        schema = view.name.split('.')[0]
+        assert statements.index(f'CREATE SCHEMA IF NOT EXISTS {schema}') < statements.index(view.create_sql())
+    for table in WAREHOUSE_TABLES:
+        assert statements.index(f'CREATE SCHEMA IF NOT EXISTS {table.layer}') < statements.index(table.create_sql())
+
+
+def test_replace_partition_quotes_values():
+    orders = TABLES['processed.orders']
+    delete, insert, clear = orders.replace_partition_sql(('12',))
+    assert delete == 'DELETE FROM processed.orders WHERE order_range = 12'
+    assert insert.endswith('FROM stage_processed_orders')
+    assert clear == 'DELETE FROM stage_processed_orders'
+
+    events = TABLES['processed.atomic_events']
+    assert events.partition_condition(('2020-10-01', '7')) == "event_date = '2020-10-01' AND event_hour = 7"
+    assert literal("o'neil", 'string') == "'o''neil'"
+
+
+def test_create_sql_follows_the_dialect():
+    events = TABLES['processed.atomic_events']
+    redshift = events.create_sql()
+    assert 'DISTKEY (user_domain_id)' in redshift
+    assert 'COMPOUND SORTKEY (event_date, event_hour, event_type)' in redshift
+    assert 'page_url VARCHAR(2048)' in redshift
+    postgres = events.create_sql('postgres')
+    assert 'DISTKEY' not in postgres and 'SORTKEY' not in postgres